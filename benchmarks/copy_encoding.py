@@ -0,0 +1,75 @@
+"""
+Measures how quickly `PostgresTarget` encodes serialized rows into the CSV consumed by `COPY`, compared with encoding
+each row with its own `csv.DictWriter`, one row per read, as was done before `CSVStream`.
+
+Usage: python benchmarks/copy_encoding.py [ROWS]
+"""
+import csv
+import io
+import random
+import string
+import sys
+import time
+
+from target_postgres.postgres import COPY_BUFFER_SIZE, CSVStream, RESERVED_NULL_DEFAULT
+
+HEADERS = ['column_{}'.format(i) for i in range(20)]
+
+
+def make_rows(n):
+    rand = random.Random(0)
+    rows = []
+    for i in range(n):
+        row = {}
+        for j, header in enumerate(HEADERS):
+            if j % 4 == 0:
+                row[header] = i
+            elif j % 4 == 1:
+                row[header] = rand.random()
+            elif j % 4 == 2:
+                row[header] = RESERVED_NULL_DEFAULT
+            else:
+                row[header] = ''.join(rand.choice(string.ascii_letters + ' ,"') for _ in range(20))
+        rows.append(row)
+    return rows
+
+
+class PerRowStream:
+    """
+    The encoder `CSVStream` replaced: a new `csv.DictWriter` for every row, and a single row per read.
+    """
+
+    def __init__(self, rows, headers):
+        self.rows = iter(rows)
+        self.headers = headers
+
+    def read(self, *args, **kwargs):
+        try:
+            row = next(self.rows)
+        except StopIteration:
+            return ''
+
+        with io.StringIO() as out:
+            writer = csv.DictWriter(out, self.headers)
+            writer.writerow(row)
+            return out.getvalue()
+
+
+def time_encoding(stream, read_size):
+    start = time.monotonic()
+    while stream.read(read_size):
+        pass
+    return time.monotonic() - start
+
+
+def main(n):
+    rows = make_rows(n)
+
+    for name, stream, read_size in [('per-row DictWriter, 8KB reads', PerRowStream(rows, HEADERS), 8192),
+                                    ('CSVStream, 64KB reads', CSVStream(rows, HEADERS), COPY_BUFFER_SIZE)]:
+        duration = time_encoding(stream, read_size)
+        print('{}: encoded {} rows in {:.3f}s: {:.0f} rows/second'.format(name, n, duration, n / duration))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
@@ -0,0 +1,64 @@
+"""
+Measures how quickly `PostgresTarget` serializes date-time values for `COPY`, for each `copy_format`, against
+serializing every value with `arrow`, as was done before plain ISO 8601 values were parsed without it.
+
+Values are either all distinct, or drawn from a small set as with timestamps truncated to the second, which are
+served from the cache of recently serialized values.
+
+Usage: python benchmarks/datetime_serialization.py [VALUES]
+"""
+from datetime import datetime, timedelta, timezone
+import random
+import sys
+import time
+
+import arrow
+
+from target_postgres import postgres
+
+
+def make_values(n, distinct):
+    rand = random.Random(0)
+    start = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    values = []
+    for i in range(n):
+        offset = timedelta(microseconds=rand.randrange(10 ** 13)) if distinct else timedelta(seconds=i % 100)
+        values.append((start + offset).strftime('%Y-%m-%dT%H:%M:%S.%fZ'))
+    return values
+
+
+def arrow_text(value):
+    return arrow.get(value).format('YYYY-MM-DD HH:mm:ss.SSSSZZ')
+
+
+def arrow_binary(value):
+    value = arrow.get(value).datetime
+    return value - timedelta(microseconds=value.microsecond % 100)
+
+
+def measure(name, serialize, values):
+    ## Each measurement starts from an empty cache
+    postgres._serialize_datetime_text.cache_clear()
+    postgres._serialize_datetime_binary.cache_clear()
+
+    start = time.monotonic()
+    for value in values:
+        serialize(value)
+    duration = time.monotonic() - start
+
+    print('  {:<24} {:.3f}s: {:.0f} values/second'.format(name, duration, len(values) / duration))
+
+
+def main(n):
+    for distinct in [True, False]:
+        values = make_values(n, distinct)
+        print('{} {} values:'.format(n, 'distinct' if distinct else 'repeated'))
+
+        measure('arrow, csv', arrow_text, values)
+        measure('arrow, binary', arrow_binary, values)
+        measure('csv', postgres._serialize_datetime_text, values)
+        measure('binary', postgres._serialize_datetime_binary, values)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,58 @@
+"""
+Measures how quickly Singer lines are decoded, for each available JSON backend, against the previous
+`json.loads(line, parse_float=decimal.Decimal)`.
+
+Usage: python benchmarks/json_decoding.py [LINES]
+"""
+import decimal
+import json
+import random
+import string
+import sys
+import time
+
+from target_postgres.json_decoder import JSON_BACKEND_ORJSON, JSON_BACKENDS, LineDecoder, orjson
+
+
+def make_lines(n, floats):
+    rand = random.Random(0)
+    lines = []
+    for i in range(n):
+        record = {'id': i,
+                  'name': ''.join(rand.choice(string.ascii_letters) for _ in range(12)),
+                  'bio': ' '.join(''.join(rand.choice(string.ascii_lowercase) for _ in range(6)) for _ in range(20)),
+                  'active': rand.random() > 0.5,
+                  'created_at': '2020-01-01T00:00:{:02d}.000000Z'.format(i % 60),
+                  'tags': [{'id': j, 'value': 'tag-{}'.format(j)} for j in range(3)]}
+        if floats:
+            record['price'] = i + (i % 100) / 100
+        lines.append(json.dumps({'type': 'RECORD',
+                                 'stream': 'widgets',
+                                 'record': record,
+                                 'sequence': 1577836800000 + i}))
+    return lines
+
+
+def measure(name, decode, lines):
+    start = time.monotonic()
+    for line in lines:
+        decode(line)
+    duration = time.monotonic() - start
+
+    print('  {:<24} {:.0f} lines/second'.format(name, len(lines) / duration))
+
+
+def main(n):
+    for floats in [False, True]:
+        lines = make_lines(n, floats)
+        print('{} lines {} floats:'.format(n, 'with' if floats else 'without'))
+
+        measure('json.loads', lambda line: json.loads(line, parse_float=decimal.Decimal), lines)
+        for backend in JSON_BACKENDS:
+            if backend == JSON_BACKEND_ORJSON and orjson is None:
+                continue
+            measure('LineDecoder({})'.format(backend), LineDecoder(backend).decode, lines)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
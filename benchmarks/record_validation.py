@@ -0,0 +1,52 @@
+"""
+Measures how quickly records from the `CatStream` and `NestedStream` test fixtures are validated, by `Draft4Validator`
+and by the compiled `RecordValidator`.
+
+The fixtures live with the tests, so this needs the `tests` extra installed.
+
+Usage: python benchmarks/record_validation.py [RECORDS]
+"""
+import decimal
+import json
+import os
+import sys
+import time
+
+from jsonschema import Draft4Validator, FormatChecker
+
+from target_postgres.record_validator import RecordValidator
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tests'))
+## The fixtures read connection details on import, but no connection is made
+for variable in ['POSTGRES_HOST', 'POSTGRES_DATABASE', 'POSTGRES_USERNAME']:
+    os.environ.setdefault(variable, '')
+
+from utils.fixtures import CatStream, NestedStream
+
+
+def make_records(stream):
+    schema = json.loads(next(stream))['schema']
+    records = [json.loads(line, parse_float=decimal.Decimal)['record'] for line in stream]
+    return schema, records
+
+
+def measure(name, validate, records):
+    start = time.monotonic()
+    for record in records:
+        validate(record)
+    duration = time.monotonic() - start
+
+    print('  {:<18} {:.0f} records/second'.format(name, len(records) / duration))
+
+
+def main(n):
+    for stream in [CatStream(n, nested_count=2), NestedStream(n)]:
+        schema, records = make_records(stream)
+        print('{} {} records:'.format(n, stream.stream))
+
+        measure('Draft4Validator', Draft4Validator(schema, format_checker=FormatChecker()).validate, records)
+        measure('RecordValidator', RecordValidator(schema).validate, records)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
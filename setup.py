@@ -28,6 +28,9 @@ setup(
         "pytest-runner"
     ],
     extras_require={
+        'orjson': [
+            'orjson==3.8.3'
+        ],
         'tests': [
             "chance==0.110",
             "Faker==4.0.0",
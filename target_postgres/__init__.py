@@ -1,3 +1,5 @@
+from contextlib import ExitStack
+
 from singer import utils
 import psycopg2
 
@@ -9,34 +11,68 @@ REQUIRED_CONFIG_KEYS = [
 ]
 
 
+def _connect(config):
+    return psycopg2.connect(
+        connection_factory=MillisLoggingConnection,
+        host=config.get('postgres_host', 'localhost'),
+        port=config.get('postgres_port', 5432),
+        dbname=config.get('postgres_database'),
+        user=config.get('postgres_username'),
+        password=config.get('postgres_password'),
+        sslmode=config.get('postgres_sslmode'),
+        sslcert=config.get('postgres_sslcert'),
+        sslkey=config.get('postgres_sslkey'),
+        sslrootcert=config.get('postgres_sslrootcert'),
+        sslcrl=config.get('postgres_sslcrl')
+    )
+
+
+def _postgres_target(connection, config):
+    postgres_target = PostgresTarget(
+        connection,
+        postgres_schema=config.get('postgres_schema', 'public'),
+        logging_level=config.get('logging_level'),
+        persist_empty_tables=config.get('persist_empty_tables'),
+        add_upsert_indexes=config.get('add_upsert_indexes', True),
+        add_unique_key_indexes=config.get('add_unique_key_indexes', False),
+        copy_format=config.get('copy_format', 'csv'),
+        columnar_batches=config.get('columnar_batches', False),
+        staging_table_mode=config.get('staging_table_mode', 'table'),
+        dedupe_batches=config.get('dedupe_batches', False),
+        streaming_batches=config.get('streaming_batches', False),
+        before_run_sql=config.get('before_run_sql'),
+        after_run_sql=config.get('after_run_sql'),
+    )
+
+    ## Schema migrations run on construction. Commit them so that other connections don't block on them.
+    connection.commit()
+
+    return postgres_target
+
+
 def main(config, input_stream=None):
-    with psycopg2.connect(
-            connection_factory=MillisLoggingConnection,
-            host=config.get('postgres_host', 'localhost'),
-            port=config.get('postgres_port', 5432),
-            dbname=config.get('postgres_database'),
-            user=config.get('postgres_username'),
-            password=config.get('postgres_password'),
-            sslmode=config.get('postgres_sslmode'),
-            sslcert=config.get('postgres_sslcert'),
-            sslkey=config.get('postgres_sslkey'),
-            sslrootcert=config.get('postgres_sslrootcert'),
-            sslcrl=config.get('postgres_sslcrl')
-    ) as connection:
-        postgres_target = PostgresTarget(
-            connection,
-            postgres_schema=config.get('postgres_schema', 'public'),
-            logging_level=config.get('logging_level'),
-            persist_empty_tables=config.get('persist_empty_tables'),
-            add_upsert_indexes=config.get('add_upsert_indexes', True),
-            before_run_sql=config.get('before_run_sql'),
-            after_run_sql=config.get('after_run_sql'),
-        )
-
-        if input_stream:
-            target_tools.stream_to_target(input_stream, postgres_target, config=config)
-        else:
-            target_tools.main(postgres_target)
+    with _connect(config) as connection:
+        postgres_target = _postgres_target(connection, config)
+
+        with ExitStack() as writer_connections:
+            writer_targets = [postgres_target]
+            for _ in range(1, config.get('parallel_writers') or 1):
+                writer_connection = _connect(config)
+                writer_connections.callback(writer_connection.close)
+                writer_target = _postgres_target(writer_connections.enter_context(writer_connection), config)
+
+                ## `stream_to_target` only runs `before_run_sql` on the main connection. Committed straight away so
+                ##  that the main connection's own `before_run_sql` does not wait on it.
+                target_tools._run_sql_hook('before_run_sql', config, writer_target)
+                writer_connection.commit()
+
+                writer_targets.append(writer_target)
+
+            if input_stream:
+                target_tools.stream_to_target(input_stream, postgres_target, config=config,
+                                              writer_targets=writer_targets)
+            else:
+                target_tools.main(postgres_target, writer_targets=writer_targets)
 
 
 def cli():
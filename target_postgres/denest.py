@@ -3,7 +3,67 @@ from copy import deepcopy
 from target_postgres import json_schema, singer
 
 
-def to_table_batches(schema, key_properties, records):
+class ColumnarRecords:
+    """
+    The denested records of a single table, stored column by column rather than as a dict per row.
+
+    Each column is a pair of parallel lists, `(types, values)`, indexed by row. A `None` type marks a
+    row without a value for the column. Columns may be shorter than the table, in which case the
+    missing trailing rows have no value either.
+
+    Rows are filled in order: `new_row` starts a row, and values set on the `ColumnarRecords` are
+    stored in that row.
+    """
+
+    def __init__(self):
+        self.row_count = 0
+        self.columns = {}
+
+    def __len__(self):
+        return self.row_count
+
+    def new_row(self):
+        self.row_count += 1
+        return self
+
+    def __setitem__(self, path, type_and_value):
+        column = self.columns.get(path)
+        if column is None:
+            column = self.columns[path] = ([], [])
+
+        types, values = column
+        missing = self.row_count - 1 - len(values)
+        if missing:
+            types.extend([None] * missing)
+            values.extend([None] * missing)
+
+        types.append(type_and_value[0])
+        values.append(type_and_value[1])
+
+    def column(self, path):
+        """
+        :param path: (path_0, path_1, ...)
+        :return: ([_json_schema_string_type | None, ...], [value, ...])
+        """
+        return self.columns.get(path, ([], []))
+
+
+class _RecordsMap(dict):
+    def new_row(self, table_path):
+        row = {}
+        self.setdefault(table_path, []).append(row)
+        return row
+
+
+class _ColumnarRecordsMap(dict):
+    def new_row(self, table_path):
+        records = self.get(table_path)
+        if records is None:
+            records = self[table_path] = ColumnarRecords()
+        return records.new_row()
+
+
+def to_table_batches(schema, key_properties, records, columnar=False, plan=None, table_schemas=None):
     """
     Given a schema, and records, get all table schemas and records and prep them
     in a `table_batch`.
@@ -11,25 +71,88 @@ def to_table_batches(schema, key_properties, records):
     :param schema: SingerStreamSchema
     :param key_properties: [string, ...]
     :param records: [{...}, ...]
+    :param columnar: boolean, when `True` each table's records are a `ColumnarRecords`
+    :param plan: see `compile_plan`, compiled from `schema` when not provided
+    :param table_schemas: see `to_table_schemas`, denested from `schema` when not provided
     :return: [{'streamed_schema': TABLE_SCHEMA(local),
                'records': [{(path_0, path_1, ...):
                             (_json_schema_string_type, value), ...},
-                            ...]},
+                            ...] | ColumnarRecords},
               ...]
     """
-    table_schemas = _get_streamed_table_schemas(schema,
-                                                key_properties)
+    if table_schemas is None:
+        table_schemas = to_table_schemas(schema, key_properties)
+
+    if plan is None:
+        plan = compile_plan(schema)
 
     table_records = _get_streamed_table_records(key_properties,
-                                                records)
+                                                records,
+                                                columnar=columnar,
+                                                plan=plan)
     writeable_batches = []
     for table_json_schema in table_schemas:
+        empty_records = ColumnarRecords() if columnar else []
         writeable_batches.append({'streamed_schema': table_json_schema,
-                                  'records': table_records.get(table_json_schema['path'], [])})
+                                  'records': table_records.get(table_json_schema['path'], empty_records)})
 
     return writeable_batches
 
 
+def iter_table_batches(schema, key_properties, records, columnar=False, plan=None, table_schemas=None):
+    """
+    Lazy equivalent of `to_table_batches`. Each `table_batch`'s records are only denested from `records` once the
+    batch is reached, and then only by walking the parts of each record which lead to that table.
+
+    Without `columnar`, a table's records are an iterator which denests each row as it is consumed, so that no more
+    than one table's rows, and only as many as its consumer holds at once, are in memory.
+
+    :param schema: SingerStreamSchema
+    :param key_properties: [string, ...]
+    :param records: [{...}, ...]
+    :param columnar: boolean, when `True` each table's records are a `ColumnarRecords`
+    :param plan: see `compile_plan`, compiled from `schema` when not provided
+    :param table_schemas: see `to_table_schemas`, denested from `schema` when not provided
+    :return: generator of {'streamed_schema': TABLE_SCHEMA(local),
+                           'records': iterator of {(path_0, path_1, ...):
+                                                   (_json_schema_string_type, value), ...}
+                                      | ColumnarRecords}
+    """
+    if plan is None:
+        plan = compile_plan(schema)
+
+    if table_schemas is None:
+        table_schemas = to_table_schemas(schema, key_properties)
+
+    for table_json_schema in table_schemas:
+        table_records = _iter_streamed_table_records(table_json_schema['path'], key_properties, records, plan=plan)
+
+        if columnar:
+            columnar_records = ColumnarRecords()
+            for record in table_records:
+                row = columnar_records.new_row()
+                for path, type_and_value in record.items():
+                    row[path] = type_and_value
+            table_records = columnar_records
+
+        yield {'streamed_schema': table_json_schema,
+               'records': table_records}
+
+
+def to_table_schemas(schema, key_properties):
+    """
+    Given a `schema` and `key_properties` get the TABLE_SCHEMA of every table its records denest to.
+
+    The result depends only on its arguments, and is not changed by `to_table_batches` or `iter_table_batches`, so it
+    may be computed once and passed to them for every batch of a stream.
+
+    :param schema: SingerStreamSchema
+    :param key_properties: [string, ...]
+    :return: [TABLE_SCHEMA(denested_streamed_schema_0), ...]
+    """
+    return _get_streamed_table_schemas(schema, key_properties)
+
+
 def _get_streamed_table_schemas(schema, key_properties):
     """
     Given a `schema` and `key_properties` return the denested/flattened TABLE_SCHEMA of
@@ -224,7 +347,101 @@ def _denest_schema(
     table_json_schema['properties'] = new_properties
 
 
-def _get_streamed_table_records(key_properties, records):
+def compile_plan(schema):
+    """
+    Compile a denest plan for the records of a stream with the given `schema`.
+
+    The plan holds the table and column paths which every property of the stream's records denests to, so that they
+    are worked out once per schema rather than once per value. Properties the schema does not know of are added to the
+    plan as they are first seen.
+
+    :param schema: SingerStreamSchema, simplified
+    :return: _PlanNode
+    """
+    plan = _PlanNode(tuple(), tuple())
+    _compile_plan_node(plan, schema)
+    return plan
+
+
+class _PlanNode(dict):
+    """
+    The properties of the objects found at one place within a stream's records, by name.
+
+    `column_paths` maps each property straight to the column path of its literals, which is all that most values need.
+    """
+    __slots__ = ('table_path', 'prop_path', 'column_paths')
+
+    def __init__(self, table_path, prop_path):
+        super(_PlanNode, self).__init__()
+        self.table_path = table_path
+        self.prop_path = prop_path
+        self.column_paths = _ColumnPaths(self)
+
+    def __missing__(self, prop):
+        plan_property = self[prop] = _PlanProperty(self, prop)
+        return plan_property
+
+
+class _ColumnPaths(dict):
+    __slots__ = ('node',)
+
+    def __init__(self, node):
+        super(_ColumnPaths, self).__init__()
+        self.node = node
+
+    def __missing__(self, prop):
+        column_path = self[prop] = self.node[prop].column_path
+        return column_path
+
+
+class _PlanProperty:
+    """
+    Where a single property denests to: the column of its literals, the node for its object values, and the node
+    for the table of its array values.
+    """
+    __slots__ = ('column_path', 'table_path', '_object_node', '_table_node')
+
+    def __init__(self, node, prop):
+        self.column_path = node.prop_path + (prop,)
+        self.table_path = node.table_path + (prop,)
+        self._object_node = None
+        self._table_node = None
+
+    @property
+    def object_node(self):
+        if self._object_node is None:
+            self._object_node = _PlanNode(self.table_path, self.column_path)
+        return self._object_node
+
+    @property
+    def table_node(self):
+        if self._table_node is None:
+            self._table_node = _PlanNode(self.table_path, tuple())
+        return self._table_node
+
+
+def _compile_plan_node(node, schema):
+    for prop, prop_schema in schema.get('properties', {}).items():
+        plan_property = node[prop]
+
+        for sub_schema in prop_schema.get('anyOf', [prop_schema]):
+            if json_schema.is_iterable(sub_schema):
+                items = sub_schema.get('items', {})
+                if json_schema.is_object(items):
+                    _compile_plan_node(plan_property.table_node, items)
+                else:
+                    plan_property.table_node[singer.VALUE]
+            elif json_schema.is_object(sub_schema):
+                _compile_plan_node(plan_property.object_node, sub_schema)
+
+
+## `json_schema.python_type` for the values which denest to a column
+_LITERAL_TYPES = dict((python_type, json_schema_type)
+                      for python_type, json_schema_type in json_schema._PYTHON_TYPE_TO_JSON_SCHEMA.items()
+                      if json_schema_type != json_schema.NULL)
+
+
+def _get_streamed_table_records(key_properties, records, columnar=False, plan=None):
     """
     Flatten the given `records` into `table_records`.
     Maintains `key_properties`.
@@ -232,12 +449,15 @@ def _get_streamed_table_records(key_properties, records):
 
     :param key_properties: [string, ...]
     :param records: [{...}, ...]
-    :return: {TableName string: [{(path_0, path_1, ...): (_json_schema_string_type, value), ...}, ...],
+    :param columnar: boolean
+    :param plan: see `compile_plan`, compiled from `records` as they are denested when not provided
+    :return: {TableName string: [{(path_0, path_1, ...): (_json_schema_string_type, value), ...}, ...]
+                                | ColumnarRecords,
               ...}
     """
 
-    records_map = {}
-    _denest_records(tuple(),
+    records_map = _ColumnarRecordsMap() if columnar else _RecordsMap()
+    _denest_records(plan if plan is not None else _PlanNode(tuple(), tuple()),
                     records,
                     records_map,
                     key_properties)
@@ -245,8 +465,119 @@ def _get_streamed_table_records(key_properties, records):
     return records_map
 
 
-def _denest_subrecord(table_path,
-                      prop_path,
+def _iter_streamed_table_records(target_path, key_properties, records, plan=None):
+    """
+    Flatten the given `records` into the rows of the single table at `target_path`, one row at a time.
+
+    :param target_path: (path_0, path_1, ...)
+    :param key_properties: [string, ...]
+    :param records: [{...}, ...]
+    :param plan: see `compile_plan`
+    :return: iterator of {(path_0, path_1, ...): (_json_schema_string_type, value), ...}
+    """
+    return _iter_denested_records(target_path,
+                                  plan if plan is not None else _PlanNode(tuple(), tuple()),
+                                  records,
+                                  key_properties)
+
+
+def _record_pk_fks(record, key_properties, pk_fks, level, row_index):
+    """
+    Get the keys linking `record` to its root record, setting them on `record` when it is nested.
+    """
+    if pk_fks:
+        record_pk_fks = pk_fks.copy()
+        record_pk_fks[singer.LEVEL_FMT.format(level)] = row_index
+
+        if not isinstance(record, dict):
+            """
+            [...] | literal
+            """
+            record = {singer.VALUE: record}
+
+        for key, value in record_pk_fks.items():
+            record[key] = value
+    else:  ## top level
+        record_pk_fks = {}
+        for key in key_properties:
+            record_pk_fks[singer.SOURCE_PK_PREFIX + key] = record[key]
+        if singer.SEQUENCE in record:
+            record_pk_fks[singer.SEQUENCE] = record[singer.SEQUENCE]
+
+    return record, record_pk_fks
+
+
+def _iter_denested_records(target_path, node, records, key_properties, pk_fks=None, level=-1):
+    """
+    Streaming counterpart to `_denest_records`, yielding only the rows of the table at `target_path`.
+    """
+    for row_index, record in enumerate(records):
+        record, record_pk_fks = _record_pk_fks(record, key_properties, pk_fks, level, row_index)
+
+        if node.table_path == target_path:
+            denested_record = {}
+            _denest_literals(node, record, denested_record)
+            yield denested_record
+        else:
+            yield from _iter_denested_subrecords(target_path,
+                                                 node,
+                                                 record,
+                                                 key_properties,
+                                                 record_pk_fks,
+                                                 level)
+
+
+def _iter_denested_subrecords(target_path, node, record, key_properties, pk_fks, level):
+    """
+    Descend into only those values of `record` which lead to the table at `target_path`.
+    """
+    for prop, value in record.items():
+        if not isinstance(value, (dict, list)):
+            continue
+
+        plan_property = node[prop]
+        path = plan_property.table_path
+        if path != target_path[:len(path)]:
+            continue
+
+        if isinstance(value, dict):
+            yield from _iter_denested_subrecords(target_path,
+                                                 plan_property.object_node,
+                                                 value,
+                                                 key_properties,
+                                                 pk_fks,
+                                                 level)
+
+        else:
+            yield from _iter_denested_records(target_path,
+                                              plan_property.table_node,
+                                              value,
+                                              key_properties,
+                                              pk_fks=pk_fks,
+                                              level=level + 1)
+
+
+def _denest_literals(node, record, denested_record):
+    """
+    Set every literal of `record`, and of the objects nested within it, on `denested_record`.
+    """
+    column_paths = node.column_paths
+    for prop, value in record.items():
+        value_type = _LITERAL_TYPES.get(type(value))
+        if value_type is not None:
+            denested_record[column_paths[prop]] = (value_type, value)
+
+        elif isinstance(value, dict):
+            _denest_literals(node[prop].object_node, value, denested_record)
+
+        elif isinstance(value, list) or value is None:
+            continue
+
+        else:
+            denested_record[node[prop].column_path] = (json_schema.python_type(value), value)
+
+
+def _denest_subrecord(node,
                       parent_record,
                       record,
                       records_map,
@@ -257,17 +588,24 @@ def _denest_subrecord(table_path,
     """
     {...}
     """
+    column_paths = node.column_paths
     for prop, value in record.items():
         """
         str : {...} | [...] | ???None??? | <literal>
         """
 
-        if isinstance(value, dict):
+        value_type = _LITERAL_TYPES.get(type(value))
+        if value_type is not None:
+            """
+            <literal>
+            """
+            parent_record[column_paths[prop]] = (value_type, value)
+
+        elif isinstance(value, dict):
             """
             {...}
             """
-            _denest_subrecord(table_path + (prop,),
-                              prop_path + (prop,),
+            _denest_subrecord(node[prop].object_node,
                               parent_record,
                               value,
                               records_map,
@@ -279,7 +617,7 @@ def _denest_subrecord(table_path,
             """
             [...]
             """
-            _denest_records(table_path + (prop,),
+            _denest_records(node[prop].table_node,
                             value,
                             records_map,
                             key_properties,
@@ -296,88 +634,32 @@ def _denest_subrecord(table_path,
             """
             <literal>
             """
-            parent_record[prop_path + (prop,)] = (json_schema.python_type(value), value)
+            parent_record[node[prop].column_path] = (json_schema.python_type(value), value)
 
 
-def _denest_record(table_path, record, records_map, key_properties, pk_fks, level):
+def _denest_record(node, record, records_map, key_properties, pk_fks, level):
     """"""
     """
     {...}
     """
-    denested_record = {}
-    for prop, value in record.items():
-        """
-        str : {...} | [...] | None | <literal>
-        """
-
-        if isinstance(value, dict):
-            """
-            {...}
-            """
-            _denest_subrecord(table_path + (prop,),
-                              (prop,),
-                              denested_record,
-                              value,
-                              records_map,
-                              key_properties,
-                              pk_fks,
-                              level)
-
-        elif isinstance(value, list):
-            """
-            [...]
-            """
-            _denest_records(table_path + (prop,),
-                            value,
-                            records_map,
-                            key_properties,
-                            pk_fks=pk_fks,
-                            level=level + 1)
-
-        elif value is None:
-            """
-            None
-            """
-            continue
-
-        else:
-            """
-            <literal>
-            """
-            denested_record[(prop,)] = (json_schema.python_type(value), value)
-
-    if table_path not in records_map:
-        records_map[table_path] = []
-    records_map[table_path].append(denested_record)
+    denested_record = records_map.new_row(node.table_path)
+    _denest_subrecord(node,
+                      denested_record,
+                      record,
+                      records_map,
+                      key_properties,
+                      pk_fks,
+                      level)
 
 
-def _denest_records(table_path, records, records_map, key_properties, pk_fks=None, level=-1):
-    row_index = 0
+def _denest_records(node, records, records_map, key_properties, pk_fks=None, level=-1):
     """
     [{...} ...] | [[...] ...] | [literal ...]
     """
-    for record in records:
-        if pk_fks:
-            record_pk_fks = pk_fks.copy()
-            record_pk_fks[singer.LEVEL_FMT.format(level)] = row_index
-
-            if not isinstance(record, dict):
-                """
-                [...] | literal
-                """
-                record = {singer.VALUE: record}
-
-            for key, value in record_pk_fks.items():
-                record[key] = value
-            row_index += 1
-        else:  ## top level
-            record_pk_fks = {}
-            for key in key_properties:
-                record_pk_fks[singer.SOURCE_PK_PREFIX + key] = record[key]
-            if singer.SEQUENCE in record:
-                record_pk_fks[singer.SEQUENCE] = record[singer.SEQUENCE]
+    for row_index, record in enumerate(records):
+        record, record_pk_fks = _record_pk_fks(record, key_properties, pk_fks, level, row_index)
 
         """
         {...}
         """
-        _denest_record(table_path, record, records_map, key_properties, record_pk_fks, level)
+        _denest_record(node, record, records_map, key_properties, record_pk_fks, level)
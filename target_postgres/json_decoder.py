@@ -0,0 +1,97 @@
+import decimal
+import json
+
+from target_postgres.exceptions import TargetError
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+JSON_BACKEND_JSON = 'json'
+JSON_BACKEND_ORJSON = 'orjson'
+JSON_BACKENDS = [JSON_BACKEND_JSON, JSON_BACKEND_ORJSON]
+
+
+def _contains_float(value):
+    value_type = type(value)
+
+    if value_type is float:
+        return True
+
+    if value_type is dict:
+        value = value.values()
+    elif value_type is not list:
+        return False
+
+    for item in value:
+        item_type = type(item)
+        if item_type is float \
+                or ((item_type is dict or item_type is list) and _contains_float(item)):
+            return True
+
+    return False
+
+
+class LineDecoder:
+    """
+    Decodes lines of a Singer data stream. Numbers with a fraction or exponent are always decoded as `decimal.Decimal`s,
+    exactly as written.
+
+    The stdlib `json` module is always available. When `orjson` is installed, lines are decoded with it, and only
+    lines which turn out to contain floats (which `orjson` cannot decode as `Decimal`s) are decoded again with the
+    stdlib. Streams made up mostly of such lines would pay for decoding twice, so if more than half of the last
+    `SAMPLE_LINES` lines needed decoding again, the stdlib is used on its own for the next `STDLIB_LINES` lines.
+    """
+
+    SAMPLE_LINES = 1000
+    STDLIB_LINES = 100000
+
+    def __init__(self, backend=None):
+        if backend is None:
+            backend = JSON_BACKEND_ORJSON if orjson else JSON_BACKEND_JSON
+
+        if not backend in JSON_BACKENDS:
+            raise TargetError('Unknown `json_backend` `{}`. Expected one of {}'.format(backend, JSON_BACKENDS))
+
+        if backend == JSON_BACKEND_ORJSON and orjson is None:
+            raise TargetError('`json_backend` `{}` is not installed'.format(backend))
+
+        self.backend = backend
+        self._decoder = json.JSONDecoder(parse_float=decimal.Decimal)
+
+        self._lines = 0
+        self._lines_decoded_again = 0
+        self._stdlib_lines_remaining = 0
+
+    def decode(self, line):
+        """
+        :param line: string
+        :return: decoded JSON value
+        :raises json.decoder.JSONDecodeError: when `line` is not valid JSON
+        """
+        if self.backend == JSON_BACKEND_JSON:
+            return self._decoder.decode(line)
+
+        if self._stdlib_lines_remaining:
+            self._stdlib_lines_remaining -= 1
+            return self._decoder.decode(line)
+
+        self._lines += 1
+        if self._lines == self.SAMPLE_LINES:
+            if self._lines_decoded_again * 2 > self.SAMPLE_LINES:
+                self._stdlib_lines_remaining = self.STDLIB_LINES
+            self._lines = 0
+            self._lines_decoded_again = 0
+
+        try:
+            value = orjson.loads(line)
+        except orjson.JSONDecodeError:
+            ## Let the stdlib decide what is valid, and raise its errors
+            return self._decoder.decode(line)
+
+        if _contains_float(value):
+            self._lines_decoded_again += 1
+            return self._decoder.decode(line)
+
+        return value
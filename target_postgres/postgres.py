@@ -1,9 +1,15 @@
+from contextlib import contextmanager
 from copy import deepcopy
 import csv
+from datetime import datetime, timedelta, timezone
+import functools
 import io
+import itertools
 import json
 import logging
+import operator
 import re
+import struct
 import time
 import uuid
 import hashlib
@@ -19,6 +25,111 @@ from target_postgres.sql_base import SEPARATOR, SQLInterface
 
 RESERVED_NULL_DEFAULT = 'NULL'
 
+## Number of characters `copy_expert` requests from the encoded rows per read
+COPY_BUFFER_SIZE = 65536
+
+COPY_FORMAT_CSV = 'csv'
+COPY_FORMAT_BINARY = 'binary'
+COPY_FORMATS = [COPY_FORMAT_CSV, COPY_FORMAT_BINARY]
+
+## How batches are staged before being merged into their table:
+##  - `table`: a regular table in `postgres_schema`, created and dropped for each batch
+##  - `unlogged`: an `UNLOGGED` table in `postgres_schema`, created and dropped for each batch, so that staged rows
+##    are not written to the WAL
+##  - `temporary`: one session `TEMPORARY` table per table, reused across batches, and emptied on each commit
+STAGING_TABLE_MODE_TABLE = 'table'
+STAGING_TABLE_MODE_UNLOGGED = 'unlogged'
+STAGING_TABLE_MODE_TEMPORARY = 'temporary'
+STAGING_TABLE_MODES = [STAGING_TABLE_MODE_TABLE, STAGING_TABLE_MODE_UNLOGGED, STAGING_TABLE_MODE_TEMPORARY]
+
+## https://www.postgresql.org/docs/current/sql-copy.html#id-1.9.3.55.9.4
+_BINARY_COPY_HEADER = b'PGCOPY\n\xff\r\n\x00' + struct.pack('!ii', 0, 0)
+_BINARY_COPY_TRAILER = struct.pack('!h', -1)
+_BINARY_NULL = struct.pack('!i', -1)
+_BINARY_FIELD_COUNT = struct.Struct('!h')
+_BINARY_LENGTH = struct.Struct('!i')
+_BINARY_BIGINT = struct.Struct('!iq')
+_BINARY_DOUBLE = struct.Struct('!id')
+_BINARY_BOOLEAN = struct.Struct('!i?')
+
+_POSTGRES_EPOCH = datetime(2000, 1, 1, tzinfo=timezone.utc)
+_ONE_MICROSECOND = timedelta(microseconds=1)
+
+## ISO 8601 date-times, with up to microsecond precision, which are normalized without `arrow`. Values without an
+##  offset are UTC.
+_ISO_8601_DATETIME = re.compile(r'(\d{4})-(\d{2})-(\d{2})[T ](\d{2}):(\d{2}):(\d{2})(?:\.(\d{1,6}))?'
+                                r'(?:Z|([+-])(\d{2}):?(\d{2}))?$')
+
+## Number of distinct date-time values whose serialization is remembered
+_DATETIME_CACHE_SIZE = 4096
+
+
+def _parse_iso_8601(value):
+    """
+    Parse `value` as the `datetime` which `arrow.get` would, when it is a plain ISO 8601 date-time.
+    :param value: string
+    :return: (datetime, (date, time, fraction, offset)) | None, where the strings are ready to be formatted
+    """
+    match = _ISO_8601_DATETIME.match(value)
+    if match is None:
+        return None
+
+    year, month, day, hour, minute, second, fraction, sign, offset_hours, offset_minutes = match.groups()
+    fraction = fraction or ''
+
+    tz = timezone.utc
+    offset = '+00:00'
+    try:
+        if sign:
+            offset_delta = timedelta(hours=int(offset_hours), minutes=int(offset_minutes))
+            tz = timezone(-offset_delta if sign == '-' else offset_delta)
+            ## `arrow` formats a zero offset as `+00:00`, whichever sign it was given with
+            if offset_delta:
+                offset = '{}{}:{}'.format(sign, offset_hours, offset_minutes)
+
+        parsed = datetime(int(year), int(month), int(day), int(hour), int(minute), int(second),
+                          int(fraction.ljust(6, '0')) if fraction else 0, tzinfo=tz)
+    except ValueError:
+        ## Out of range, ie, a 25th hour or a whole day's offset, which is left for `arrow` to report
+        return None
+
+    return parsed, ('{}-{}-{}'.format(year, month, day),
+                    '{}:{}:{}'.format(hour, minute, second),
+                    fraction.ljust(4, '0')[:4],
+                    offset)
+
+
+@functools.lru_cache(maxsize=_DATETIME_CACHE_SIZE)
+def _serialize_datetime_text(value):
+    """
+    `value` formatted as `YYYY-MM-DD HH:mm:ss.SSSSZZ`, which PostgreSQL accepts as a `timestamp with time zone`.
+    """
+    parsed = _parse_iso_8601(value)
+    if parsed is None:
+        return arrow.get(value).format('YYYY-MM-DD HH:mm:ss.SSSSZZ')
+
+    return '{} {}.{}{}'.format(*parsed[1])
+
+
+@functools.lru_cache(maxsize=_DATETIME_CACHE_SIZE)
+def _serialize_datetime_binary(value):
+    """
+    `value` as a `datetime`, truncated to the precision of `_serialize_datetime_text`.
+    """
+    parsed = _parse_iso_8601(value)
+    if parsed is None:
+        parsed = arrow.get(value).datetime
+
+        ## `arrow` accepts offsets of a whole day or more, which `datetime` refuses to compute with, so such values
+        ##  are normalized to UTC
+        offset = parsed.tzinfo.utcoffset(parsed)
+        if abs(offset) >= timedelta(days=1):
+            parsed = (parsed.replace(tzinfo=None) - offset).replace(tzinfo=timezone.utc)
+    else:
+        parsed = parsed[0]
+
+    return parsed - timedelta(microseconds=parsed.microsecond % 100)
+
 
 def _update_schema_0_to_1(table_metadata, table_schema):
     """
@@ -86,12 +197,227 @@ class MillisLoggingConnection(LoggingConnection):
 
 
 
-class TransformStream:
-    def __init__(self, fun):
-        self.fun = fun
+def _row_values(headers):
+    if len(headers) == 1:
+        header = headers[0]
+        return lambda row: (row[header],)
+
+    return operator.itemgetter(*headers)
+
+
+def _column_rows(columns, headers):
+    """
+    Reads the rows of `columns`, as made by `SQLInterface._serialize_table_columns`, as tuples of
+    values ordered by `headers`.
+    """
+    return zip(*[columns[header] for header in headers])
+
+
+class CSVStream:
+    """
+    File-like object which lazily encodes `rows` as CSV for `cursor.copy_expert`.
+
+    A single buffer and `csv.writer` are used for the whole batch. Each call to `read`
+    encodes as many rows as are needed to fill the requested `size`, keeping any overflow
+    for the next call.
+    """
+
+    def __init__(self, rows, headers):
+        self.rows = iter(rows)
+        self.count = 0
+        self._row_values = _row_values(headers)
+
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer)
+        self._pending = ''
+        self._row_size = 0
+
+    @classmethod
+    def from_columns(cls, columns, headers):
+        """
+        Stream `columns`, as made by `SQLInterface._serialize_table_columns`, without making a row dict per row.
+        """
+        stream = cls(_column_rows(columns, headers), headers)
+        stream._row_values = None
+        return stream
+
+    def _encode(self, needed):
+        buffer = self._buffer
+
+        while buffer.tell() < needed:
+            ## Estimate how many rows fill the remainder of the chunk from the rows encoded so far
+            rows_needed = 1
+            if needed == float('inf'):
+                rows_needed = None
+            elif self._row_size:
+                rows_needed = int((needed - buffer.tell()) / self._row_size) + 1
+
+            rows = list(itertools.islice(self.rows, rows_needed))
+            if not rows:
+                break
+
+            start = buffer.tell()
+            self._writer.writerows(rows if self._row_values is None else map(self._row_values, rows))
+            self._row_size = max(1, (buffer.tell() - start) / len(rows))
+            self.count += len(rows)
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = float('inf')
+
+        self._encode(size - len(self._pending))
+
+        chunk = self._pending + self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+
+        if len(chunk) <= size:
+            self._pending = ''
+            return chunk
+
+        self._pending = chunk[size:]
+        return chunk[:size]
+
+
+def _binary_text(value):
+    data = str(value).encode('utf-8')
+    return _BINARY_LENGTH.pack(len(data)) + data
+
+
+def _binary_bigint(value):
+    return _BINARY_BIGINT.pack(8, value)
+
+
+def _binary_double(value):
+    return _BINARY_DOUBLE.pack(8, float(value))
+
+
+def _binary_boolean(value):
+    return _BINARY_BOOLEAN.pack(1, value)
+
+
+def _binary_timestamptz(value):
+    return _BINARY_BIGINT.pack(8, (value - _POSTGRES_EPOCH) // _ONE_MICROSECOND)
 
-    def read(self, *args, **kwargs):
-        return self.fun()
+
+_BINARY_ENCODERS = {
+    'text': _binary_text,
+    'bigint': _binary_bigint,
+    'double precision': _binary_double,
+    'boolean': _binary_boolean,
+    'timestamp with time zone': _binary_timestamptz
+}
+
+
+class BinaryStream:
+    """
+    File-like object which lazily encodes `rows` in PostgreSQL's binary `COPY` format for
+    `cursor.copy_expert`.
+
+    `sql_types` are the column types for `headers`, as returned by
+    `PostgresTarget.json_schema_to_sql_type`. Values are expected to be `None` for NULL, and
+    timezone aware `datetime`s for timestamps.
+    """
+
+    def __init__(self, rows, headers, sql_types):
+        self.rows = iter(rows)
+        self.count = 0
+        self._row_values = _row_values(headers)
+
+        self._encoders = []
+        for header, sql_type in zip(headers, sql_types):
+            sql_type = sql_type.replace(' NOT NULL', '')
+            if not sql_type in _BINARY_ENCODERS:
+                raise PostgresError('Binary COPY does not support column `{}` of type `{}`'.format(header, sql_type))
+            self._encoders.append(_BINARY_ENCODERS[sql_type])
+
+        self._field_count = _BINARY_FIELD_COUNT.pack(len(self._encoders))
+        self._buffer = bytearray(_BINARY_COPY_HEADER)
+        self._finished = False
+
+    @classmethod
+    def from_columns(cls, columns, headers, sql_types):
+        """
+        Stream `columns`, as made by `SQLInterface._serialize_table_columns`, without making a row dict per row.
+        """
+        stream = cls(_column_rows(columns, headers), headers, sql_types)
+        stream._row_values = None
+        return stream
+
+    def _encode(self, needed):
+        buffer = self._buffer
+        encoders = self._encoders
+        row_values = self._row_values
+        field_count = self._field_count
+
+        while len(buffer) < needed and not self._finished:
+            row = next(self.rows, None)
+            if row is None:
+                buffer += _BINARY_COPY_TRAILER
+                self._finished = True
+                break
+
+            buffer += field_count
+            for value, encoder in zip(row if row_values is None else row_values(row), encoders):
+                if value is None:
+                    buffer += _BINARY_NULL
+                else:
+                    buffer += encoder(value)
+            self.count += 1
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = float('inf')
+
+        self._encode(size)
+
+        if len(self._buffer) <= size:
+            chunk = bytes(self._buffer)
+            self._buffer.clear()
+            return chunk
+
+        chunk = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return chunk
+
+
+class _TableChanges:
+    """
+    Changes to a single table, collected so that they can be sent to PostgreSQL in one round trip.
+
+    Consecutive `ALTER TABLE` actions are combined into a single statement. Other statements, ie, migrating data
+    between columns, are kept in order between them. Only the last metadata set is kept, as each one replaces the
+    table's whole `COMMENT`.
+    """
+
+    def __init__(self, full_table_name):
+        self.full_table_name = full_table_name
+        self.statements = []
+        self.alter_actions = []
+        self.metadata = None
+
+    def alter(self, action):
+        self.alter_actions.append(action)
+
+    def execute(self, statement):
+        self._end_alter()
+        self.statements.append(statement)
+
+    def _end_alter(self):
+        if self.alter_actions:
+            self.statements.append(sql.SQL('ALTER TABLE {} {};').format(self.full_table_name,
+                                                                        sql.SQL(', ').join(self.alter_actions)))
+            self.alter_actions = []
+
+    def to_sql(self):
+        self._end_alter()
+
+        statements = list(self.statements)
+        if self.metadata is not None:
+            statements.append(sql.SQL('COMMENT ON TABLE {} IS {};').format(self.full_table_name,
+                                                                         sql.Literal(json.dumps(self.metadata))))
+
+        return sql.SQL('\n').join(statements)
 
 
 class PostgresTarget(SQLInterface):
@@ -105,6 +431,12 @@ class PostgresTarget(SQLInterface):
         logging_level=None,
         persist_empty_tables=False,
         add_upsert_indexes=True,
+        add_unique_key_indexes=False,
+        copy_format=COPY_FORMAT_CSV,
+        columnar_batches=False,
+        staging_table_mode=STAGING_TABLE_MODE_TABLE,
+        dedupe_batches=False,
+        streaming_batches=False,
         **kwargs):
 
         self.LOGGER.info(
@@ -125,10 +457,49 @@ class PostgresTarget(SQLInterface):
         self.postgres_schema = postgres_schema
         self.persist_empty_tables = persist_empty_tables
         self.add_upsert_indexes = add_upsert_indexes
+        self.add_unique_key_indexes = add_unique_key_indexes
+        self.copy_format = copy_format or COPY_FORMAT_CSV
+        self.columnar_batches = bool(columnar_batches)
+        self.staging_table_mode = staging_table_mode or STAGING_TABLE_MODE_TABLE
+        self.dedupe_batches = bool(dedupe_batches)
+        self.streaming_batches = bool(streaming_batches)
+
+        ## Catalog information is cached for the life of the target, and invalidated by the target
+        ##  itself whenever it changes the catalog, or a transaction is rolled back.
+        self.table_mapping_cache = None
+        self._table_metadata_cache = {}
+        self._table_columns_cache = {}
+        self._table_unique_key_cache = {}
+
+        ## Changes being collected by `batch_table_changes`, by table name
+        self._table_changes = {}
+
+        ## `temporary` staging tables, by table name, and the columns they were created with. The columns are
+        ##  forgotten along with the rest of the catalog cache, so that a staging table is recreated after a rollback.
+        self._staging_table_names = {}
+        self._staging_table_columns = {}
 
         if self.persist_empty_tables:
             self.LOGGER.debug('PostgresTarget is persisting empty tables')
 
+        if not self.copy_format in COPY_FORMATS:
+            raise PostgresError('Unknown `copy_format` `{}`. Expected one of {}'.format(self.copy_format,
+                                                                                       COPY_FORMATS))
+
+        if not self.staging_table_mode in STAGING_TABLE_MODES:
+            raise PostgresError('Unknown `staging_table_mode` `{}`. Expected one of {}'.format(self.staging_table_mode,
+                                                                                              STAGING_TABLE_MODES))
+
+        ## `UNLOGGED` tables and `CREATE TABLE IF NOT EXISTS` are only available from PostgreSQL 9.1
+        if self.staging_table_mode != STAGING_TABLE_MODE_TABLE and connection.server_version < 90100:
+            raise PostgresError('`staging_table_mode` `{}` requires PostgreSQL 9.1 or later, found server version {}'
+                                .format(self.staging_table_mode, connection.server_version))
+
+        ## `ON CONFLICT` is only available from PostgreSQL 9.5
+        if self.add_unique_key_indexes and connection.server_version < 90500:
+            raise PostgresError('`add_unique_key_indexes` requires PostgreSQL 9.5 or later, found server version {}'
+                                .format(connection.server_version))
+
         with self.conn.cursor() as cur:
             self._update_schemas_0_to_1(cur)
             self._update_schemas_1_to_2(cur)
@@ -207,7 +578,34 @@ class PostgresTarget(SQLInterface):
         return {'database': self.conn.get_dsn_parameters().get('dbname', None),
                 'schema': self.postgres_schema}
 
-    def setup_table_mapping_cache(self, cur):
+    def _invalidate_catalog_cache(self, table_names=None):
+        """
+        Forget cached catalog information for `table_names`, or for all tables when `None`.
+        :param table_names: [string, ...]
+        :return: None
+        """
+        if table_names is None:
+            self.table_mapping_cache = None
+            self._table_metadata_cache = {}
+            self._table_columns_cache = {}
+            self._table_unique_key_cache = {}
+            self._staging_table_columns = {}
+            return None
+
+        for table_name in table_names:
+            self._table_metadata_cache.pop(table_name, None)
+            self._table_columns_cache.pop(table_name, None)
+            self._table_unique_key_cache.pop(table_name, None)
+            self._staging_table_columns.pop(table_name, None)
+
+    def _rollback(self, cur):
+        cur.execute('ROLLBACK;')
+        self._invalidate_catalog_cache()
+
+    def setup_table_mapping_cache(self, cur, force=False):
+        if self.table_mapping_cache is not None and not force:
+            return None
+
         self.table_mapping_cache = {}
 
         cur.execute(sql.SQL('''
@@ -283,7 +681,7 @@ class PostgresTarget(SQLInterface):
                     if stream_buffer.max_version < current_table_version:
                         self.LOGGER.warning('{} - Records from an earlier table version detected.'
                                             .format(stream_buffer.stream))
-                        cur.execute('ROLLBACK;')
+                        self._rollback(cur)
                         return None
 
                     elif stream_buffer.max_version > current_table_version:
@@ -292,18 +690,27 @@ class PostgresTarget(SQLInterface):
 
                 self.LOGGER.info('Root table name {}'.format(root_table_name))
 
+                ## Records whose primary keys are all generated for this batch cannot match any existing rows,
+                ##  so there is nothing to merge
+                append_only = stream_buffer.use_uuid_pk \
+                              and all(record_message['record'].get(singer.PK) is None
+                                      for record_message in stream_buffer.peek_buffer())
+
                 written_batches_details = self.write_batch_helper(cur,
                                                                   root_table_name,
                                                                   stream_buffer.schema,
                                                                   stream_buffer.key_properties,
                                                                   stream_buffer.get_batch(),
-                                                                  {'version': target_table_version})
+                                                                  {'version': target_table_version,
+                                                                   'append_only': append_only},
+                                                                  denest_plan=stream_buffer.denest_plan,
+                                                                  table_schemas=stream_buffer.table_schemas)
 
                 cur.execute('COMMIT;')
 
                 return written_batches_details
             except Exception as ex:
-                cur.execute('ROLLBACK;')
+                self._rollback(cur)
                 message = 'Exception writing records'
                 self.LOGGER.exception(message)
                 raise PostgresError(message, ex)
@@ -313,7 +720,7 @@ class PostgresTarget(SQLInterface):
             try:
                 cur.execute('BEGIN;')
 
-                self.setup_table_mapping_cache(cur)
+                self.setup_table_mapping_cache(cur, force=True)
                 root_table_name = self.add_table_mapping(cur, (stream_buffer.stream,), {})
                 current_table_schema = self.get_table_schema(cur, root_table_name)
 
@@ -351,6 +758,7 @@ class PostgresTarget(SQLInterface):
                                                             'old'),
                             stream_table=sql.Identifier(table_name),
                             version_table=sql.Identifier(versioned_table_name)))
+                        self._invalidate_catalog_cache([table_name, versioned_table_name])
                         metadata = self._get_table_metadata(cur, table_name)
 
                         self.LOGGER.info('Activated {}, setting path to {}'.format(
@@ -360,8 +768,11 @@ class PostgresTarget(SQLInterface):
 
                         metadata['path'] = table_path
                         self._set_table_metadata(cur, table_name, metadata)
+
+                    ## Versioned tables have been renamed, so cached mappings no longer hold
+                    self._invalidate_catalog_cache()
             except Exception as ex:
-                cur.execute('ROLLBACK;')
+                self._rollback(cur)
                 message = '{} - Exception activating table version {}'.format(
                     stream_buffer.stream,
                     version)
@@ -419,6 +830,7 @@ class PostgresTarget(SQLInterface):
             sql.Identifier(name))
 
         cur.execute(sql.SQL('{} ();').format(create_table_sql))
+        self._invalidate_catalog_cache([name])
 
         self._set_table_metadata(cur, name, {'path': path,
                                              'version': metadata.get('version', None),
@@ -427,6 +839,11 @@ class PostgresTarget(SQLInterface):
     def add_table_mapping(self, cur, from_path, metadata):
         mapping = self.add_table_mapping_helper(from_path, self.table_mapping_cache)
 
+        if not mapping['exists']:
+            ## The table may have been created since the cache was set up, ie, by another connection
+            self.setup_table_mapping_cache(cur, force=True)
+            mapping = self.add_table_mapping_helper(from_path, self.table_mapping_cache)
+
         if not mapping['exists']:
             self.table_mapping_cache[from_path] = mapping['to']
 
@@ -436,9 +853,12 @@ class PostgresTarget(SQLInterface):
         full_table_name = sql.SQL('{}.{}').format(
             sql.Identifier(self.postgres_schema),
             sql.Identifier(target_table_name))
-        full_temp_table_name = sql.SQL('{}.{}').format(
-            sql.Identifier(self.postgres_schema),
-            sql.Identifier(temp_table_name))
+        full_temp_table_name = self._full_staging_table_name(temp_table_name)
+
+        ## Reused staging tables are emptied on commit rather than dropped
+        drop_temp_table = sql.SQL('')
+        if self.staging_table_mode != STAGING_TABLE_MODE_TEMPORARY:
+            drop_temp_table = sql.SQL('DROP TABLE {};').format(full_temp_table_name)
 
         pk_temp_select_list = []
         pk_where_list = []
@@ -526,7 +946,7 @@ class PostgresTarget(SQLInterface):
                 LEFT JOIN {table} ON {pk_where}
                 WHERE pk_ranked = 1 AND {pk_null}
             );
-            DROP TABLE {temp_table};
+            {drop_temp_table}
             ''').format(table=full_table_name,
                         temp_table=full_temp_table_name,
                         pk_temp_select=pk_temp_select,
@@ -538,15 +958,55 @@ class PostgresTarget(SQLInterface):
                         insert_distinct_on=insert_distinct_on,
                         insert_distinct_order_by=insert_distinct_order_by,
                         insert_columns=insert_columns,
-                        dedupped_columns=dedupped_columns)
+                        dedupped_columns=dedupped_columns,
+                        drop_temp_table=drop_temp_table)
+
+    def _get_upsert_sql(self, target_table_name, temp_table_name, key_properties, columns):
+        full_table_name = sql.SQL('{}.{}').format(
+            sql.Identifier(self.postgres_schema),
+            sql.Identifier(target_table_name))
+        full_temp_table_name = self._full_staging_table_name(temp_table_name)
+
+        drop_temp_table = sql.SQL('')
+        if self.staging_table_mode != STAGING_TABLE_MODE_TEMPORARY:
+            drop_temp_table = sql.SQL('DROP TABLE {};').format(full_temp_table_name)
+
+        pks = sql.SQL(', ').join(map(sql.Identifier, key_properties))
+
+        ## Every column but the keys is updated. `_sdc_sequence` is never a key, so there is always one to update.
+        update_columns = sql.SQL(', ').join(
+            sql.SQL('{column} = EXCLUDED.{column}').format(column=sql.Identifier(column))
+            for column in columns
+            if column not in key_properties)
+
+        ## `ON CONFLICT` cannot update a row twice in one statement, so only the latest row per key is inserted
+        return sql.SQL('''
+            INSERT INTO {table} ({insert_columns}) (
+                SELECT DISTINCT ON ({pks}) {insert_columns}
+                FROM {temp_table}
+                ORDER BY {pks}, {sequence} DESC
+            )
+            ON CONFLICT ({pks}) DO UPDATE SET {update_columns}
+            WHERE EXCLUDED.{sequence} >= {table}.{sequence};
+            {drop_temp_table}
+            ''').format(table=full_table_name,
+                        temp_table=full_temp_table_name,
+                        insert_columns=sql.SQL(', ').join(map(sql.Identifier, columns)),
+                        pks=pks,
+                        sequence=sql.Identifier(singer.SEQUENCE),
+                        update_columns=update_columns,
+                        drop_temp_table=drop_temp_table)
 
     def serialize_table_record_null_value(self, remote_schema, streamed_schema, field, value):
-        if value is None:
+        if value is None and self.copy_format == COPY_FORMAT_CSV:
             return RESERVED_NULL_DEFAULT
         return value
 
     def serialize_table_record_datetime_value(self, remote_schema, streamed_schema, field, value):
-        return arrow.get(value).format('YYYY-MM-DD HH:mm:ss.SSSSZZ')
+        if self.copy_format == COPY_FORMAT_BINARY:
+            return _serialize_datetime_binary(value)
+
+        return _serialize_datetime_text(value)
 
     def persist_csv_rows(self,
                          cur,
@@ -555,116 +1015,280 @@ class PostgresTarget(SQLInterface):
                          columns,
                          csv_rows):
 
-        copy = sql.SQL('COPY {}.{} ({}) FROM STDIN WITH CSV NULL AS {}').format(
-            sql.Identifier(self.postgres_schema),
-            sql.Identifier(temp_table_name),
+        copy = sql.SQL('COPY {} ({}) FROM STDIN WITH CSV NULL AS {}').format(
+            self._full_copy_table_name(remote_schema, temp_table_name),
             sql.SQL(', ').join(map(sql.Identifier, columns)),
             sql.Literal(RESERVED_NULL_DEFAULT))
-        cur.copy_expert(copy, csv_rows)
+        cur.copy_expert(copy, csv_rows, size=COPY_BUFFER_SIZE)
+
+        if temp_table_name is not None:
+            self._merge_temp_table(cur, remote_schema, temp_table_name, columns)
 
+    def persist_binary_rows(self,
+                            cur,
+                            remote_schema,
+                            temp_table_name,
+                            columns,
+                            binary_rows):
+
+        copy = sql.SQL('COPY {} ({}) FROM STDIN WITH BINARY').format(
+            self._full_copy_table_name(remote_schema, temp_table_name),
+            sql.SQL(', ').join(map(sql.Identifier, columns)))
+        cur.copy_expert(copy, binary_rows, size=COPY_BUFFER_SIZE)
+
+        if temp_table_name is not None:
+            self._merge_temp_table(cur, remote_schema, temp_table_name, columns)
+
+    def _full_copy_table_name(self, remote_schema, temp_table_name):
+        ## Without a staging table, rows are appended straight to the table
+        if temp_table_name is None:
+            return sql.SQL('{}.{}').format(sql.Identifier(self.postgres_schema),
+                                           sql.Identifier(remote_schema['name']))
+
+        return self._full_staging_table_name(temp_table_name)
+
+    def _merge_temp_table(self, cur, remote_schema, temp_table_name, columns):
         pattern = re.compile(singer.LEVEL_FMT.format('[0-9]+'))
         subkeys = list(filter(lambda header: re.match(pattern, header) is not None, columns))
 
         canonicalized_key_properties = [self.fetch_column_from_path((key_property,), remote_schema)[0]
                                         for key_property in remote_schema['key_properties']]
 
-        update_sql = self._get_update_sql(remote_schema['name'],
-                                          temp_table_name,
-                                          canonicalized_key_properties,
-                                          columns,
-                                          subkeys)
+        ## With `add_unique_key_indexes`, root tables with a unique index over their key properties are merged in a
+        ##  single `INSERT ... ON CONFLICT`. Subtables are not, as their rows for an updated record are replaced,
+        ##  rather than updated.
+        if not subkeys \
+                and self.add_unique_key_indexes \
+                and self._has_unique_key_index(cur, remote_schema['name'], canonicalized_key_properties):
+            update_sql = self._get_upsert_sql(remote_schema['name'],
+                                              temp_table_name,
+                                              canonicalized_key_properties,
+                                              columns)
+        else:
+            update_sql = self._get_update_sql(remote_schema['name'],
+                                              temp_table_name,
+                                              canonicalized_key_properties,
+                                              columns,
+                                              subkeys)
         cur.execute(update_sql)
 
-    def write_table_batch(self, cur, table_batch, metadata):
-        remote_schema = table_batch['remote_schema']
+    def _has_unique_key_index(self, cur, table_name, key_properties):
+        """
+        Whether `table_name` has a unique index over exactly `key_properties`, which `ON CONFLICT` can use.
+        :param cur: Cursor
+        :param table_name: string
+        :param key_properties: [string, ...]
+        :return: boolean
+        """
+        if not key_properties:
+            return False
+
+        cache_key = tuple(sorted(key_properties))
+        cached = self._table_unique_key_cache.get(table_name)
+        if cached is not None and cached[0] == cache_key:
+            return cached[1]
 
-        ## Create temp table to upload new data to
-        target_table_name = self.canonicalize_identifier('tmp_' + str(uuid.uuid4()))
         cur.execute(sql.SQL('''
-            CREATE TABLE {schema}.{temp_table} (LIKE {schema}.{table})
+            SELECT EXISTS (
+                SELECT 1
+                FROM pg_index AS i
+                    INNER JOIN pg_class AS c ON c.oid = i.indrelid
+                    INNER JOIN pg_namespace AS n ON n.oid = c.relnamespace
+                WHERE n.nspname = {schema} AND
+                      c.relname = {table} AND
+                      i.indisunique AND
+                      i.indpred IS NULL AND
+                      i.indexprs IS NULL AND
+                      (SELECT array_agg(a.attname::text ORDER BY a.attname::text)
+                       FROM pg_attribute AS a
+                       WHERE a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)) = {columns}::text[]);
         ''').format(
+            schema=sql.Literal(self.postgres_schema),
+            table=sql.Literal(table_name),
+            columns=sql.Literal(sorted(key_properties))))
+        has_unique_key_index = cur.fetchone()[0]
+
+        self._table_unique_key_cache[table_name] = (cache_key, has_unique_key_index)
+        return has_unique_key_index
+
+    def _full_staging_table_name(self, temp_table_name):
+        if self.staging_table_mode == STAGING_TABLE_MODE_TEMPORARY:
+            schema = 'pg_temp'
+        else:
+            schema = self.postgres_schema
+
+        return sql.SQL('{}.{}').format(sql.Identifier(schema), sql.Identifier(temp_table_name))
+
+    def _create_staging_table(self, cur, remote_schema):
+        """
+        Create, or reuse, a table to `COPY` a batch for `remote_schema` into, ahead of merging it.
+
+        :param cur: Cursor
+        :param remote_schema: TABLE_SCHEMA(remote)
+        :return: string, name of the staging table
+        """
+        table_name = remote_schema['name']
+
+        if self.staging_table_mode != STAGING_TABLE_MODE_TEMPORARY:
+            temp_table_name = self.canonicalize_identifier('tmp_' + str(uuid.uuid4()))
+            cur.execute(sql.SQL('''
+                CREATE {unlogged}TABLE {temp_table} (LIKE {schema}.{table})
+            ''').format(
+                unlogged=sql.SQL('UNLOGGED ' if self.staging_table_mode == STAGING_TABLE_MODE_UNLOGGED else ''),
+                temp_table=self._full_staging_table_name(temp_table_name),
+                schema=sql.Identifier(self.postgres_schema),
+                table=sql.Identifier(table_name)
+            ))
+            return temp_table_name
+
+        temp_table_name = self._staging_table_names.get(table_name)
+        if temp_table_name is None:
+            temp_table_name = self.canonicalize_identifier('tmp_' + str(uuid.uuid4()))
+            self._staging_table_names[table_name] = temp_table_name
+
+        ## `LIKE` copies `NOT NULL` constraints as well as the columns, so both must match for the table to be reused
+        columns = sorted((name, self.json_schema_to_sql_type(schema))
+                         for name, schema in remote_schema['schema']['properties'].items())
+
+        if self._staging_table_columns.get(table_name) == columns:
+            create = '''
+                CREATE TEMPORARY TABLE IF NOT EXISTS {temp_table} (LIKE {schema}.{table}) ON COMMIT DELETE ROWS
+            '''
+        else:
+            create = '''
+                DROP TABLE IF EXISTS {temp_table};
+                CREATE TEMPORARY TABLE {temp_table} (LIKE {schema}.{table}) ON COMMIT DELETE ROWS
+            '''
+
+        cur.execute(sql.SQL(create).format(
+            temp_table=self._full_staging_table_name(temp_table_name),
             schema=sql.Identifier(self.postgres_schema),
-            temp_table=sql.Identifier(target_table_name),
-            table=sql.Identifier(remote_schema['name'])
+            table=sql.Identifier(table_name)
         ))
+        self._staging_table_columns[table_name] = columns
 
-        ## Make streamable CSV records
-        csv_headers = list(remote_schema['schema']['properties'].keys())
-        rows_iter = iter(table_batch['records'])
+        return temp_table_name
 
-        def transform():
-            try:
-                row = next(rows_iter)
+    def write_table_batch(self, cur, table_batch, metadata):
+        remote_schema = table_batch['remote_schema']
+
+        ## Create temp table to upload new data to, unless the batch can be appended to the table as is
+        target_table_name = None
+        if not metadata.get('append_only'):
+            target_table_name = self._create_staging_table(cur, remote_schema)
+
+        headers = list(remote_schema['schema']['properties'].keys())
 
-                with io.StringIO() as out:
-                    writer = csv.DictWriter(out, csv_headers)
-                    writer.writerow(row)
-                    return out.getvalue()
-            except StopIteration:
-                return ''
+        if self.copy_format == COPY_FORMAT_BINARY:
+            ## Make streamable binary records
+            sql_types = [self.json_schema_to_sql_type(remote_schema['schema']['properties'][header])
+                         for header in headers]
+            if 'columns' in table_batch:
+                binary_rows = BinaryStream.from_columns(table_batch['columns'], headers, sql_types)
+            else:
+                binary_rows = BinaryStream(table_batch['records'], headers, sql_types)
+
+            ## Persist binary rows
+            self.persist_binary_rows(cur,
+                                     remote_schema,
+                                     target_table_name,
+                                     headers,
+                                     binary_rows)
+
+            return binary_rows.count
 
-        csv_rows = TransformStream(transform)
+        ## Make streamable CSV records
+        if 'columns' in table_batch:
+            csv_rows = CSVStream.from_columns(table_batch['columns'], headers)
+        else:
+            csv_rows = CSVStream(table_batch['records'], headers)
 
         ## Persist csv rows
         self.persist_csv_rows(cur,
                               remote_schema,
                               target_table_name,
-                              csv_headers,
+                              headers,
                               csv_rows)
 
-        return len(table_batch['records'])
+        return csv_rows.count
 
-    def add_column(self, cur, table_name, column_name, column_schema):
+    @contextmanager
+    def batch_table_changes(self, cur, table_name):
+        if table_name in self._table_changes:
+            yield
+            return None
 
-        cur.execute(sql.SQL('''
-            ALTER TABLE {table_schema}.{table_name}
-            ADD COLUMN {column_name} {data_type};
-        ''').format(
-            table_schema=sql.Identifier(self.postgres_schema),
-            table_name=sql.Identifier(table_name),
+        table_changes = _TableChanges(sql.SQL('{}.{}').format(sql.Identifier(self.postgres_schema),
+                                                              sql.Identifier(table_name)))
+        self._table_changes[table_name] = table_changes
+        try:
+            yield
+        except:
+            ## The cached metadata includes changes which will never be made
+            self._invalidate_catalog_cache([table_name])
+            raise
+        finally:
+            self._table_changes.pop(table_name)
+
+        if table_changes.statements or table_changes.alter_actions or table_changes.metadata is not None:
+            cur.execute(table_changes.to_sql())
+
+    def _alter_table(self, cur, table_name, action):
+        self._table_columns_cache.pop(table_name, None)
+
+        table_changes = self._table_changes.get(table_name)
+        if table_changes is not None:
+            table_changes.alter(action)
+            return None
+
+        cur.execute(sql.SQL('ALTER TABLE {}.{} {};').format(
+            sql.Identifier(self.postgres_schema),
+            sql.Identifier(table_name),
+            action))
+
+    def add_column(self, cur, table_name, column_name, column_schema):
+        self._alter_table(cur, table_name, sql.SQL('ADD COLUMN {column_name} {data_type}').format(
             column_name=sql.Identifier(column_name),
             data_type=sql.SQL(self.json_schema_to_sql_type(column_schema))))
 
     def migrate_column(self, cur, table_name, from_column, to_column):
-        cur.execute(sql.SQL('''
+        migrate = sql.SQL('''
             UPDATE {table_schema}.{table_name}
             SET {to_column} = {from_column};
         ''').format(
             table_schema=sql.Identifier(self.postgres_schema),
             table_name=sql.Identifier(table_name),
             to_column=sql.Identifier(to_column),
-            from_column=sql.Identifier(from_column)))
+            from_column=sql.Identifier(from_column))
+
+        table_changes = self._table_changes.get(table_name)
+        if table_changes is not None:
+            table_changes.execute(migrate)
+            return None
+
+        cur.execute(migrate)
 
     def drop_column(self, cur, table_name, column_name):
-        cur.execute(sql.SQL('''
-            ALTER TABLE {table_schema}.{table_name}
-            DROP COLUMN {column_name};
-        ''').format(
-            table_schema=sql.Identifier(self.postgres_schema),
-            table_name=sql.Identifier(table_name),
+        self._alter_table(cur, table_name, sql.SQL('DROP COLUMN {column_name}').format(
             column_name=sql.Identifier(column_name)))
 
     def make_column_nullable(self, cur, table_name, column_name):
-        cur.execute(sql.SQL('''
-            ALTER TABLE {table_schema}.{table_name}
-            ALTER COLUMN {column_name} DROP NOT NULL;
-        ''').format(
-            table_schema=sql.Identifier(self.postgres_schema),
-            table_name=sql.Identifier(table_name),
+        self._alter_table(cur, table_name, sql.SQL('ALTER COLUMN {column_name} DROP NOT NULL').format(
             column_name=sql.Identifier(column_name)))
 
-    def add_index(self, cur, table_name, column_names):
-        index_name = 'tp_{}_{}_idx'.format(table_name, "_".join(column_names))
+    def add_index(self, cur, table_name, column_names, unique=False):
+        index_name = 'tp_{}_{}_{}'.format(table_name, "_".join(column_names), 'key' if unique else 'idx')
 
         if len(index_name) > self.IDENTIFIER_FIELD_LENGTH:
             index_name_hash = hashlib.sha1(index_name.encode('utf-8')).hexdigest()[0:60]
             index_name = 'tp_{}'.format(index_name_hash)
 
         cur.execute(sql.SQL('''
-            CREATE INDEX {index_name}
+            CREATE {unique}INDEX {index_name}
             ON {table_schema}.{table_name}
             ({column_names});
         ''').format(
+            unique=sql.SQL('UNIQUE ' if unique else ''),
             index_name=sql.Identifier(index_name),
             table_schema=sql.Identifier(self.postgres_schema),
             table_name=sql.Identifier(table_name),
@@ -679,12 +1303,20 @@ class PostgresTarget(SQLInterface):
         :param metadata: Metadata Dict
         :return: None
         """
-        cur.execute(sql.SQL('COMMENT ON TABLE {}.{} IS {};').format(
-            sql.Identifier(self.postgres_schema),
-            sql.Identifier(table_name),
-            sql.Literal(json.dumps(metadata))))
+        table_changes = self._table_changes.get(table_name)
+        if table_changes is not None:
+            table_changes.metadata = json.loads(json.dumps(metadata))
+        else:
+            cur.execute(sql.SQL('COMMENT ON TABLE {}.{} IS {};').format(
+                sql.Identifier(self.postgres_schema),
+                sql.Identifier(table_name),
+                sql.Literal(json.dumps(metadata))))
+        self._table_metadata_cache[table_name] = json.loads(json.dumps(metadata))
 
     def _get_table_metadata(self, cur, table_name):
+        if table_name in self._table_metadata_cache:
+            return deepcopy(self._table_metadata_cache[table_name])
+
         cur.execute(sql.SQL('''
             SELECT EXISTS (
                 SELECT 1 FROM pg_tables
@@ -696,6 +1328,7 @@ class PostgresTarget(SQLInterface):
         table_exists = cur.fetchone()[0]
 
         if not table_exists:
+            self._table_metadata_cache[table_name] = None
             return None
 
         cur.execute(
@@ -713,6 +1346,7 @@ class PostgresTarget(SQLInterface):
         else:
             comment_meta = None
 
+        self._table_metadata_cache[table_name] = deepcopy(comment_meta)
         return comment_meta
 
     def add_column_mapping(self, cur, table_name, from_path, to_name, mapped_schema):
@@ -764,6 +1398,13 @@ class PostgresTarget(SQLInterface):
         else:
             return []
 
+    def new_table_unique_indexes(self, schema):
+        ## Only root tables are merged with `ON CONFLICT`, see `_merge_temp_table`
+        if self.add_unique_key_indexes and len(schema['path']) == 1 and schema.get('key_properties'):
+            return [list(map(self.canonicalize_identifier, schema['key_properties']))]
+        else:
+            return []
+
     def is_table_empty(self, cur, table_name):
         cur.execute(sql.SQL('SELECT EXISTS (SELECT * FROM {}.{});').format(
             sql.Identifier(self.postgres_schema),
@@ -776,15 +1417,19 @@ class PostgresTarget(SQLInterface):
 
     def __get_table_schema(self, cur, name):
         # Purely exists for migration purposes. DO NOT CALL DIRECTLY
-        cur.execute(sql.SQL('''
-            SELECT column_name, data_type, is_nullable FROM information_schema.columns
-            WHERE table_schema = {} and table_name = {};
-        ''').format(
-            sql.Literal(self.postgres_schema), sql.Literal(name)))
-
-        properties = {}
-        for column in cur.fetchall():
-            properties[column[0]] = self.sql_type_to_json_schema(column[1], column[2] == 'YES')
+        if name not in self._table_columns_cache:
+            cur.execute(sql.SQL('''
+                SELECT column_name, data_type, is_nullable FROM information_schema.columns
+                WHERE table_schema = {} and table_name = {};
+            ''').format(
+                sql.Literal(self.postgres_schema), sql.Literal(name)))
+
+            columns = {}
+            for column in cur.fetchall():
+                columns[column[0]] = self.sql_type_to_json_schema(column[1], column[2] == 'YES')
+            self._table_columns_cache[name] = columns
+
+        properties = deepcopy(self._table_columns_cache[name])
 
         metadata = self._get_table_metadata(cur, name)
 
@@ -0,0 +1,362 @@
+from collections import OrderedDict
+from copy import deepcopy
+import decimal
+import json
+import numbers
+import re
+
+from jsonschema import Draft4Validator, FormatChecker
+
+## Keywords which are left to `Draft4Validator`, along with the rest of the (sub)schema they appear in
+_UNCOMPILED_KEYWORDS = {'$ref', 'id', 'additionalItems', 'dependencies', 'not', 'oneOf', 'patternProperties',
+                        'uniqueItems'}
+
+## Concrete types are listed first, as `isinstance` checks against `numbers.Number` are comparatively slow
+_NUMBER_TYPES = (int, float, decimal.Decimal, numbers.Number)
+
+## Number of distinct schemas to keep compiled validators for
+VALIDATOR_CACHE_SIZE = 128
+_validator_cache = OrderedDict()
+
+
+def _flatten_types(pytypes):
+    if isinstance(pytypes, tuple):
+        return tuple(t for pytype in pytypes for t in _flatten_types(pytype))
+    return (pytypes,)
+
+
+def _always_valid(instance):
+    return True
+
+
+def _is_number(instance):
+    return isinstance(instance, _NUMBER_TYPES) and not isinstance(instance, bool)
+
+
+def _all(checks):
+    if not checks:
+        return _always_valid
+
+    if len(checks) == 1:
+        return checks[0]
+
+    def check_all(instance):
+        for check in checks:
+            if not check(instance):
+                return False
+        return True
+
+    return check_all
+
+
+class RecordValidator:
+    """
+    Validates records against a JSON Schema, with the same results as `Draft4Validator` with a `FormatChecker`.
+
+    The schema is compiled once into nested Python closures, which check each keyword directly, rather than
+    dispatching on every keyword of every (sub)schema for each record. Subschemas using keywords which are not compiled
+    (see `_UNCOMPILED_KEYWORDS`) are checked by `Draft4Validator`. Whenever a record is found to be invalid, it is
+    validated again by `Draft4Validator`, so that the error raised is exactly the one it would raise.
+    """
+
+    def __init__(self, schema):
+        self.schema = deepcopy(schema)
+        self.format_checker = FormatChecker()
+        self.validator = Draft4Validator(self.schema, format_checker=self.format_checker)
+        self._types = dict((name, _flatten_types(pytypes))
+                           for name, pytypes in Draft4Validator.DEFAULT_TYPES.items())
+        self._is_valid = self._compile(self.schema)
+
+    def validate(self, instance):
+        """
+        :param instance: JSON value
+        :raises jsonschema.exceptions.ValidationError: when `instance` is invalid
+        """
+        try:
+            if self._is_valid(instance):
+                return None
+        except Exception:
+            pass
+
+        self.validator.validate(instance)
+
+    def is_valid(self, instance):
+        try:
+            if self._is_valid(instance):
+                return True
+        except Exception:
+            pass
+
+        return self.validator.is_valid(instance)
+
+    def _uncompiled(self, schema):
+        validator = self.validator
+
+        def check_uncompiled(instance):
+            return validator.is_valid(instance, schema)
+
+        return check_uncompiled
+
+    def _compile(self, schema):
+        if not isinstance(schema, dict) or _UNCOMPILED_KEYWORDS.intersection(schema):
+            return self._uncompiled(schema)
+
+        try:
+            checks = []
+            for keyword, value in schema.items():
+                compiler = getattr(self, '_compile_' + keyword, None)
+                if compiler is not None and keyword in Draft4Validator.VALIDATORS:
+                    check = compiler(value, schema)
+                    if check is not _always_valid:
+                        checks.append(check)
+        except Exception:
+            ## Leave anything unexpected for `Draft4Validator` to report on
+            return self._uncompiled(schema)
+
+        return _all(checks)
+
+    def _compile_type(self, types, schema):
+        if isinstance(types, str):
+            types = [types]
+        elif not isinstance(types, list):
+            raise TypeError('`type` must be a string or an array')
+
+        pytypes = ()
+        for t in types:
+            if t == 'number':
+                pytypes += _NUMBER_TYPES
+            else:
+                pytypes += self._types[t]
+        allow_bool = 'boolean' in types
+
+        def check_type(instance):
+            if isinstance(instance, bool):
+                return allow_bool
+            return isinstance(instance, pytypes)
+
+        return check_type
+
+    def _compile_properties(self, properties, schema):
+        compiled = [(name, self._compile(subschema)) for name, subschema in properties.items()]
+        compiled = [(name, check) for name, check in compiled if check is not _always_valid]
+
+        if not compiled:
+            return _always_valid
+
+        def check_properties(instance):
+            if not isinstance(instance, dict):
+                return True
+            for name, check in compiled:
+                if name in instance and not check(instance[name]):
+                    return False
+            return True
+
+        return check_properties
+
+    def _compile_additionalProperties(self, additional_properties, schema):
+        properties = schema.get('properties', {})
+
+        if isinstance(additional_properties, dict):
+            check_additional = self._compile(additional_properties)
+
+            def check_additional_properties(instance):
+                if not isinstance(instance, dict):
+                    return True
+                for name, value in instance.items():
+                    if name not in properties and not check_additional(value):
+                        return False
+                return True
+
+            return check_additional_properties
+
+        if additional_properties:
+            return _always_valid
+
+        def check_no_additional_properties(instance):
+            if not isinstance(instance, dict):
+                return True
+            for name in instance:
+                if name not in properties:
+                    return False
+            return True
+
+        return check_no_additional_properties
+
+    def _compile_required(self, required, schema):
+        required = list(required)
+
+        def check_required(instance):
+            if not isinstance(instance, dict):
+                return True
+            for name in required:
+                if name not in instance:
+                    return False
+            return True
+
+        return check_required
+
+    def _compile_items(self, items, schema):
+        if isinstance(items, dict):
+            check_item = self._compile(items)
+
+            if check_item is _always_valid:
+                return _always_valid
+
+            def check_items(instance):
+                if not isinstance(instance, list):
+                    return True
+                for item in instance:
+                    if not check_item(item):
+                        return False
+                return True
+
+            return check_items
+
+        if not isinstance(items, list):
+            raise TypeError('`items` must be an object or an array')
+
+        compiled = [self._compile(subschema) for subschema in items]
+
+        def check_tuple_items(instance):
+            if not isinstance(instance, list):
+                return True
+            for check, item in zip(compiled, instance):
+                if not check(item):
+                    return False
+            return True
+
+        return check_tuple_items
+
+    def _compile_anyOf(self, any_of, schema):
+        compiled = [self._compile(subschema) for subschema in any_of]
+
+        def check_any_of(instance):
+            for check in compiled:
+                if check(instance):
+                    return True
+            return False
+
+        return check_any_of
+
+    def _compile_allOf(self, all_of, schema):
+        return _all([check for check in [self._compile(subschema) for subschema in all_of]
+                     if check is not _always_valid])
+
+    def _compile_enum(self, enums, schema):
+        def check_enum(instance):
+            return instance in enums
+
+        return check_enum
+
+    def _compile_format(self, format, schema):
+        ## Formats without a checker are always valid
+        if not format in self.format_checker.checkers:
+            return _always_valid
+
+        format_checker = self.format_checker
+
+        def check_format(instance):
+            return format_checker.conforms(instance, format)
+
+        return check_format
+
+    def _compile_pattern(self, pattern, schema):
+        search = re.compile(pattern).search
+
+        def check_pattern(instance):
+            return not isinstance(instance, str) or search(instance) is not None
+
+        return check_pattern
+
+    def _compile_minLength(self, min_length, schema):
+        def check_min_length(instance):
+            return not isinstance(instance, str) or len(instance) >= min_length
+
+        return check_min_length
+
+    def _compile_maxLength(self, max_length, schema):
+        def check_max_length(instance):
+            return not isinstance(instance, str) or len(instance) <= max_length
+
+        return check_max_length
+
+    def _compile_minItems(self, min_items, schema):
+        def check_min_items(instance):
+            return not isinstance(instance, list) or len(instance) >= min_items
+
+        return check_min_items
+
+    def _compile_maxItems(self, max_items, schema):
+        def check_max_items(instance):
+            return not isinstance(instance, list) or len(instance) <= max_items
+
+        return check_max_items
+
+    def _compile_minProperties(self, min_properties, schema):
+        def check_min_properties(instance):
+            return not isinstance(instance, dict) or len(instance) >= min_properties
+
+        return check_min_properties
+
+    def _compile_maxProperties(self, max_properties, schema):
+        def check_max_properties(instance):
+            return not isinstance(instance, dict) or len(instance) <= max_properties
+
+        return check_max_properties
+
+    def _compile_minimum(self, minimum, schema):
+        if schema.get('exclusiveMinimum', False):
+            def check_minimum(instance):
+                return not _is_number(instance) or not instance <= minimum
+        else:
+            def check_minimum(instance):
+                return not _is_number(instance) or not instance < minimum
+
+        return check_minimum
+
+    def _compile_maximum(self, maximum, schema):
+        if schema.get('exclusiveMaximum', False):
+            def check_maximum(instance):
+                return not _is_number(instance) or not instance >= maximum
+        else:
+            def check_maximum(instance):
+                return not _is_number(instance) or not instance > maximum
+
+        return check_maximum
+
+    def _compile_multipleOf(self, multiple_of, schema):
+        if isinstance(multiple_of, float):
+            def check_multiple_of(instance):
+                if not _is_number(instance):
+                    return True
+                quotient = instance / multiple_of
+                return int(quotient) == quotient
+        else:
+            def check_multiple_of(instance):
+                return not _is_number(instance) or not instance % multiple_of
+
+        return check_multiple_of
+
+
+def _fingerprint(schema):
+    return json.dumps(schema, sort_keys=True, default=repr)
+
+
+def get_validator(schema):
+    """
+    Returns a `RecordValidator` for `schema`. Validators are compiled once per distinct schema, and cached.
+    :param schema: dict, JSON Schema
+    :return: RecordValidator
+    """
+    fingerprint = _fingerprint(schema)
+
+    validator = _validator_cache.get(fingerprint)
+    if validator is None:
+        validator = RecordValidator(schema)
+        _validator_cache[fingerprint] = validator
+        if len(_validator_cache) > VALIDATOR_CACHE_SIZE:
+            _validator_cache.popitem(last=False)
+    else:
+        _validator_cache.move_to_end(fingerprint)
+
+    return validator
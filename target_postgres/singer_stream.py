@@ -1,12 +1,13 @@
-from copy import deepcopy
+from copy import copy, deepcopy
 import json
+import random
+import sys
 import uuid
 
 import arrow
-from jsonschema import Draft4Validator, FormatChecker
 from jsonschema.exceptions import ValidationError
 
-from target_postgres import json_schema, singer
+from target_postgres import denest, json_schema, record_validator, singer
 from target_postgres.exceptions import SingerStreamError
 
 
@@ -21,11 +22,33 @@ SINGER_VALUE = '_sdc_value'
 
 RAW_LINE_SIZE = '__raw_line_size'
 
+VALIDATION_MODE_FULL = 'full'
+VALIDATION_MODE_SAMPLE = 'sample'
+VALIDATION_MODE_FIRST_N = 'first_n'
+VALIDATION_MODE_NONE = 'none'
+VALIDATION_MODES = [VALIDATION_MODE_FULL, VALIDATION_MODE_SAMPLE, VALIDATION_MODE_FIRST_N, VALIDATION_MODE_NONE]
+
 
 def get_line_size(line_data):
     return line_data.get(RAW_LINE_SIZE) or len(json.dumps(line_data))
 
 
+def get_memory_size(value):
+    """
+    Estimate of the bytes of memory held by `value`, once parsed, including everything nested within it.
+    """
+    size = sys.getsizeof(value)
+
+    if isinstance(value, dict):
+        for key, item in value.items():
+            size += sys.getsizeof(key) + get_memory_size(item)
+    elif isinstance(value, list):
+        for item in value:
+            size += get_memory_size(item)
+
+    return size
+
+
 class BufferedSingerStream():
     def __init__(self,
                  stream,
@@ -36,15 +59,39 @@ class BufferedSingerStream():
                  invalid_records_threshold=None,
                  max_rows=200000,
                  max_buffer_size=104857600,  # 100MB
+                 validation_mode=None,
+                 validation_sample_rate=None,
+                 validation_first_n=None,
+                 memory_sample_interval=None,
+                 schema_fingerprint=None,
                  **kwargs):
         """
         :param invalid_records_detect: Defaults to True when value is None
         :param invalid_records_threshold: Defaults to 0 when value is None
+        :param validation_mode: Which records to validate, one of `VALIDATION_MODES`. Defaults to `full` when value is None
+        :param validation_sample_rate: Fraction of records validated in `sample` mode. Defaults to 0.1 when value is None
+        :param validation_first_n: Records validated after each schema in `first_n` mode. Defaults to 1000 when value is None
+        :param memory_sample_interval: Every how many records the memory used by a record is measured, rather than
+                                       estimated from its line size. Defaults to 1000 when value is None
+        :param schema_fingerprint: see `update_schema`
         """
         self.schema = None
         self.key_properties = None
         self.validator = None
-        self.update_schema(schema, key_properties)
+        self.schema_fingerprint = None
+        self.update_schema(schema, key_properties, schema_fingerprint=schema_fingerprint)
+
+        self.validation_mode = validation_mode or VALIDATION_MODE_FULL
+        self.validation_sample_rate = validation_sample_rate
+        self.validation_first_n = validation_first_n
+
+        if not self.validation_mode in VALIDATION_MODES:
+            raise SingerStreamError('Unknown `validation_mode` `{}`. Expected one of {}'.format(self.validation_mode,
+                                                                                               VALIDATION_MODES))
+        if self.validation_sample_rate is None:
+            self.validation_sample_rate = 0.1
+        if self.validation_first_n is None:
+            self.validation_first_n = 1000
 
         self.stream = stream
         self.invalid_records = []
@@ -59,18 +106,41 @@ class BufferedSingerStream():
         if self.invalid_records_threshold is None:
             self.invalid_records_threshold = 0
 
+        self.memory_sample_interval = memory_sample_interval or 1000
+
         self.__buffer = []
         self.__count = 0
         self.__size = 0
+
+        ## Memory used by the buffered records is estimated as their line sizes multiplied by the ratio of memory used
+        ##  to line size of the records measured so far
+        self.__memory_size = 0
+        self.__records_until_memory_sample = 0
+        self.__sampled_line_size = 0
+        self.__sampled_memory_size = 0
         self.__lifetime_max_version = None
 
-    def update_schema(self, schema, key_properties):
+    def update_schema(self, schema, key_properties, schema_fingerprint=None):
+        """
+        :param schema: SingerStreamSchema
+        :param key_properties: [string, ...]
+        :param schema_fingerprint: string which is only ever the same for the same `schema` and `key_properties`,
+                                   such as the raw SCHEMA message they were decoded from. Computed from them when None
+        """
+        self.__records_since_schema = 0
+
+        # Taps often repeat the same SCHEMA message, which leaves everything derived from the schema as is
+        if schema_fingerprint is None:
+            schema_fingerprint = json.dumps([schema, key_properties], sort_keys=True, default=str)
+        if schema_fingerprint == self.schema_fingerprint:
+            return None
+
         # In order to determine whether a value _is in_ properties _or not_ we need to flatten `$ref`s etc.
         self.schema = json_schema.simplify(schema)
         self.key_properties = deepcopy(key_properties)
 
-        # The validator can handle _many_ more things than our simplified schema, and is, in general handled by third party code
-        self.validator = Draft4Validator(schema, format_checker=FormatChecker())
+        # The validator can handle _many_ more things than our simplified schema, and is compiled from the full schema
+        self.validator = record_validator.get_validator(schema)
 
         properties = self.schema['properties']
 
@@ -105,10 +175,24 @@ class BufferedSingerStream():
         else:
             self.use_uuid_pk = False
 
+        # Compiled once per schema, and reused to denest every batch until the next schema. Both are shared with
+        #  `snapshot`s of this stream.
+        self.denest_plan = denest.compile_plan(self.schema)
+        self.table_schemas = denest.to_table_schemas(self.schema, self.key_properties)
+
+        self.schema_fingerprint = schema_fingerprint
+
     @property
     def count(self):
         return self.__count
 
+    @property
+    def memory_size(self):
+        """
+        Estimate of the bytes of memory used by the buffered records.
+        """
+        return int(self.__memory_size)
+
     @property
     def buffer_full(self):
         if self.__count >= self.max_rows:
@@ -133,6 +217,19 @@ class BufferedSingerStream():
         self.flush_buffer()
         self.__lifetime_max_version = version
 
+    def __should_validate(self):
+        if self.validation_mode == VALIDATION_MODE_FULL:
+            return True
+
+        if self.validation_mode == VALIDATION_MODE_SAMPLE:
+            return random.random() < self.validation_sample_rate
+
+        if self.validation_mode == VALIDATION_MODE_FIRST_N:
+            self.__records_since_schema += 1
+            return self.__records_since_schema <= self.validation_first_n
+
+        return False
+
     def add_record_message(self, record_message):
         add_record = True
 
@@ -141,15 +238,25 @@ class BufferedSingerStream():
         if self.__lifetime_max_version != record_message.get('version'):
             return None
 
-        try:
-            self.validator.validate(record_message['record'])
-        except ValidationError as error:
-            add_record = False
-            self.invalid_records.append((error, record_message))
+        if self.__should_validate():
+            try:
+                self.validator.validate(record_message['record'])
+            except ValidationError as error:
+                add_record = False
+                self.invalid_records.append((error, record_message))
 
         if add_record:
+            line_size = get_line_size(record_message)
+
+            if self.__records_until_memory_sample <= 0:
+                self.__sampled_line_size += line_size
+                self.__sampled_memory_size += get_memory_size(record_message)
+                self.__records_until_memory_sample = self.memory_sample_interval
+            self.__records_until_memory_sample -= 1
+
             self.__buffer.append(record_message)
-            self.__size += get_line_size(record_message)
+            self.__size += line_size
+            self.__memory_size += line_size * self.__sampled_memory_size / self.__sampled_line_size
             self.__count += 1
         elif self.invalid_records_detect \
                 and len(self.invalid_records) >= self.invalid_records_threshold:
@@ -162,7 +269,8 @@ class BufferedSingerStream():
         return self.__buffer
 
     def get_batch(self):
-        current_time = arrow.get().format('YYYY-MM-DD HH:mm:ss.SSSSZZ')
+        batched_at = arrow.get()
+        current_time = batched_at.format('YYYY-MM-DD HH:mm:ss.SSSSZZ')
 
         records = []
         for record_message in self.peek_buffer():
@@ -182,16 +290,25 @@ class BufferedSingerStream():
             if 'sequence' in record_message:
                 record[singer.SEQUENCE] = record_message['sequence']
             else:
-                record[singer.SEQUENCE] = arrow.get().timestamp
+                record[singer.SEQUENCE] = batched_at.timestamp
 
             records.append(record)
 
         return records
 
+    def snapshot(self):
+        """
+        Copy of this stream which is unaffected by later changes to its buffer or schema, ie, so the current
+        buffer can be written while new records keep arriving.
+        :return: BufferedSingerStream
+        """
+        return copy(self)
+
     def flush_buffer(self):
         _buffer = self.__buffer
         self.__buffer = []
         self.__size = 0
+        self.__memory_size = 0
         self.__count = 0
         return _buffer
 
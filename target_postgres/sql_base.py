@@ -12,7 +12,10 @@
 ## better understand how to make adding new targets simpler.
 #
 
+from collections.abc import Sized
+from contextlib import contextmanager
 from copy import deepcopy
+import json
 import time
 
 import singer
@@ -20,6 +23,7 @@ import singer.metrics as metrics
 
 from target_postgres import denest
 from target_postgres import json_schema
+from target_postgres.singer import SEQUENCE
 
 SEPARATOR = '__'
 CURRENT_SCHEMA_VERSION = 2
@@ -33,6 +37,49 @@ def _mapping_name(field, schema):
     return field + SEPARATOR + json_schema.shorthand(schema)
 
 
+def _dedupe_records(key_properties, records):
+    """
+    Keep only the latest record for each key, ie, the one with the highest `_sdc_sequence`, or the last streamed
+    when sequences tie. Records are otherwise kept in their original order.
+    :param key_properties: [string, ...]
+    :param records: [{...}, ...]
+    :return: [{...}, ...]
+    """
+    latest = {}
+    try:
+        for index, record in enumerate(records):
+            key = tuple(record.get(key_property) for key_property in key_properties)
+            previous = latest.get(key)
+            if previous is None or records[previous].get(SEQUENCE, 0) <= record.get(SEQUENCE, 0):
+                latest[key] = index
+    except TypeError:
+        ## Unhashable keys, or incomparable sequences, are left for the remote to dedupe
+        return records
+
+    if len(latest) == len(records):
+        return records
+
+    return [records[index] for index in sorted(latest.values())]
+
+
+def _table_schema_fingerprint(table_schema, metadata=None):
+    """
+    Stable string representation of a TABLE_SCHEMA, local or remote, suitable for cheap equality checks.
+    :param table_schema: TABLE_SCHEMA
+    :param metadata: additional information which the fingerprint should account for
+    :return: string
+    """
+    fingerprint = dict(table_schema)
+    fingerprint['schema'] = dict(table_schema['schema'])
+    ## Local schemas are keyed by path tuples, which JSON cannot encode as keys
+    fingerprint['schema']['properties'] = sorted(
+        ([list(path) if isinstance(path, tuple) else path, column_schema]
+         for path, column_schema in table_schema['schema']['properties'].items()),
+        key=lambda property: str(property[0]))
+
+    return json.dumps([fingerprint, metadata], sort_keys=True, default=str)
+
+
 class SQLInterface:
     """
     Generic interface for handling SQL Targets in Singer.
@@ -53,6 +100,16 @@ class SQLInterface:
     IDENTIFIER_FIELD_LENGTH = NotImplementedError('`IDENTIFIER_FIELD_LENGTH` not implemented.')
     LOGGER = singer.get_logger()
 
+    ## When `True`, `write_table_batch` is passed `columns` rather than `records`. See `_serialize_table_columns`.
+    columnar_batches = False
+
+    ## When `True`, only the latest record for each key in a batch is written. See `_dedupe_records`.
+    dedupe_batches = False
+
+    ## When `True`, each table's rows are denested only as `write_table_batch` consumes its `records`, which are then an
+    ##  iterator rather than a list. See `denest.iter_table_batches`.
+    streaming_batches = False
+
     def _set_timer_tags(self, metric, job_type, path):
         metric.tags['job_type'] = job_type
         metric.tags['path'] = path
@@ -315,13 +372,26 @@ class SQLInterface:
         """
         raise NotImplementedError('`make_column_nullable` not implemented.')
 
-    def add_index(self, connection, table_name, column_names):
+    @contextmanager
+    def batch_table_changes(self, connection, table_name):
+        """
+        Context within which changes to the columns and metadata of `table_name` may be collected, and then applied to
+        remote together when the context exits. Defaults to applying each change as it is made.
+
+        :param connection: remote connection, type left to be determined by implementing class
+        :param table_name: string
+        :return: None
+        """
+        yield
+
+    def add_index(self, connection, table_name, column_names, unique=False):
         """
         Add an index on a group of `column_names` in `table_name`.
 
         :param connection: remote connection, type left to be determined by implementing class
         :param table_name: string
         :param column_names: (string, ...)
+        :param unique: boolean
         :return: None
         """
         raise NotImplementedError('`add_index` not implemented.')
@@ -395,238 +465,264 @@ class SQLInterface:
 
             existing_schema = self._get_table_schema(connection, table_name)
 
+            ## Nothing to do when this streamed schema was last upserted against the very same remote schema
+            streamed_fingerprint = _table_schema_fingerprint(schema, _metadata)
+            upserted_table_schemas = self._upserted_table_schemas()
+            if existing_schema is not None \
+                    and upserted_table_schemas.get(table_name) == (streamed_fingerprint,
+                                                                   _table_schema_fingerprint(existing_schema)):
+                return existing_schema
+
             existing_table = True
             if existing_schema is None:
                 self.add_table(connection, table_path, table_name, _metadata)
                 existing_schema = self._get_table_schema(connection, table_name)
                 existing_table = False
 
-            self.add_key_properties(connection, table_name, schema.get('key_properties', None))
-
-            ## Build up mappings to compare new columns against existing
-            mappings = []
-
-            for to, m in existing_schema.get('mappings', {}).items():
-                mapping = json_schema.simple_type(m)
-                mapping['from'] = tuple(m['from'])
-                mapping['to'] = to
-                mappings.append(mapping)
-
-            ## Only process columns which have single, nullable, types
-            column_paths_seen = set()
-            single_type_columns = []
-
-            for column_path, column_schema in schema['schema']['properties'].items():
-                column_paths_seen.add(column_path)
-                for sub_schema in column_schema['anyOf']:
-                    single_type_columns.append((column_path, deepcopy(sub_schema)))
-
-            ### Add any columns missing from new schema
-            for m in mappings:
-                if not m['from'] in column_paths_seen:
-                    single_type_columns.append((m['from'], json_schema.make_nullable(m)))
-
-            ## Process new columns against existing
-            table_empty = self.is_table_empty(connection, table_name)
-
-            for column_path, column_schema in single_type_columns:
-                upsert_table_helper__start__column = time.monotonic()
-
-                canonicalized_column_name = self._canonicalize_column_identifier(column_path, column_schema, mappings)
-                nullable_column_schema = json_schema.make_nullable(column_schema)
-
-                def log_message(msg):
-                    if log_schema_changes:
-                        self.LOGGER.info(
-                            'Table Schema Change [`{}`.`{}`:`{}`] {} (took {} millis)'.format(
-                                table_name,
-                                column_path,
-                                canonicalized_column_name,
-                                msg,
-                                _duration_millis(upsert_table_helper__start__column)))
-
-                ## NEW COLUMN
-                if not column_path in [m['from'] for m in mappings]:
-                    upsert_table_helper__column = "New column"
-                    ### NON EMPTY TABLE
-                    if not table_empty:
-                        upsert_table_helper__column += ", non empty table"
-                        self.LOGGER.warning(
-                            'NOT EMPTY: Forcing new column `{}` in table `{}` to be nullable due to table not empty.'.format(
-                                column_path,
-                                table_name))
-                        column_schema = nullable_column_schema
-
-                    self.add_column(connection,
-                                    table_name,
-                                    canonicalized_column_name,
-                                    column_schema)
-                    self.add_column_mapping(connection,
-                                            table_name,
-                                            column_path,
-                                            canonicalized_column_name,
-                                            column_schema)
+            ## Collect all column changes so that they can be applied together
+            with self.batch_table_changes(connection, table_name):
+                self.add_key_properties(connection, table_name, schema.get('key_properties', None))
 
-                    mapping = json_schema.simple_type(column_schema)
-                    mapping['from'] = column_path
-                    mapping['to'] = canonicalized_column_name
-                    mappings.append(mapping)
-
-                    log_message(upsert_table_helper__column)
-
-                    continue
+                ## Build up mappings to compare new columns against existing
+                mappings = []
 
-                ## EXISTING COLUMNS
-                ### SCHEMAS MATCH
-                if [True for m in mappings if
-                    m['from'] == column_path
-                    and self.json_schema_to_sql_type(m) == self.json_schema_to_sql_type(column_schema)]:
-                    continue
-                ### NULLABLE SCHEMAS MATCH
-                ###  New column _is not_ nullable, existing column _is_
-                if [True for m in mappings if
-                    m['from'] == column_path
-                    and self.json_schema_to_sql_type(m) == self.json_schema_to_sql_type(nullable_column_schema)]:
-                    continue
-
-                ### NULL COMPATIBILITY
-                ###  New column _is_ nullable, existing column is _not_
-                non_null_original_column = [m for m in mappings if
-                                            m['from'] == column_path and json_schema.shorthand(
-                                                m) == json_schema.shorthand(column_schema)]
-                if non_null_original_column:
-                    ## MAKE NULLABLE
-                    self.make_column_nullable(connection,
-                                              table_name,
-                                              canonicalized_column_name)
-                    self.drop_column_mapping(connection, table_name, canonicalized_column_name)
-                    self.add_column_mapping(connection,
-                                            table_name,
-                                            column_path,
-                                            canonicalized_column_name,
-                                            nullable_column_schema)
-
-                    mappings = [m for m in mappings if not (m['from'] == column_path and json_schema.shorthand(
-                        m) == json_schema.shorthand(column_schema))]
-
-                    mapping = json_schema.simple_type(nullable_column_schema)
-                    mapping['from'] = column_path
-                    mapping['to'] = canonicalized_column_name
+                for to, m in existing_schema.get('mappings', {}).items():
+                    mapping = json_schema.simple_type(m)
+                    mapping['from'] = tuple(m['from'])
+                    mapping['to'] = to
                     mappings.append(mapping)
 
-                    log_message("Made existing column nullable.")
-
-                    continue
-
-                ### FIRST MULTI TYPE
-                ###  New column matches existing column path, but the types are incompatible
-                duplicate_paths = [m for m in mappings if m['from'] == column_path]
-
-                if 1 == len(duplicate_paths):
-                    existing_mapping = duplicate_paths[0]
-                    existing_column_name = existing_mapping['to']
+                ## Only process columns which have single, nullable, types
+                column_paths_seen = set()
+                single_type_columns = []
 
-                    if existing_column_name:
-                        self.drop_column_mapping(connection, table_name, existing_column_name)
+                for column_path, column_schema in schema['schema']['properties'].items():
+                    column_paths_seen.add(column_path)
+                    for sub_schema in column_schema['anyOf']:
+                        single_type_columns.append((column_path, deepcopy(sub_schema)))
 
-                    ## Update existing properties
-                    mappings = [m for m in mappings if m['from'] != column_path]
+                ### Add any columns missing from new schema
+                for m in mappings:
+                    if not m['from'] in column_paths_seen:
+                        single_type_columns.append((m['from'], json_schema.make_nullable(m)))
 
-                    mapping = json_schema.simple_type(nullable_column_schema)
-                    mapping['from'] = column_path
-                    mapping['to'] = canonicalized_column_name
-                    mappings.append(mapping)
+                ## Process new columns against existing
+                table_empty = self.is_table_empty(connection, table_name)
 
-                    existing_column_new_normalized_name = self._canonicalize_column_identifier(column_path,
-                                                                                               existing_mapping,
-                                                                                               mappings)
-
-                    mapping = json_schema.simple_type(json_schema.make_nullable(existing_mapping))
-                    mapping['from'] = column_path
-                    mapping['to'] = existing_column_new_normalized_name
-                    mappings.append(mapping)
+                for column_path, column_schema in single_type_columns:
+                    upsert_table_helper__start__column = time.monotonic()
 
-                    ## Add new columns
-                    ### NOTE: all migrated columns will be nullable and remain that way
+                    canonicalized_column_name = self._canonicalize_column_identifier(column_path, column_schema, mappings)
+                    nullable_column_schema = json_schema.make_nullable(column_schema)
 
-                    #### Table Metadata
-                    self.add_column_mapping(connection,
-                                            table_name,
-                                            column_path,
-                                            existing_column_new_normalized_name,
-                                            json_schema.make_nullable(existing_mapping))
-                    self.add_column_mapping(connection,
-                                            table_name,
-                                            column_path,
-                                            canonicalized_column_name,
-                                            nullable_column_schema)
-
-                    #### Columns
-                    self.add_column(connection,
-                                    table_name,
-                                    existing_column_new_normalized_name,
-                                    json_schema.make_nullable(existing_mapping))
-
-                    self.add_column(connection,
+                    def log_message(msg):
+                        if log_schema_changes:
+                            self.LOGGER.info(
+                                'Table Schema Change [`{}`.`{}`:`{}`] {} (took {} millis)'.format(
                                     table_name,
+                                    column_path,
                                     canonicalized_column_name,
-                                    nullable_column_schema)
-
-                    ## Migrate existing data
-                    self.migrate_column(connection,
+                                    msg,
+                                    _duration_millis(upsert_table_helper__start__column)))
+
+                    ## NEW COLUMN
+                    if not column_path in [m['from'] for m in mappings]:
+                        upsert_table_helper__column = "New column"
+                        ### NON EMPTY TABLE
+                        if not table_empty:
+                            upsert_table_helper__column += ", non empty table"
+                            self.LOGGER.warning(
+                                'NOT EMPTY: Forcing new column `{}` in table `{}` to be nullable due to table not empty.'.format(
+                                    column_path,
+                                    table_name))
+                            column_schema = nullable_column_schema
+
+                        self.add_column(connection,
                                         table_name,
-                                        existing_mapping['to'],
-                                        existing_column_new_normalized_name)
-
-                    ## Drop existing column
-                    self.drop_column(connection,
-                                     table_name,
-                                     existing_mapping['to'])
-
-                    upsert_table_helper__column = "Splitting `{}` into `{}` and `{}`. New column matches existing column path, but the types are incompatible.".format(
-                        existing_column_name,
-                        existing_column_new_normalized_name,
-                        canonicalized_column_name
-                    )
-
-                ## REST MULTI TYPE
-                elif 1 < len(duplicate_paths):
-                    ## Add new column
-                    self.add_column_mapping(connection,
-                                            table_name,
-                                            column_path,
-                                            canonicalized_column_name,
-                                            nullable_column_schema)
-                    self.add_column(connection,
-                                    table_name,
-                                    canonicalized_column_name,
-                                    nullable_column_schema)
-
-                    mapping = json_schema.simple_type(nullable_column_schema)
-                    mapping['from'] = column_path
-                    mapping['to'] = canonicalized_column_name
-                    mappings.append(mapping)
+                                        canonicalized_column_name,
+                                        column_schema)
+                        self.add_column_mapping(connection,
+                                                table_name,
+                                                column_path,
+                                                canonicalized_column_name,
+                                                column_schema)
+
+                        mapping = json_schema.simple_type(column_schema)
+                        mapping['from'] = column_path
+                        mapping['to'] = canonicalized_column_name
+                        mappings.append(mapping)
+
+                        log_message(upsert_table_helper__column)
+
+                        continue
+
+                    ## EXISTING COLUMNS
+                    ### SCHEMAS MATCH
+                    if [True for m in mappings if
+                        m['from'] == column_path
+                        and self.json_schema_to_sql_type(m) == self.json_schema_to_sql_type(column_schema)]:
+                        continue
+                    ### NULLABLE SCHEMAS MATCH
+                    ###  New column _is not_ nullable, existing column _is_
+                    if [True for m in mappings if
+                        m['from'] == column_path
+                        and self.json_schema_to_sql_type(m) == self.json_schema_to_sql_type(nullable_column_schema)]:
+                        continue
+
+                    ### NULL COMPATIBILITY
+                    ###  New column _is_ nullable, existing column is _not_
+                    non_null_original_column = [m for m in mappings if
+                                                m['from'] == column_path and json_schema.shorthand(
+                                                    m) == json_schema.shorthand(column_schema)]
+                    if non_null_original_column:
+                        ## MAKE NULLABLE
+                        self.make_column_nullable(connection,
+                                                  table_name,
+                                                  canonicalized_column_name)
+                        self.drop_column_mapping(connection, table_name, canonicalized_column_name)
+                        self.add_column_mapping(connection,
+                                                table_name,
+                                                column_path,
+                                                canonicalized_column_name,
+                                                nullable_column_schema)
+
+                        mappings = [m for m in mappings if not (m['from'] == column_path and json_schema.shorthand(
+                            m) == json_schema.shorthand(column_schema))]
+
+                        mapping = json_schema.simple_type(nullable_column_schema)
+                        mapping['from'] = column_path
+                        mapping['to'] = canonicalized_column_name
+                        mappings.append(mapping)
+
+                        log_message("Made existing column nullable.")
+
+                        continue
+
+                    ### FIRST MULTI TYPE
+                    ###  New column matches existing column path, but the types are incompatible
+                    duplicate_paths = [m for m in mappings if m['from'] == column_path]
+
+                    if 1 == len(duplicate_paths):
+                        existing_mapping = duplicate_paths[0]
+                        existing_column_name = existing_mapping['to']
+
+                        if existing_column_name:
+                            self.drop_column_mapping(connection, table_name, existing_column_name)
+
+                        ## Update existing properties
+                        mappings = [m for m in mappings if m['from'] != column_path]
+
+                        mapping = json_schema.simple_type(nullable_column_schema)
+                        mapping['from'] = column_path
+                        mapping['to'] = canonicalized_column_name
+                        mappings.append(mapping)
+
+                        existing_column_new_normalized_name = self._canonicalize_column_identifier(column_path,
+                                                                                                   existing_mapping,
+                                                                                                   mappings)
+
+                        mapping = json_schema.simple_type(json_schema.make_nullable(existing_mapping))
+                        mapping['from'] = column_path
+                        mapping['to'] = existing_column_new_normalized_name
+                        mappings.append(mapping)
+
+                        ## Add new columns
+                        ### NOTE: all migrated columns will be nullable and remain that way
+
+                        #### Table Metadata
+                        self.add_column_mapping(connection,
+                                                table_name,
+                                                column_path,
+                                                existing_column_new_normalized_name,
+                                                json_schema.make_nullable(existing_mapping))
+                        self.add_column_mapping(connection,
+                                                table_name,
+                                                column_path,
+                                                canonicalized_column_name,
+                                                nullable_column_schema)
+
+                        #### Columns
+                        self.add_column(connection,
+                                        table_name,
+                                        existing_column_new_normalized_name,
+                                        json_schema.make_nullable(existing_mapping))
 
-                    upsert_table_helper__column = "Adding new column to split column `{}`. New column matches existing column's path, but no types were compatible.".format(
-                        column_path
-                    )
+                        self.add_column(connection,
+                                        table_name,
+                                        canonicalized_column_name,
+                                        nullable_column_schema)
 
-                ## UNKNOWN
-                else:
-                    raise Exception(
-                        'UNKNOWN: Cannot handle merging column `{}` (canonicalized as: `{}`) in table `{}`.'.format(
-                            column_path,
-                            canonicalized_column_name,
-                            table_name
-                        ))
+                        ## Migrate existing data
+                        self.migrate_column(connection,
+                                            table_name,
+                                            existing_mapping['to'],
+                                            existing_column_new_normalized_name)
+
+                        ## Drop existing column
+                        self.drop_column(connection,
+                                         table_name,
+                                         existing_mapping['to'])
+
+                        upsert_table_helper__column = "Splitting `{}` into `{}` and `{}`. New column matches existing column path, but the types are incompatible.".format(
+                            existing_column_name,
+                            existing_column_new_normalized_name,
+                            canonicalized_column_name
+                        )
+
+                    ## REST MULTI TYPE
+                    elif 1 < len(duplicate_paths):
+                        ## Add new column
+                        self.add_column_mapping(connection,
+                                                table_name,
+                                                column_path,
+                                                canonicalized_column_name,
+                                                nullable_column_schema)
+                        self.add_column(connection,
+                                        table_name,
+                                        canonicalized_column_name,
+                                        nullable_column_schema)
+
+                        mapping = json_schema.simple_type(nullable_column_schema)
+                        mapping['from'] = column_path
+                        mapping['to'] = canonicalized_column_name
+                        mappings.append(mapping)
+
+                        upsert_table_helper__column = "Adding new column to split column `{}`. New column matches existing column's path, but no types were compatible.".format(
+                            column_path
+                        )
+
+                    ## UNKNOWN
+                    else:
+                        raise Exception(
+                            'UNKNOWN: Cannot handle merging column `{}` (canonicalized as: `{}`) in table `{}`.'.format(
+                                column_path,
+                                canonicalized_column_name,
+                                table_name
+                            ))
 
-                log_message(upsert_table_helper__column)
+                    log_message(upsert_table_helper__column)
 
             if not existing_table:
                 for column_names in self.new_table_indexes(schema):
                     self.add_index(connection, table_name, column_names)
+                for column_names in self.new_table_unique_indexes(schema):
+                    self.add_index(connection, table_name, column_names, unique=True)
+
+            remote_schema = self._get_table_schema(connection, table_name)
+            upserted_table_schemas[table_name] = (streamed_fingerprint,
+                                                  _table_schema_fingerprint(remote_schema))
 
-            return self._get_table_schema(connection, table_name)
+            return remote_schema
+
+    def _upserted_table_schemas(self):
+        """
+        Fingerprints of the last streamed schema upserted for each table, along with the remote schema which resulted.
+        :return: {table_name: (string, string)}
+        """
+        if not hasattr(self, '_upserted_table_schemas_cache'):
+            self._upserted_table_schemas_cache = {}
+
+        return self._upserted_table_schemas_cache
 
     def _serialize_table_record_field_name(self, remote_schema, path, value_json_schema):
         """
@@ -705,67 +801,165 @@ class SQLInterface:
         :param records: [{(path_0, path_1, ...): (_json_schema_string_type, value), ...}, ...]
         :return: [{...}, ...]
         """
+        return list(self._iter_serialized_table_records(remote_schema, streamed_schema, records))
 
-        datetime_paths = set()
-        default_paths = {}
+    def _iter_serialized_table_records(
+            self, remote_schema, streamed_schema, records):
+        """
+        Lazy equivalent of `_serialize_table_records`, serializing each record as it is consumed.
+
+        :param remote_schema: TABLE_SCHEMA(remote)
+        :param streamed_schema: TABLE_SCHEMA(local)
+        :param records: iterable of {(path_0, path_1, ...): (_json_schema_string_type, value), ...}
+        :return: iterator of {...}
+        """
 
+        ## Everything about each path which does not depend on the row is worked out once for the batch
+        path_details = []
         for column_path, column_schema in streamed_schema['schema']['properties'].items():
+            is_datetime = False
+            default = None
             for sub_schema in column_schema['anyOf']:
                 if json_schema.is_datetime(sub_schema):
-                    datetime_paths.add(column_path)
+                    is_datetime = True
                 if sub_schema.get('default') is not None:
-                    default_paths[column_path] = sub_schema.get('default')
+                    default = sub_schema.get('default')
+
+            path_details.append((column_path, is_datetime, default))
 
         ## Get the default NULL value so we can assign row values when value is _not_ NULL
         NULL_DEFAULT = self.serialize_table_record_null_value(remote_schema, streamed_schema, None, None)
 
-        serialized_rows = []
-
         remote_fields = set(remote_schema['schema']['properties'].keys())
         default_row = dict([(field, NULL_DEFAULT) for field in remote_fields])
 
-        paths = streamed_schema['schema']['properties'].keys()
+        ## Field names by `(path, _json_schema_string_type | DATE_TIME_FORMAT)`, resolved as each is first seen
+        field_names = {}
+
         for record in records:
 
-            row = deepcopy(default_row)
+            row = default_row.copy()
 
-            for path in paths:
+            for path, is_datetime, default in path_details:
                 json_schema_string_type, value = record.get(path, (None, None))
 
                 ## Serialize fields which are not present but have default values set
-                if path in default_paths \
+                if default is not None \
                         and value is None:
-                    value = default_paths[path]
+                    value = default
                     json_schema_string_type = json_schema.python_type(value)
 
                 if not json_schema_string_type:
                     continue
 
                 ## Serialize datetime to compatible format
-                if path in datetime_paths \
+                if is_datetime \
                         and json_schema_string_type == json_schema.STRING \
                         and value is not None:
                     value = self.serialize_table_record_datetime_value(remote_schema, streamed_schema, path,
                                                                        value)
-                    value_json_schema = {'type': json_schema.STRING,
-                                         'format': json_schema.DATE_TIME_FORMAT}
+                    field_type = json_schema.DATE_TIME_FORMAT
                 else:
-                    value_json_schema = {'type': json_schema_string_type}
+                    field_type = json_schema_string_type
 
                 ## Serialize NULL default value
                 value = self.serialize_table_record_null_value(remote_schema, streamed_schema, path, value)
 
-                field_name = self._serialize_table_record_field_name(remote_schema,
-                                                                     path,
-                                                                     value_json_schema)
+                field_name = field_names.get((path, field_type))
+                if field_name is None:
+                    if field_type == json_schema.DATE_TIME_FORMAT:
+                        value_json_schema = {'type': json_schema.STRING,
+                                             'format': json_schema.DATE_TIME_FORMAT}
+                    else:
+                        value_json_schema = {'type': field_type}
+
+                    field_name = field_names[(path, field_type)] = \
+                        self._serialize_table_record_field_name(remote_schema, path, value_json_schema)
 
                 ## `field_name` is unset
                 if row[field_name] == NULL_DEFAULT:
                     row[field_name] = value
 
-            serialized_rows.append(row)
+            yield row
+
+    def _serialize_table_columns(
+            self, remote_schema, streamed_schema, records):
+        """
+        Parse the given table's columnar `records` in preparation for persistence to the remote target.
+
+        Equivalent to `_serialize_table_records`, but reads and returns the table column by column, so
+        that no dictionary is made per row.
+
+        :param remote_schema: TABLE_SCHEMA(remote)
+        :param streamed_schema: TABLE_SCHEMA(local)
+        :param records: denest.ColumnarRecords
+        :return: {field_name: [value, ...], ...}, with a value for every row in every field of
+                 `remote_schema`'s properties
+        """
+
+        row_count = len(records)
+
+        ## Get the default NULL value so we can assign column values when value is _not_ NULL
+        NULL_DEFAULT = self.serialize_table_record_null_value(remote_schema, streamed_schema, None, None)
 
-        return serialized_rows
+        columns = dict([(field, [NULL_DEFAULT] * row_count)
+                        for field in remote_schema['schema']['properties'].keys()])
+
+        for path, column_schema in streamed_schema['schema']['properties'].items():
+            is_datetime = False
+            default = None
+            for sub_schema in column_schema['anyOf']:
+                if json_schema.is_datetime(sub_schema):
+                    is_datetime = True
+                if sub_schema.get('default') is not None:
+                    default = sub_schema.get('default')
+
+            types, values = records.column(path)
+
+            ## Serialize fields which are not present but have default values set
+            if default is not None:
+                types = types + [None] * (row_count - len(types))
+                values = values + [None] * (row_count - len(values))
+                default_type = json_schema.python_type(default)
+                for i, value in enumerate(values):
+                    if value is None:
+                        types[i] = default_type
+                        values[i] = default
+
+            field_names = {}
+            for i, (json_schema_string_type, value) in enumerate(zip(types, values)):
+                if not json_schema_string_type:
+                    continue
+
+                ## Serialize datetime to compatible format
+                if is_datetime \
+                        and json_schema_string_type == json_schema.STRING \
+                        and value is not None:
+                    value = self.serialize_table_record_datetime_value(remote_schema, streamed_schema, path,
+                                                                       value)
+                    field_type = json_schema.DATE_TIME_FORMAT
+                else:
+                    field_type = json_schema_string_type
+
+                ## Serialize NULL default value
+                value = self.serialize_table_record_null_value(remote_schema, streamed_schema, path, value)
+
+                column = field_names.get(field_type)
+                if column is None:
+                    if field_type == json_schema.DATE_TIME_FORMAT:
+                        value_json_schema = {'type': json_schema.STRING,
+                                             'format': json_schema.DATE_TIME_FORMAT}
+                    else:
+                        value_json_schema = {'type': field_type}
+
+                    column = field_names[field_type] = columns[
+                        self._serialize_table_record_field_name(remote_schema, path, value_json_schema)]
+
+                ## `field_name` is unset
+                if column[i] == NULL_DEFAULT:
+                    column[i] = value
+
+        return columns
 
     def write_table_batch(self, connection, table_batch, metadata):
         """
@@ -775,12 +969,16 @@ class SQLInterface:
         :param connection: remote connection, type left to be determined by implementing class
         :param table_batch: {'remote_schema': TABLE_SCHEMA(remote),
                              'records': [{...}, ...]}
+                            or, when `columnar_batches` is set,
+                            {'remote_schema': TABLE_SCHEMA(remote),
+                             'columns': {field_name: [value, ...], ...}}
         :param metadata: additional metadata needed by implementing class
         :return: integer
         """
         raise NotImplementedError('`write_table_batch` not implemented.')
 
-    def write_batch_helper(self, connection, root_table_name, schema, key_properties, records, metadata):
+    def write_batch_helper(self, connection, root_table_name, schema, key_properties, records, metadata,
+                           denest_plan=None, table_schemas=None):
         """
         Write all `table_batch`s associated with the given `schema` and `records` to remote.
 
@@ -790,6 +988,8 @@ class SQLInterface:
         :param key_properties: [string, ...]
         :param records: [{...}, ...]
         :param metadata: additional metadata needed by implementing class
+        :param denest_plan: see `denest.compile_plan`, compiled from `schema` when not provided
+        :param table_schemas: see `denest.to_table_schemas`, denested from `schema` when not provided
         :return: {'records_persisted': int,
                   'rows_persisted': int}
         """
@@ -805,9 +1005,30 @@ class SQLInterface:
                     key_properties
                 ))
 
-                for table_batch in denest.to_table_batches(schema, key_properties, records):
-                    table_batch['streamed_schema']['path'] = (root_table_name,) + \
-                                                             table_batch['streamed_schema']['path']
+                ## Superseded records are dropped before denesting, so their subtable rows are never made either
+                latest_records = records
+                if self.dedupe_batches:
+                    latest_records = _dedupe_records(key_properties, records)
+                    if len(latest_records) < len(records):
+                        self.LOGGER.info('Dropped {} superseded records for `{}`'.format(
+                            len(records) - len(latest_records),
+                            root_table_name))
+
+                if self.streaming_batches:
+                    table_batches = denest.iter_table_batches(schema, key_properties, latest_records,
+                                                              columnar=self.columnar_batches,
+                                                              plan=denest_plan,
+                                                              table_schemas=table_schemas)
+                else:
+                    table_batches = denest.to_table_batches(schema, key_properties, latest_records,
+                                                            columnar=self.columnar_batches,
+                                                            plan=denest_plan,
+                                                            table_schemas=table_schemas)
+
+                for table_batch in table_batches:
+                    ## Table schemas may be shared between batches, so are copied rather than changed
+                    table_batch['streamed_schema'] = dict(table_batch['streamed_schema'],
+                                                          path=(root_table_name,) + table_batch['streamed_schema']['path'])
 
                     with self._set_timer_tags(metrics.job_timer(),
                                               'table',
@@ -826,18 +1047,32 @@ class SQLInterface:
                             self._set_metrics_tags__table(table_batch_timer, remote_schema['name'])
                             self._set_metrics_tags__table(table_batch_counter, remote_schema['name'])
 
-                            self.LOGGER.info('Writing table batch with {} rows for `{}`...'.format(
-                                len(table_batch['records']),
-                                table_batch['streamed_schema']['path']
-                            ))
-
-                            batch_rows_persisted = self.write_table_batch(
-                                connection,
-                                {'remote_schema': remote_schema,
-                                 'records': self._serialize_table_records(remote_schema,
-                                                                          table_batch['streamed_schema'],
-                                                                          table_batch['records'])},
-                                metadata)
+                            if isinstance(table_batch['records'], Sized):
+                                self.LOGGER.info('Writing table batch with {} rows for `{}`...'.format(
+                                    len(table_batch['records']),
+                                    table_batch['streamed_schema']['path']
+                                ))
+                            else:
+                                self.LOGGER.info('Writing streamed table batch for `{}`...'.format(
+                                    table_batch['streamed_schema']['path']
+                                ))
+
+                            if self.columnar_batches:
+                                serialized_table_batch = {
+                                    'remote_schema': remote_schema,
+                                    'columns': self._serialize_table_columns(remote_schema,
+                                                                             table_batch['streamed_schema'],
+                                                                             table_batch['records'])}
+                            else:
+                                serialized_table_batch = {
+                                    'remote_schema': remote_schema,
+                                    'records': self._iter_serialized_table_records(remote_schema,
+                                                                                   table_batch['streamed_schema'],
+                                                                                   table_batch['records'])}
+
+                            batch_rows_persisted = self.write_table_batch(connection,
+                                                                          serialized_table_batch,
+                                                                          metadata)
 
                             table_batch_counter.increment(batch_rows_persisted)
                             batch_counter.increment(batch_rows_persisted)
@@ -878,3 +1113,13 @@ class SQLInterface:
         """
         return []
 
+    def new_table_unique_indexes(self, schema):
+        """
+        Returns a list of lists of string column names to add unique indexes for a new table once that new table has
+        been fully created.
+
+        :param schema: TABLE_SCHEMA(local)
+        :return: [[column_name: string], [column_name: string, column_name: string],...]
+        """
+        return []
+
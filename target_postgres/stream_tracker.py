@@ -1,10 +1,19 @@
 from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import heapq
 import json
+import singer
 import singer.statediff as statediff
 import sys
+import time
 
 from target_postgres.exceptions import TargetError
 
+LOGGER = singer.get_logger()
+
+# Fewest rows which `adaptive_batch_duration` sets a stream's batches to
+MIN_ADAPTIVE_BATCH_ROWS = 100
+
 
 class StreamTracker:
     """
@@ -14,12 +23,62 @@ class StreamTracker:
     emit a STATE message once all the records that came in prior to that STATE in the stream. Because target-postgres buffers
     the records in BufferedSingerStreams, the STATE messages need to be delayed until all the records that came before them have been
     saved to the database from their buffers.
+
+    When `pipelined_flush` is set, batches are handed off to a background writer so that reading and buffering
+    continue while the previous batch is written. Up to `max_pending_batches` batches may be in flight per writer, and a
+    stream's flush watermark only advances once its batch has been written, so STATE handling is unchanged.
+
+    When more than one of `writer_targets` is given, each stream is assigned to one of them, and each writes in its own
+    background thread, so that batches for different streams are written concurrently. Without `pipelined_flush`,
+    flushes still wait for all of their batches to be written before reading continues.
+
+    When `max_buffer_memory` is set, the estimated memory used by all streams' buffers together is kept under it, by
+    flushing the streams with the largest buffers first whenever a record takes it over.
+
+    When `max_batch_age` is set, a stream is flushed once the oldest record in its buffer was received more than that
+    many seconds ago, whether or not its buffer is full. See `flush_aged_streams`.
+
+    When `adaptive_batch_duration` is set, each stream's `max_rows` is adjusted after every batch it writes, towards the
+    number of rows its batches are measured to write in that many seconds. Batches never exceed the `max_rows` a stream
+    was registered with, nor the rows estimated to fit in `max_buffer_memory`, and at most double from one batch to the
+    next, as small batches understate how fast rows are written.
+
+    So that many streams can be tracked cheaply, the streams with full buffers are noted as records are added to them,
+    and the flush watermarks of streams which have seen records are kept in a heap, so neither flushing nor emitting
+    STATE messages needs to look at every stream.
     """
 
-    def __init__(self, target, emit_states):
+    def __init__(self, target, emit_states, pipelined_flush=False, max_pending_batches=1, writer_targets=None,
+                 max_buffer_memory=None, max_batch_age=None, adaptive_batch_duration=None):
         self.target = target
         self.emit_states = emit_states
 
+        self.max_buffer_memory = max_buffer_memory
+        # Estimated bytes of memory used by the buffers of all streams
+        self.buffer_memory = 0
+
+        self.max_batch_age = max_batch_age
+        # dict of {'<stream_name>': number}, where the number is the `time.monotonic()` at which the stream's buffer
+        # received its oldest record. Only kept when `max_batch_age` is set, in order of the number.
+        self.buffered_since = {}
+
+        self.adaptive_batch_duration = adaptive_batch_duration
+        # dict of {'<stream_name>': number}, where the number is the `max_rows` the stream was registered with
+        self.stream_max_rows = {}
+
+        self.writer_targets = writer_targets or [target]
+        self.pipelined_flush = pipelined_flush
+        self.max_pending_batches = max_pending_batches
+        self.writers = None
+        if pipelined_flush or len(self.writer_targets) > 1:
+            self.writers = [ThreadPoolExecutor(max_workers=1) for _ in self.writer_targets]
+
+        # dict of {'<stream_name>': number}, where the number is the index of the writer target the stream is written through.
+        self.stream_writers = {}
+
+        # list of deques, one per writer target, containing tuples of (<stream_name>, watermark, <future of write_batch>)
+        self.pending_batches = [deque() for _ in self.writer_targets]
+
         self.streams = {}
 
         # dict of {'<stream_name>': number}, where the number is the message counter of the most recently received record for that stream. Will contain a value for all registered streams.
@@ -28,26 +87,98 @@ class StreamTracker:
         # dict of {'<stream_name>': number}, where the number is the message counter of the most recently flushed record for that stream. Will contain a value for all registered streams.
         self.stream_flush_watermarks = {}
 
+        # heap of (watermark, '<stream_name>') for the streams which have seen records. Entries whose watermark is no
+        # longer the stream's flush watermark are stale, and are dropped once they reach the top.
+        self.flush_watermark_heap = []
+
+        # dict of {'<stream_name>': None}, used as an ordered set of the streams whose buffers filled up since they
+        # were last flushed
+        self.full_streams = {}
+
         self.streams_added_to = set()  # list of stream names which have seen records
         self.state_queue = deque()  # contains dicts of {'state': <state blob>, 'watermark': number}
         self.message_counter = 0
         self.last_emitted_state = None
 
     def register_stream(self, stream, buffered_stream):
+        self.stream_writers[stream] = len(self.streams) % len(self.writer_targets)
         self.streams[stream] = buffered_stream
         self.stream_flush_watermarks[stream] = 0
+        self.stream_max_rows[stream] = buffered_stream.max_rows
+
+    def target_for(self, stream):
+        """
+        The writer target which `stream` is written through.
+        """
+        return self.writer_targets[self.stream_writers[stream]]
 
     def flush_stream(self, stream):
         self._write_batch_and_update_watermarks(stream)
+        self.wait_for_pending_batches()
         self._emit_safe_queued_states()
 
     def flush_streams(self, force=False):
-        for (stream, stream_buffer) in self.streams.items():
-            if force or stream_buffer.buffer_full:
+        if force:
+            for stream in self.streams:
                 self._write_batch_and_update_watermarks(stream)
+        else:
+            for stream in list(self.full_streams):
+                # A buffer can be emptied without being flushed, such as by a new table version
+                if self.streams[stream].buffer_full:
+                    self._write_batch_and_update_watermarks(stream)
+                else:
+                    del self.full_streams[stream]
+
+        if force or not self.pipelined_flush:
+            self.wait_for_pending_batches()
 
         self._emit_safe_queued_states(force=force)
 
+    def flush_aged_streams(self):
+        """
+        Flush the streams whose oldest buffered record was received more than `max_batch_age` seconds ago.
+        """
+        if not self.buffered_since:
+            return None
+
+        now = time.monotonic()
+        aged_streams = []
+        for stream, buffered_since in self.buffered_since.items():
+            if now - buffered_since < self.max_batch_age:
+                break
+            aged_streams.append(stream)
+
+        if not aged_streams:
+            return None
+
+        for stream in aged_streams:
+            self._write_batch_and_update_watermarks(stream)
+
+        if not self.pipelined_flush:
+            self.wait_for_pending_batches()
+
+        self._emit_safe_queued_states()
+
+    def wait_for_pending_batches(self):
+        for pending_batches in self.pending_batches:
+            while pending_batches:
+                self._complete_pending_batch(pending_batches)
+
+    def close(self):
+        """
+        Stop the background writers, if any. Batches which have not started writing yet are abandoned.
+        """
+        if self.writers is None:
+            return None
+
+        for pending_batches in self.pending_batches:
+            for _, _, future in pending_batches:
+                future.cancel()
+            pending_batches.clear()
+
+        for writer in self.writers:
+            writer.shutdown(wait=True)
+
     def handle_state_message(self, line_data):
         if self.emit_states:
             self.state_queue.append({'state': line_data['value'], 'watermark': self.message_counter})
@@ -58,27 +189,152 @@ class StreamTracker:
             raise TargetError('A record for stream {} was encountered before a corresponding schema'.format(stream))
 
         self.message_counter += 1
-        self.streams_added_to.add(stream)
+        if stream not in self.streams_added_to:
+            self.streams_added_to.add(stream)
+            heapq.heappush(self.flush_watermark_heap, (self.stream_flush_watermarks[stream], stream))
         self.stream_add_watermarks[stream] = self.message_counter
-        self.streams[stream].add_record_message(line_data)
+
+        stream_buffer = self.streams[stream]
+        buffer = stream_buffer.peek_buffer()
+        memory_size = stream_buffer.memory_size
+        stream_buffer.add_record_message(line_data)
+        self.buffer_memory += stream_buffer.memory_size - memory_size
+
+        if stream_buffer.buffer_full:
+            self.full_streams[stream] = None
+
+        if self.max_batch_age:
+            # A buffer can be emptied without being flushed, such as by a new table version, which restarts its age
+            if stream_buffer.peek_buffer() is not buffer:
+                self.buffered_since.pop(stream, None)
+            if stream_buffer.count > 0 and stream not in self.buffered_since:
+                self.buffered_since[stream] = time.monotonic()
+
+        if self.max_buffer_memory and self.buffer_memory > self.max_buffer_memory:
+            self._flush_to_buffer_memory()
+
+    def _flush_to_buffer_memory(self):
+        """
+        Flush the streams with the largest buffers until the memory used by all buffers is within `max_buffer_memory`.
+        """
+        while self.buffer_memory > self.max_buffer_memory:
+            ## Usually a single flush is enough, so the largest buffer is found rather than sorting all of them
+            stream = max(self.streams, key=lambda stream: self.streams[stream].memory_size)
+            if self.streams[stream].count == 0:
+                break
+
+            self._write_batch_and_update_watermarks(stream)
+
+        if not self.pipelined_flush:
+            self.wait_for_pending_batches()
+
+        self._emit_safe_queued_states()
 
     def _write_batch_and_update_watermarks(self, stream):
         stream_buffer = self.streams[stream]
-        self.target.write_batch(stream_buffer)
+        watermark = self.stream_add_watermarks.get(stream, 0)
+        writer = self.stream_writers[stream]
+
+        self.buffer_memory -= stream_buffer.memory_size
+        self.full_streams.pop(stream, None)
+        self.buffered_since.pop(stream, None)
+
+        if self.writers is None:
+            batch_timing = self._write_batch(writer, stream_buffer)
+            stream_buffer.flush_buffer()
+            self._update_flush_watermark(stream, watermark)
+            self._adapt_batch_rows(stream, *batch_timing)
+            return None
+
+        batch = stream_buffer.snapshot()
         stream_buffer.flush_buffer()
-        self.stream_flush_watermarks[stream] = self.stream_add_watermarks.get(stream, 0)
+        pending_batches = self.pending_batches[writer]
+        pending_batches.append((stream,
+                                watermark,
+                                self.writers[writer].submit(self._write_batch, writer, batch)))
+
+        while len(pending_batches) > self.max_pending_batches:
+            self._complete_pending_batch(pending_batches)
+
+    def _complete_pending_batch(self, pending_batches):
+        stream, watermark, future = pending_batches.popleft()
+        # Raises any exception from `write_batch` on this thread
+        batch_timing = future.result()
+        self._update_flush_watermark(stream, watermark)
+        self._adapt_batch_rows(stream, *batch_timing)
+
+    def _write_batch(self, writer, stream_buffer):
+        """
+        Write the buffer of `stream_buffer` through the writer target at index `writer`.
+        :return: (rows, estimated bytes of memory, seconds taken to write)
+        """
+        rows = stream_buffer.count
+        memory_size = stream_buffer.memory_size
+        started = time.monotonic()
+        self.writer_targets[writer].write_batch(stream_buffer)
+        return rows, memory_size, time.monotonic() - started
+
+    def _adapt_batch_rows(self, stream, rows, memory_size, duration):
+        if not self.adaptive_batch_duration or rows == 0:
+            return None
+
+        stream_buffer = self.streams[stream]
+
+        batch_rows = 2 * stream_buffer.max_rows
+        if duration > 0:
+            batch_rows = min(batch_rows, int(rows / duration * self.adaptive_batch_duration))
+        if self.max_buffer_memory and memory_size > 0:
+            batch_rows = min(batch_rows, int(self.max_buffer_memory * rows / memory_size))
+        batch_rows = min(max(batch_rows, MIN_ADAPTIVE_BATCH_ROWS), self.stream_max_rows[stream])
+
+        # Measurements vary from batch to batch, so small changes are left out
+        if abs(batch_rows - stream_buffer.max_rows) <= stream_buffer.max_rows / 10:
+            return None
+
+        LOGGER.info('Stream `{}` batches set to {} rows, from {}, having written {} rows in {:.3f}s'.format(
+            stream,
+            batch_rows,
+            stream_buffer.max_rows,
+            rows,
+            duration))
+        stream_buffer.max_rows = batch_rows
+
+    def _update_flush_watermark(self, stream, watermark):
+        self.stream_flush_watermarks[stream] = watermark
+
+        if stream in self.streams_added_to:
+            heapq.heappush(self.flush_watermark_heap, (watermark, stream))
+
+            # Stale entries below the top are only dropped here, once they outnumber the live ones
+            if len(self.flush_watermark_heap) > 2 * len(self.streams_added_to):
+                self.flush_watermark_heap = [(self.stream_flush_watermarks[added_stream], added_stream)
+                                             for added_stream in self.streams_added_to]
+                heapq.heapify(self.flush_watermark_heap)
+
+    def _safe_flush_threshold(self):
+        """
+        The least flush watermark of the streams which have seen records, or 0 when there are none.
+        """
+        heap = self.flush_watermark_heap
+        while heap and heap[0][0] != self.stream_flush_watermarks[heap[0][1]]:
+            heapq.heappop(heap)
+
+        return heap[0][0] if heap else 0
+
+    def _complete_written_batches(self):
+        for pending_batches in self.pending_batches:
+            while pending_batches and pending_batches[0][2].done():
+                self._complete_pending_batch(pending_batches)
 
     def _emit_safe_queued_states(self, force=False):
+        self._complete_written_batches()
+
         # State messages that occured before the least recently flushed record are safe to emit.
         # If they occurred after some records that haven't yet been flushed, they aren't safe to emit.
         # Because records arrive at different rates from different streams, we take the earliest unflushed record
         # as the threshold for what STATE messages are safe to emit. We ignore the threshold of 0 for streams that
         # have been registered (via a SCHEMA message) but where no records have arrived yet.
-        valid_flush_watermarks = []
-        for stream, watermark in self.stream_flush_watermarks.items():
-            if stream in self.streams_added_to:
-                valid_flush_watermarks.append(watermark)
-        safe_flush_threshold = min(valid_flush_watermarks, default=0)
+        safe_flush_threshold = self._safe_flush_threshold()
 
         emittable_state = None
         while len(self.state_queue) > 0 and (force or self.state_queue[0]['watermark'] <= safe_flush_threshold):
@@ -1,46 +1,59 @@
+import collections
 import http.client
 import io
 import json
 import pkg_resources
 import sys
 import threading
-import decimal
 
 import singer
 from singer import utils, metadata, metrics
 
 from target_postgres import json_schema
 from target_postgres.exceptions import TargetError
-from target_postgres.singer_stream import BufferedSingerStream, RAW_LINE_SIZE
+from target_postgres.json_decoder import LineDecoder
+from target_postgres.singer_stream import BufferedSingerStream, RAW_LINE_SIZE, VALIDATION_MODE_FULL
 from target_postgres.stream_tracker import StreamTracker
 
 LOGGER = singer.get_logger()
 
+# Lines read ahead of being handled, when lines are read in the background
+READ_AHEAD_LINES = 10000
 
-def main(target):
+
+def main(target, writer_targets=None):
     """
     Given a target, stream stdin input as a text stream.
     :param target: object which implements `write_batch` and `activate_version`
+    :param writer_targets: [optional] targets, each with their own connection, to write streams through concurrently
     :return: None
     """
     config = utils.parse_args([]).config
     input_stream = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8')
-    stream_to_target(input_stream, target, config=config)
+    stream_to_target(input_stream, target, config=config, writer_targets=writer_targets)
 
     return None
 
 
-def stream_to_target(stream, target, config={}):
+def stream_to_target(stream, target, config={}, writer_targets=None):
     """
     Persist `stream` to `target` with optional `config`.
     :param stream: iterator which represents a Singer data stream
     :param target: object which implements `write_batch` and `activate_version`
     :param config: [optional] configuration for buffers etc.
+    :param writer_targets: [optional] targets, each with their own connection, to write streams through concurrently
     :return: None
     """
 
     state_support = config.get('state_support', True)
-    state_tracker = StreamTracker(target, state_support)
+    state_tracker = StreamTracker(target,
+                                  state_support,
+                                  pipelined_flush=config.get('pipelined_flush', False),
+                                  max_pending_batches=config.get('max_pending_batches', 1),
+                                  writer_targets=writer_targets,
+                                  max_buffer_memory=config.get('max_buffer_memory'),
+                                  max_batch_age=config.get('max_batch_age'),
+                                  adaptive_batch_duration=config.get('adaptive_batch_duration'))
     _run_sql_hook('before_run_sql', config, target)
 
     try:
@@ -49,22 +62,42 @@ def stream_to_target(stream, target, config={}):
 
         invalid_records_detect = config.get('invalid_records_detect')
         invalid_records_threshold = config.get('invalid_records_threshold')
+        validation = {'mode': config.get('validation_mode'),
+                      'sample_rate': config.get('validation_sample_rate'),
+                      'first_n': config.get('validation_first_n'),
+                      'stream_modes': config.get('stream_validation_modes') or {}}
         max_batch_rows = config.get('max_batch_rows', 200000)
         max_batch_size = config.get('max_batch_size', 104857600)  # 100MB
+        memory_sample_interval = config.get('memory_sample_interval')
         batch_detection_threshold = config.get('batch_detection_threshold', max(max_batch_rows / 40, 50))
+        decoder = LineDecoder(config.get('json_backend'))
+
+        lines = stream
+        if state_tracker.max_batch_age:
+            ## Reading is moved off this thread so that aged buffers are still flushed while no lines arrive
+            lines = _read_lines_with_idle_ticks(stream, state_tracker.max_batch_age / 4)
 
         line_count = 0
-        for line in stream:
+        for line in lines:
+            if line is None:
+                state_tracker.flush_aged_streams()
+                continue
+
             _line_handler(state_tracker,
                           target,
                           invalid_records_detect,
                           invalid_records_threshold,
                           max_batch_rows,
                           max_batch_size,
+                          memory_sample_interval,
+                          validation,
+                          decoder,
                           line
                           )
             if line_count > 0 and line_count % batch_detection_threshold == 0:
                 state_tracker.flush_streams()
+            if state_tracker.max_batch_age:
+                state_tracker.flush_aged_streams()
             line_count += 1
 
         state_tracker.flush_streams(force=True)
@@ -76,9 +109,70 @@ def stream_to_target(stream, target, config={}):
         LOGGER.critical(e)
         raise e
     finally:
+        state_tracker.close()
         _report_invalid_records(state_tracker.streams)
 
 
+def _read_lines_with_idle_ticks(stream, interval):
+    """
+    Read the lines of `stream` on a background thread.
+    :param stream: iterator which represents a Singer data stream
+    :param interval: seconds
+    :return: generator of the lines of `stream`, and of `None` each time no line arrived for `interval` seconds
+    """
+    ## Lines are handed over on a `deque`, whose appends and pops take no lock. The events are only waited on when
+    ##  the handler has caught up with the reader, or the reader is `READ_AHEAD_LINES` ahead of the handler.
+    lines = collections.deque()
+    end_of_stream = object()
+    arrived = threading.Event()
+    drained = threading.Event()
+    stopped = threading.Event()
+
+    def hand_over(line):
+        lines.append(line)
+        if len(lines) <= 1:
+            arrived.set()
+        elif len(lines) >= READ_AHEAD_LINES:
+            drained.clear()
+            if len(lines) >= READ_AHEAD_LINES and not stopped.is_set():
+                drained.wait()
+
+    def read():
+        try:
+            for line in stream:
+                if stopped.is_set():
+                    return None
+                hand_over(line)
+            hand_over(end_of_stream)
+        except Exception as ex:
+            hand_over(ex)
+
+    threading.Thread(target=read, daemon=True).start()
+
+    try:
+        while True:
+            arrived.clear()
+            if not lines and not arrived.wait(interval):
+                yield None
+                continue
+
+            while lines:
+                line = lines.popleft()
+                if line is end_of_stream:
+                    return None
+                if isinstance(line, Exception):
+                    raise line
+
+                yield line
+
+            drained.set()
+    finally:
+        ## Unblock the reader if it is waiting for lines to be handled, so that it stops
+        stopped.set()
+        drained.set()
+        lines.clear()
+
+
 def _report_invalid_records(streams):
     for stream_buffer in streams.values():
         if stream_buffer.peek_invalid_records():
@@ -89,13 +183,19 @@ def _report_invalid_records(streams):
 
 
 def _line_handler(state_tracker, target, invalid_records_detect, invalid_records_threshold, max_batch_rows,
-                  max_batch_size, line):
+                  max_batch_size, memory_sample_interval, validation, decoder, line):
     try:
-        line_data = json.loads(line, parse_float=decimal.Decimal)
+        line_data = decoder.decode(line)
     except json.decoder.JSONDecodeError:
         LOGGER.error("Unable to parse JSON: {}".format(line))
         raise
 
+    ## RECORDs make up nearly all of a stream, so well formed ones skip the general checks below
+    if type(line_data) is dict and line_data.get('type') == 'RECORD' and 'stream' in line_data:
+        line_data[RAW_LINE_SIZE] = len(line)
+        state_tracker.handle_record_message(line_data['stream'], line_data)
+        return None
+
     if 'type' not in line_data:
         raise TargetError('`type` is a required key: {}'.format(line))
 
@@ -110,9 +210,12 @@ def _line_handler(state_tracker, target, invalid_records_detect, invalid_records
 
         schema = line_data['schema']
 
-        schema_validation_errors = json_schema.validation_errors(schema)
-        if schema_validation_errors:
-            raise TargetError('`schema` is an invalid JSON Schema instance: {}'.format(line), *schema_validation_errors)
+        ## A SCHEMA message resent as is was already validated when it was first seen
+        if stream not in state_tracker.streams or state_tracker.streams[stream].schema_fingerprint != line:
+            schema_validation_errors = json_schema.validation_errors(schema)
+            if schema_validation_errors:
+                raise TargetError('`schema` is an invalid JSON Schema instance: {}'.format(line),
+                                  *schema_validation_errors)
 
         if 'key_properties' in line_data:
             key_properties = line_data['key_properties']
@@ -124,7 +227,17 @@ def _line_handler(state_tracker, target, invalid_records_detect, invalid_records
                                                    schema,
                                                    key_properties,
                                                    invalid_records_detect=invalid_records_detect,
-                                                   invalid_records_threshold=invalid_records_threshold)
+                                                   invalid_records_threshold=invalid_records_threshold,
+                                                   validation_mode=validation['stream_modes'].get(stream,
+                                                                                                  validation['mode']),
+                                                   validation_sample_rate=validation['sample_rate'],
+                                                   validation_first_n=validation['first_n'],
+                                                   memory_sample_interval=memory_sample_interval,
+                                                   schema_fingerprint=line)
+            if buffered_stream.validation_mode != VALIDATION_MODE_FULL:
+                LOGGER.info('Stream {} validating records with `validation_mode` `{}`'.format(
+                    stream,
+                    buffered_stream.validation_mode))
             if max_batch_rows:
                 buffered_stream.max_rows = max_batch_rows
             if max_batch_size:
@@ -132,7 +245,7 @@ def _line_handler(state_tracker, target, invalid_records_detect, invalid_records
 
             state_tracker.register_stream(stream, buffered_stream)
         else:
-            state_tracker.streams[stream].update_schema(schema, key_properties)
+            state_tracker.streams[stream].update_schema(schema, key_properties, schema_fingerprint=line)
     elif line_data['type'] == 'RECORD':
         if 'stream' not in line_data:
             raise TargetError('`stream` is a required key: {}'.format(line))
@@ -150,7 +263,7 @@ def _line_handler(state_tracker, target, invalid_records_detect, invalid_records
 
         stream_buffer = state_tracker.streams[line_data['stream']]
         state_tracker.flush_stream(line_data['stream'])
-        target.activate_version(stream_buffer, line_data['version'])
+        state_tracker.target_for(line_data['stream']).activate_version(stream_buffer, line_data['version'])
     elif line_data['type'] == 'STATE':
         state_tracker.handle_state_message(line_data)
     else:
@@ -3,8 +3,10 @@ from copy import deepcopy
 
 import pytest
 
-from target_postgres import singer
+from target_postgres import denest, singer
+from target_postgres import singer_stream as singer_stream_module
 from target_postgres.singer_stream import BufferedSingerStream, SingerStreamError, RAW_LINE_SIZE
+from target_postgres.stream_tracker import StreamTracker
 
 from utils.fixtures import CatStream, InvalidCatStream, CATS_SCHEMA
 
@@ -53,6 +55,73 @@ def test_init__empty_key_properties():
     assert [] == rows_missing_pk
 
 
+def test_update_schema__denest_plan():
+    singer_stream = BufferedSingerStream(CATS_SCHEMA['stream'],
+                                         CATS_SCHEMA['schema'],
+                                         CATS_SCHEMA['key_properties'])
+
+    plan = singer_stream.denest_plan
+    assert ('adoption', 'immunizations') == plan['adoption'].object_node['immunizations'].table_path
+
+    ## Repeating the same schema keeps everything derived from it
+    singer_stream.update_schema(deepcopy(CATS_SCHEMA['schema']), CATS_SCHEMA['key_properties'])
+
+    assert plan is singer_stream.denest_plan
+
+    singer_stream.update_schema(CATS_SCHEMA['schema'], [])
+
+    assert plan is not singer_stream.denest_plan
+
+
+@pytest.mark.parametrize('pipelined_flush', [False, True])
+def test_update_schema__table_schemas(monkeypatch, pipelined_flush):
+    computed = []
+    to_table_schemas = denest.to_table_schemas
+
+    def recording_to_table_schemas(*args):
+        computed.append(args)
+        return to_table_schemas(*args)
+
+    monkeypatch.setattr(denest, 'to_table_schemas', recording_to_table_schemas)
+
+    singer_stream = BufferedSingerStream(CATS_SCHEMA['stream'],
+                                         CATS_SCHEMA['schema'],
+                                         CATS_SCHEMA['key_properties'])
+
+    ## With `pipelined_flush`, batches are written from `snapshot`s of the stream, which share its table schemas
+    class Target:
+        written = []
+
+        def write_batch(self, stream_buffer):
+            self.written.append(stream_buffer.table_schemas)
+
+    stream_tracker = StreamTracker(Target(), False, pipelined_flush=pipelined_flush)
+    stream_tracker.register_stream(CATS_SCHEMA['stream'], singer_stream)
+    stream = CatStream(10)
+    for _ in range(10):
+        stream_tracker.handle_record_message(CATS_SCHEMA['stream'], stream.generate_record_message())
+        stream_tracker.flush_streams(force=True)
+    stream_tracker.close()
+
+    table_schemas = singer_stream.table_schemas
+    assert [('adoption', 'immunizations'), ()] == sorted([table_schema['path'] for table_schema in table_schemas],
+                                                          reverse=True)
+    assert 10 == len(Target.written)
+    assert all(written is table_schemas for written in Target.written)
+
+    singer_stream.update_schema(deepcopy(CATS_SCHEMA['schema']), CATS_SCHEMA['key_properties'])
+
+    assert table_schemas is singer_stream.table_schemas
+    assert 1 == len(computed)
+
+    schema = deepcopy(CATS_SCHEMA['schema'])
+    del schema['properties']['adoption']
+    singer_stream.update_schema(schema, CATS_SCHEMA['key_properties'])
+
+    assert [()] == [table_schema['path'] for table_schema in singer_stream.table_schemas]
+    assert 2 == len(computed)
+
+
 def test_add_record_message():
     stream = CatStream(10)
     singer_stream = BufferedSingerStream(CATS_SCHEMA['stream'],
@@ -271,6 +340,86 @@ def test_add_record_message__invalid_record__cross_threshold():
     assert [] == missing_sdc_properties(singer_stream)
 
 
+def test_add_record_message__validation_mode__none():
+    stream = InvalidCatStream(10)
+    singer_stream = BufferedSingerStream(CATS_SCHEMA['stream'],
+                                         CATS_SCHEMA['schema'],
+                                         CATS_SCHEMA['key_properties'],
+                                         validation_mode='none')
+
+    for _ in range(10):
+        singer_stream.add_record_message(stream.generate_record_message())
+
+    assert not singer_stream.peek_invalid_records()
+    assert singer_stream.count == 10
+
+
+def test_add_record_message__validation_mode__first_n():
+    stream = InvalidCatStream(10)
+    singer_stream = BufferedSingerStream(CATS_SCHEMA['stream'],
+                                         CATS_SCHEMA['schema'],
+                                         CATS_SCHEMA['key_properties'],
+                                         invalid_records_detect=False,
+                                         validation_mode='first_n',
+                                         validation_first_n=3)
+
+    for _ in range(10):
+        singer_stream.add_record_message(stream.generate_record_message())
+
+    assert len(singer_stream.peek_invalid_records()) == 3
+    assert singer_stream.count == 7
+
+    ## Each schema restarts validation
+    singer_stream.update_schema(CATS_SCHEMA['schema'], CATS_SCHEMA['key_properties'])
+
+    for _ in range(10):
+        singer_stream.add_record_message(stream.generate_record_message())
+
+    assert len(singer_stream.peek_invalid_records()) == 6
+    assert singer_stream.count == 14
+
+
+def test_add_record_message__validation_mode__sample(monkeypatch):
+    stream = InvalidCatStream(10)
+    singer_stream = BufferedSingerStream(CATS_SCHEMA['stream'],
+                                         CATS_SCHEMA['schema'],
+                                         CATS_SCHEMA['key_properties'],
+                                         invalid_records_detect=False,
+                                         validation_mode='sample',
+                                         validation_sample_rate=0.5)
+
+    record_messages = [stream.generate_record_message() for _ in range(10)]
+
+    samples = iter([0.1, 0.9] * 5)
+    monkeypatch.setattr(singer_stream_module.random, 'random', lambda: next(samples))
+
+    for record_message in record_messages:
+        singer_stream.add_record_message(record_message)
+
+    assert len(singer_stream.peek_invalid_records()) == 5
+    assert singer_stream.count == 5
+
+
+def test_add_record_message__validation_mode__sample__threshold():
+    stream = InvalidCatStream(10)
+    singer_stream = BufferedSingerStream(CATS_SCHEMA['stream'],
+                                         CATS_SCHEMA['schema'],
+                                         CATS_SCHEMA['key_properties'],
+                                         validation_mode='sample',
+                                         validation_sample_rate=1)
+
+    with pytest.raises(SingerStreamError):
+        singer_stream.add_record_message(stream.generate_record_message())
+
+
+def test_init__invalid__validation_mode():
+    with pytest.raises(SingerStreamError, match=r'.*validation_mode.*'):
+        BufferedSingerStream(CATS_SCHEMA['stream'],
+                             CATS_SCHEMA['schema'],
+                             CATS_SCHEMA['key_properties'],
+                             validation_mode='sometimes')
+
+
 def mocked_mock_write_batch(stream_buffer):
     stream_buffer.flush_buffer()
 
@@ -317,6 +466,28 @@ def test_multiple_batches__by_memory():
     assert len(singer_stream.peek_buffer()) == 0
 
 
+def test_memory_size():
+    record_message = CatStream(1).generate_record_message()
+    record_message[RAW_LINE_SIZE] = 500
+
+    singer_stream = BufferedSingerStream(CATS_SCHEMA['stream'],
+                                         CATS_SCHEMA['schema'],
+                                         CATS_SCHEMA['key_properties'],
+                                         memory_sample_interval=3)
+
+    assert 0 == singer_stream.memory_size
+
+    for _ in range(10):
+        singer_stream.add_record_message(deepcopy(record_message))
+
+    ## Only the 1st, 4th, 7th and 10th records are measured, and all of them are the same
+    assert singer_stream.memory_size == pytest.approx(10 * singer_stream_module.get_memory_size(record_message), abs=1)
+
+    singer_stream.flush_buffer()
+
+    assert 0 == singer_stream.memory_size
+
+
 def test_multiple_batches__old_records__by_rows():
     stream_oldest = CatStream(100, version=0)
     stream_middle_aged = CatStream(100, version=5)
@@ -1,3 +1,4 @@
+from copy import deepcopy
 import random
 
 import pytest
@@ -279,6 +280,117 @@ def test__records__nested__child_table__a_b_c_e():
         assert bool == type(record[('g',)][1])
 
 
+def _column_rows(records, paths):
+    rows = []
+    for i in range(len(records)):
+        row = {}
+        for path in paths:
+            types, values = records.column(path)
+            if i < len(types) and types[i] is not None:
+                row[path] = (types[i], values[i])
+        rows.append(row)
+    return rows
+
+
+def test__records__columnar():
+    denested = error_check_denest(NESTED_SCHEMA, [], deepcopy(NESTED_RECORDS))
+    columnar = denest.to_table_batches(NESTED_SCHEMA, [], deepcopy(NESTED_RECORDS), columnar=True)
+
+    assert len(denested) == len(columnar)
+    for table_batch, columnar_batch in zip(denested, columnar):
+        assert table_batch['streamed_schema'] == columnar_batch['streamed_schema']
+
+        records = columnar_batch['records']
+        assert isinstance(records, denest.ColumnarRecords)
+        assert len(table_batch['records']) == len(records)
+        assert table_batch['records'] == _column_rows(records,
+                                                      table_batch['streamed_schema']['schema']['properties'])
+
+
+def test__records__columnar__missing_values():
+    table_batch = denest.to_table_batches({'properties': {'a': {'type': ['integer', 'string']},
+                                                          'b': {'type': 'boolean'}}},
+                                          [],
+                                          [{'a': 1}, {'a': 'one', 'b': True}, {}, {'a': None}],
+                                          columnar=True)[0]
+
+    assert 4 == len(table_batch['records'])
+    assert (['integer', 'string'], [1, 'one']) == table_batch['records'].column(('a',))
+    assert ([None, 'boolean'], [None, True]) == table_batch['records'].column(('b',))
+    assert ([], []) == table_batch['records'].column(('c',))
+
+
+def test__records__streaming():
+    denested = error_check_denest(NESTED_SCHEMA, [], deepcopy(NESTED_RECORDS))
+    streamed = denest.iter_table_batches(NESTED_SCHEMA, [], deepcopy(NESTED_RECORDS))
+
+    assert not isinstance(streamed, list)
+
+    streamed = list(streamed)
+    assert len(denested) == len(streamed)
+    for table_batch, streamed_batch in zip(denested, streamed):
+        assert table_batch['streamed_schema'] == streamed_batch['streamed_schema']
+
+        assert not isinstance(streamed_batch['records'], list)
+        assert table_batch['records'] == list(streamed_batch['records'])
+
+
+def test__records__streaming__columnar():
+    denested = error_check_denest(NESTED_SCHEMA, [], deepcopy(NESTED_RECORDS))
+    streamed = list(denest.iter_table_batches(NESTED_SCHEMA, [], deepcopy(NESTED_RECORDS), columnar=True))
+
+    assert len(denested) == len(streamed)
+    for table_batch, streamed_batch in zip(denested, streamed):
+        records = streamed_batch['records']
+        assert isinstance(records, denest.ColumnarRecords)
+        assert table_batch['records'] == _column_rows(records,
+                                                      table_batch['streamed_schema']['schema']['properties'])
+
+
+def test__records__plan():
+    plan = denest.compile_plan(json_schema.simplify(NESTED_SCHEMA))
+
+    assert ('a', 'b') == plan['a'].object_node['b'].table_path
+    assert ('a', 'b', 'c', 'e') == plan['a'].object_node['b'].table_node['c'].object_node['e'].table_path
+
+    without_plan = denest.to_table_batches(NESTED_SCHEMA, [], deepcopy(NESTED_RECORDS), plan=denest.compile_plan({}))
+
+    for _ in range(2):
+        ## Reusing a plan denests the same records to the same rows
+        with_plan = denest.to_table_batches(NESTED_SCHEMA, [], deepcopy(NESTED_RECORDS), plan=plan)
+        assert [table_batch['records'] for table_batch in without_plan] \
+               == [table_batch['records'] for table_batch in with_plan]
+
+
+def test__records__table_schemas():
+    table_schemas = denest.to_table_schemas(NESTED_SCHEMA, [])
+    unchanged = deepcopy(table_schemas)
+
+    without_table_schemas = denest.to_table_batches(NESTED_SCHEMA, [], deepcopy(NESTED_RECORDS))
+
+    for _ in range(2):
+        ## Reusing table schemas denests the same records to the same tables, and leaves the table schemas as they were
+        for with_table_schemas in (denest.to_table_batches(NESTED_SCHEMA, [], deepcopy(NESTED_RECORDS),
+                                                           table_schemas=table_schemas),
+                                   list(denest.iter_table_batches(NESTED_SCHEMA, [], deepcopy(NESTED_RECORDS),
+                                                                  table_schemas=table_schemas))):
+            assert [table_batch['streamed_schema'] for table_batch in without_table_schemas] \
+                   == [table_batch['streamed_schema'] for table_batch in with_table_schemas]
+        assert unchanged == table_schemas
+
+
+def test__records__plan__unknown_properties():
+    plan = denest.compile_plan({'properties': {'a': {'type': 'integer'}}})
+    schema = {'properties': {'a': {'type': 'integer'},
+                             'b': {'type': 'object',
+                                   'properties': {'c': {'type': 'string'}}}}}
+
+    records = denest.to_table_batches(schema, [], [{'a': 1, 'b': {'c': 'one'}}], plan=plan)[0]['records']
+
+    assert [{('a',): ('integer', 1), ('b', 'c'): ('string', 'one')}] == records
+    assert ('b', 'c') == plan['b'].object_node.column_paths['c']
+
+
 def test__anyOf__schema__stitch_date_times():
     denested = error_check_denest(
         {'properties': {
@@ -0,0 +1,59 @@
+from decimal import Decimal
+import json
+
+import pytest
+
+from target_postgres.exceptions import TargetError
+from target_postgres.json_decoder import JSON_BACKEND_ORJSON, JSON_BACKENDS, LineDecoder, orjson
+
+BACKENDS = [backend for backend in JSON_BACKENDS
+            if backend != JSON_BACKEND_ORJSON or orjson is not None]
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_decode__decimals_are_exact(backend):
+    line = '{"type": "RECORD", "stream": "test", "record": {"a": 1.10, "b": 1e-15, "c": 0.1234567890123456789, "d": [2.5]}}'
+    record = LineDecoder(backend).decode(line)['record']
+
+    assert record == {'a': Decimal('1.10'),
+                      'b': Decimal('1e-15'),
+                      'c': Decimal('0.1234567890123456789'),
+                      'd': [Decimal('2.5')]}
+    assert str(record['a']) == '1.10'
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_decode__matches_stdlib(backend):
+    lines = ['{"type": "RECORD", "stream": "test", "record": {"id": 1, "name": "\\u00e9t\\u00e9", "ok": true, "n": null}}\n',
+             '{"type": "STATE", "value": {"bookmarks": {"test": 123456789012345678901234567890}}}',
+             '{"type": "RECORD", "stream": "test", "record": {"a": NaN}}',
+             '[1, 2, 3]',
+             '"just a string"']
+
+    decoder = LineDecoder(backend)
+    for line in lines:
+        assert repr(decoder.decode(line)) == repr(json.loads(line, parse_float=Decimal))
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_decode__invalid(backend):
+    with pytest.raises(json.decoder.JSONDecodeError):
+        LineDecoder(backend).decode('{"type": "RECORD", "stream": ')
+
+
+def test_decode__invalid__backend():
+    with pytest.raises(TargetError, match=r'.*json_backend.*'):
+        LineDecoder('not-a-backend')
+
+
+@pytest.mark.skipif(orjson is None, reason='orjson is not installed')
+def test_decode__mostly_floats_falls_back_to_stdlib():
+    decoder = LineDecoder(JSON_BACKEND_ORJSON)
+
+    for i in range(LineDecoder.SAMPLE_LINES):
+        assert decoder.decode('{{"a": {}.5}}'.format(i)) == {'a': Decimal('{}.5'.format(i))}
+
+    assert decoder._stdlib_lines_remaining == LineDecoder.STDLIB_LINES
+
+    assert decoder.decode('{"a": 1}') == {'a': 1}
+    assert decoder._stdlib_lines_remaining == LineDecoder.STDLIB_LINES - 1
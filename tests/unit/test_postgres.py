@@ -1,14 +1,20 @@
 from copy import deepcopy
-from datetime import datetime
+import csv
+from datetime import datetime, timedelta, timezone
+import io
+import itertools
 import json
+import re
 
+import arrow
 import psycopg2
 from psycopg2 import sql
 import psycopg2.extras
 import pytest
 
-from utils.fixtures import CatStream, CONFIG, db_cleanup, MultiTypeStream, NestedStream, TEST_DB, TypeChangeStream, DogStream
+from utils.fixtures import CatStream, CONFIG, clear_db, db_cleanup, ListStream, MultiTypeStream, NestedStream, TEST_DB, TypeChangeStream, DogStream
 from target_postgres import json_schema, main, postgres, singer, singer_stream
+from target_postgres import target_tools
 from target_postgres.target_tools import TargetError
 
 
@@ -156,6 +162,35 @@ def assert_column_indexed(conn, table_name, column_name):
 
         assert len(cur.fetchall()) > 0
 
+
+def persisted_rows(cur, table_name, order_by=None):
+    """
+    The rows of `table_name` as dicts of column to value, leaving out `_sdc_batched_at` as it differs between loads.
+    """
+    cur.execute("set timezone='UTC';")
+    if order_by:
+        cur.execute('SELECT * FROM {} ORDER BY {}'.format(table_name, order_by))
+    else:
+        cur.execute('SELECT * FROM {}'.format(table_name))
+    columns = [desc[0] for desc in cur.description]
+    return [dict((column, value) for column, value in zip(columns, row) if column != '_sdc_batched_at')
+            for row in cur.fetchall()]
+
+
+def schema_message(stream, properties, key_properties):
+    return {'type': 'SCHEMA',
+            'stream': stream,
+            'schema': {'type': 'object',
+                       'properties': properties},
+            'key_properties': key_properties}
+
+
+def record_message(stream, record):
+    return {'type': 'RECORD',
+            'stream': stream,
+            'record': record}
+
+
 def test_loading__invalid__configuration__schema(db_cleanup):
     stream = CatStream(1)
     stream.schema = deepcopy(stream.schema)
@@ -1822,6 +1857,131 @@ def test_upsert(db_cleanup):
         assert_records(conn, stream.records, 'cats', 'id')
 
 
+def test_upsert__unique_key_indexes(db_cleanup):
+    config = CONFIG.copy()
+    config['add_unique_key_indexes'] = True
+
+    stream = CatStream(100, nested_count=2)
+
+    with psycopg2.connect(cursor_factory=QueryRecordingCursor, **TEST_DB) as conn:
+        if conn.server_version < 90500:
+            pytest.skip('`ON CONFLICT` requires PostgreSQL 9.5 or later')
+
+        target = postgres.PostgresTarget(conn, add_unique_key_indexes=True)
+        QueryRecordingCursor.queries = []
+        target_tools.stream_to_target(stream, target, config=config)
+
+    ## The root table is merged with `ON CONFLICT`, its subtable is not
+    assert 1 == len([q for q in QueryRecordingCursor.queries if 'ON CONFLICT' in q])
+    assert 1 == len([q for q in QueryRecordingCursor.queries if 'DELETE FROM' in q])
+
+    with psycopg2.connect(**TEST_DB) as conn:
+        with conn.cursor() as cur:
+            cur.execute('''
+                SELECT indexdef FROM pg_indexes WHERE tablename = 'cats' AND indexdef LIKE 'CREATE UNIQUE INDEX%'
+            ''')
+            assert [indexdef.split(' USING ')[1] for indexdef, in cur.fetchall()] == ['btree (id)']
+
+            cur.execute(get_count_sql('cats'))
+            assert cur.fetchone()[0] == 100
+            cur.execute(get_count_sql('cats__adoption__immunizations'))
+            assert cur.fetchone()[0] == 200
+        assert_records(conn, stream.records, 'cats', 'id')
+
+    stream = CatStream(200, nested_count=1, duplicates=10)
+    main(config, input_stream=stream)
+
+    with psycopg2.connect(**TEST_DB) as conn:
+        with conn.cursor() as cur:
+            cur.execute(get_count_sql('cats'))
+            assert cur.fetchone()[0] == 200
+            cur.execute(get_count_sql('cats__adoption__immunizations'))
+            assert cur.fetchone()[0] == 200
+        assert_records(conn, stream.records, 'cats', 'id')
+
+    ## Records with an older sequence do not overwrite newer ones
+    main(config, input_stream=CatStream(200, sequence=1))
+
+    with psycopg2.connect(**TEST_DB) as conn:
+        assert_records(conn, stream.records, 'cats', 'id')
+
+
+def test_upsert__unique_key_indexes__disabled(db_cleanup):
+    with psycopg2.connect(cursor_factory=QueryRecordingCursor, **TEST_DB) as conn:
+        target = postgres.PostgresTarget(conn)
+        QueryRecordingCursor.queries = []
+        target_tools.stream_to_target(CatStream(100), target, config=CONFIG)
+
+    ## Tables are not looked up for unique indexes unless `add_unique_key_indexes` is set
+    assert not [q for q in QueryRecordingCursor.queries if 'pg_index' in q]
+    assert not [q for q in QueryRecordingCursor.queries if 'ON CONFLICT' in q]
+
+
+def test_upsert__unique_key_indexes__old_server(db_cleanup):
+    class OldServerConnection(psycopg2.extensions.connection):
+        server_version = 90425
+
+    with psycopg2.connect(connection_factory=OldServerConnection, **TEST_DB) as conn:
+        postgres.PostgresTarget(conn)
+
+        with pytest.raises(postgres.PostgresError, match=r'.*add_unique_key_indexes.*9\.5.*'):
+            postgres.PostgresTarget(conn, add_unique_key_indexes=True)
+
+
+def test_loading__no_key_properties__append_only(db_cleanup):
+    config = CONFIG.copy()
+    config['max_batch_rows'] = 20
+    config['batch_detection_threshold'] = 5
+
+    stream = MultiTypeStream(50)
+
+    with psycopg2.connect(cursor_factory=QueryRecordingCursor, **TEST_DB) as conn:
+        target = postgres.PostgresTarget(conn)
+        QueryRecordingCursor.queries = []
+        target_tools.stream_to_target(stream, target, config=config)
+
+    ## Rows are copied straight into their tables, without staging tables or a merge
+    assert [] == [q for q in QueryRecordingCursor.queries if 'tmp_' in q]
+    assert 0 < len([q for q in QueryRecordingCursor.queries if q.startswith('COPY "public"."root"')])
+
+    with psycopg2.connect(**TEST_DB) as conn:
+        with conn.cursor() as cur:
+            cur.execute(get_count_sql('root'))
+            assert cur.fetchone()[0] == 50
+            cur.execute(get_count_sql('root__every_type'))
+            assert cur.fetchone()[0] == sum(len(record['every_type'])
+                                            for record in stream.records
+                                            if isinstance(record['every_type'], list))
+
+
+def test_loading__no_key_properties__streamed_primary_keys_are_merged(db_cleanup):
+    config = CONFIG.copy()
+    config['max_batch_rows'] = 2
+    config['batch_detection_threshold'] = 1
+
+    class EventStream(ListStream):
+        stream = [schema_message('events',
+                                 {'_sdc_primary_key': {'type': 'string'},
+                                  'name': {'type': 'string'}},
+                                 [])] \
+                 + [record_message('events', {'_sdc_primary_key': 'a', 'name': 'first'}),
+                    record_message('events', {'_sdc_primary_key': 'b', 'name': 'first'}),
+                    record_message('events', {'_sdc_primary_key': 'a', 'name': 'second'}),
+                    record_message('events', {'name': 'generated'})]
+
+    with psycopg2.connect(**TEST_DB) as conn:
+        target = postgres.PostgresTarget(conn)
+        target_tools.stream_to_target(EventStream(), target, config=config)
+
+    with psycopg2.connect(**TEST_DB) as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT _sdc_primary_key, name FROM events WHERE name != 'generated' ORDER BY name")
+            assert [('b', 'first'), ('a', 'second')] == cur.fetchall()
+
+            cur.execute("SELECT COUNT(*) FROM events WHERE name = 'generated'")
+            assert 1 == cur.fetchone()[0]
+
+
 def test_upsert__invalid__primary_key_change(db_cleanup):
     stream = CatStream(100)
     main(CONFIG, input_stream=stream)
@@ -1912,9 +2072,13 @@ def test_full_table_replication(db_cleanup):
     assert older_version_count == version_2_count
 
 
-def test_deduplication_newer_rows(db_cleanup):
+@pytest.mark.parametrize('dedupe_batches', [False, True])
+def test_deduplication_newer_rows(db_cleanup, dedupe_batches):
+    config = CONFIG.copy()
+    config['dedupe_batches'] = dedupe_batches
+
     stream = CatStream(100, nested_count=3, duplicates=2)
-    main(CONFIG, input_stream=stream)
+    main(config, input_stream=stream)
 
     with psycopg2.connect(**TEST_DB) as conn:
         with conn.cursor() as cur:
@@ -1935,9 +2099,13 @@ def test_deduplication_newer_rows(db_cleanup):
         assert record[0] == stream.sequence + 200
 
 
-def test_deduplication_older_rows(db_cleanup):
+@pytest.mark.parametrize('dedupe_batches', [False, True])
+def test_deduplication_older_rows(db_cleanup, dedupe_batches):
+    config = CONFIG.copy()
+    config['dedupe_batches'] = dedupe_batches
+
     stream = CatStream(100, nested_count=2, duplicates=2, duplicate_sequence_delta=-100)
-    main(CONFIG, input_stream=stream)
+    main(config, input_stream=stream)
 
     with psycopg2.connect(**TEST_DB) as conn:
         with conn.cursor() as cur:
@@ -1958,6 +2126,24 @@ def test_deduplication_older_rows(db_cleanup):
         assert record[0] == stream.sequence
 
 
+def test_deduplication__dedupe_batches__superseded_rows_are_not_sent(db_cleanup):
+    stream = CatStream(100, nested_count=3, duplicates=10)
+    schema = json.loads(next(stream))
+
+    stream_buffer = singer_stream.BufferedSingerStream(schema['stream'],
+                                                       schema['schema'],
+                                                       schema['key_properties'])
+    for line in stream:
+        stream_buffer.add_record_message(json.loads(line))
+    assert stream_buffer.count == 110
+
+    with psycopg2.connect(**TEST_DB) as conn:
+        written = postgres.PostgresTarget(conn, dedupe_batches=True).write_batch(stream_buffer)
+
+    assert written == {'records_persisted': 110,
+                       'rows_persisted': 100 + 300}
+
+
 def test_deduplication_existing_new_rows(db_cleanup):
     stream = CatStream(100, nested_count=2)
     main(CONFIG, input_stream=stream)
@@ -2112,3 +2298,575 @@ def test_before_run_sql_is_executed_upon_construction(db_cleanup):
 
             cur.execute("SELECT table_name FROM information_schema.tables WHERE table_schema='public' AND table_name='after_sql_test';")
             assert cur.fetchone()[0] == 'after_sql_test'
+
+
+def test_before_run_sql_is_executed_on_every_writer_connection(db_cleanup):
+    config = CONFIG.copy()
+    config['parallel_writers'] = 3
+    config['before_run_sql'] = 'CREATE TABLE IF NOT EXISTS before_sql_runs ( pid integer ); ' \
+                               'INSERT INTO before_sql_runs VALUES ( pg_backend_pid() );'
+
+    main(config, input_stream=CatStream(100))
+
+    with psycopg2.connect(**TEST_DB) as conn:
+        with conn.cursor() as cur:
+            cur.execute('SELECT COUNT(DISTINCT pid) FROM before_sql_runs;')
+            assert cur.fetchone()[0] == 3
+
+
+def test_csv_stream__matches_row_by_row_encoding():
+    headers = ['id', 'name', 'value']
+    rows = [{'id': i,
+             'name': 'row, "{}"\n'.format(i),
+             'value': postgres.RESERVED_NULL_DEFAULT if i % 3 == 0 else i / 7}
+            for i in range(1000)]
+
+    expected = ''
+    for row in rows:
+        with io.StringIO() as out:
+            writer = csv.DictWriter(out, headers)
+            writer.writerow(row)
+            expected += out.getvalue()
+
+    for size in [1, 7, 8192, postgres.COPY_BUFFER_SIZE, -1]:
+        csv_stream = postgres.CSVStream(rows, headers)
+
+        chunks = []
+        chunk = csv_stream.read(size)
+        while chunk:
+            if size > 0:
+                assert len(chunk) <= size
+            chunks.append(chunk)
+            chunk = csv_stream.read(size)
+
+        assert ''.join(chunks) == expected
+        assert csv_stream.count == len(rows)
+
+
+def test_loading__binary_copy(db_cleanup):
+    config = CONFIG.copy()
+    config['copy_format'] = 'binary'
+
+    stream = CatStream(100)
+    lines = list(stream)
+    main(CONFIG, input_stream=iter(lines))
+
+    with psycopg2.connect(**TEST_DB) as conn:
+        with conn.cursor() as cur:
+            csv_cats = persisted_rows(cur, 'cats', 'id')
+            csv_immunizations = persisted_rows(cur, 'cats__adoption__immunizations',
+                                               '_sdc_source_key_id, _sdc_level_0_id')
+
+    clear_db()
+    main(config, input_stream=iter(lines))
+
+    with psycopg2.connect(**TEST_DB) as conn:
+        with conn.cursor() as cur:
+            assert persisted_rows(cur, 'cats', 'id') == csv_cats
+            assert persisted_rows(cur, 'cats__adoption__immunizations',
+                                  '_sdc_source_key_id, _sdc_level_0_id') == csv_immunizations
+
+
+def test_loading__binary_copy__multi_types_and_nesting(db_cleanup):
+    config = CONFIG.copy()
+    config['copy_format'] = 'binary'
+
+    main(config, input_stream=MultiTypeStream(50))
+
+    with psycopg2.connect(**TEST_DB) as conn:
+        with conn.cursor() as cur:
+            cur.execute(sql.SQL('SELECT {} FROM {}').format(
+                sql.Identifier('number_which_only_comes_as_integer'),
+                sql.Identifier('root')
+            ))
+            assert 50 == len([x for x in cur.fetchall() if isinstance(x[0], float)])
+
+    clear_db()
+    main(config, input_stream=NestedStream(10))
+
+    with psycopg2.connect(**TEST_DB) as conn:
+        with conn.cursor() as cur:
+            cur.execute(get_count_sql('root'))
+            assert 10 == cur.fetchone()[0]
+
+            cur.execute(get_count_sql('root__array_of_array___sdc_value___sdc_value'))
+            assert 200 == cur.fetchone()[0]
+
+
+def test_loading__binary_copy__reserved_null_default(db_cleanup):
+    config = CONFIG.copy()
+    config['copy_format'] = 'binary'
+
+    class NullNameCatStream(CatStream):
+        def generate_record(self):
+            record = CatStream.generate_record(self)
+            record['pattern'] = postgres.RESERVED_NULL_DEFAULT
+            return record
+
+    main(config, input_stream=NullNameCatStream(10))
+
+    with psycopg2.connect(**TEST_DB) as conn:
+        with conn.cursor() as cur:
+            cur.execute('SELECT DISTINCT pattern FROM cats')
+            assert cur.fetchall() == [(postgres.RESERVED_NULL_DEFAULT,)]
+
+
+@pytest.mark.parametrize('copy_format', ['csv', 'binary'])
+def test_loading__columnar_batches(db_cleanup, copy_format):
+    config = CONFIG.copy()
+    config['copy_format'] = copy_format
+
+    stream = CatStream(100)
+    lines = list(stream)
+    main(config, input_stream=iter(lines))
+
+    with psycopg2.connect(**TEST_DB) as conn:
+        with conn.cursor() as cur:
+            cats = persisted_rows(cur, 'cats', 'id')
+            immunizations = persisted_rows(cur, 'cats__adoption__immunizations',
+                                           '_sdc_source_key_id, _sdc_level_0_id')
+
+    clear_db()
+    config['columnar_batches'] = True
+    main(config, input_stream=iter(lines))
+
+    with psycopg2.connect(**TEST_DB) as conn:
+        with conn.cursor() as cur:
+            assert persisted_rows(cur, 'cats', 'id') == cats
+            assert persisted_rows(cur, 'cats__adoption__immunizations',
+                                  '_sdc_source_key_id, _sdc_level_0_id') == immunizations
+
+
+def test_loading__columnar_batches__multi_types_and_nesting(db_cleanup):
+    config = CONFIG.copy()
+    config['columnar_batches'] = True
+
+    main(config, input_stream=MultiTypeStream(50))
+
+    with psycopg2.connect(**TEST_DB) as conn:
+        with conn.cursor() as cur:
+            cur.execute(sql.SQL('SELECT {} FROM {}').format(
+                sql.Identifier('number_which_only_comes_as_integer'),
+                sql.Identifier('root')
+            ))
+            assert 50 == len([x for x in cur.fetchall() if isinstance(x[0], float)])
+
+    clear_db()
+    main(config, input_stream=NestedStream(10))
+
+    with psycopg2.connect(**TEST_DB) as conn:
+        with conn.cursor() as cur:
+            cur.execute(get_count_sql('root'))
+            assert 10 == cur.fetchone()[0]
+
+            cur.execute(get_count_sql('root__array_of_array___sdc_value___sdc_value'))
+            assert 200 == cur.fetchone()[0]
+
+
+@pytest.mark.parametrize('columnar_batches', [False, True])
+def test_loading__streaming_batches(db_cleanup, columnar_batches):
+    config = CONFIG.copy()
+    config['columnar_batches'] = columnar_batches
+
+    lines = list(CatStream(100, nested_count=3))
+    nested_lines = list(NestedStream(10))
+
+    ## Rows are compared regardless of order, as `_sdc_sequence` need not tell them apart
+    def all_persisted_rows():
+        with psycopg2.connect(**TEST_DB) as conn:
+            with conn.cursor() as cur:
+                return [sorted(repr(sorted(row.items())) for row in persisted_rows(cur, table_name))
+                        for table_name in ['cats',
+                                           'cats__adoption__immunizations',
+                                           'root',
+                                           'root__array_of_array___sdc_value___sdc_value']]
+
+    main(config, input_stream=iter(lines))
+    main(config, input_stream=iter(nested_lines))
+    eager = all_persisted_rows()
+
+    clear_db()
+    config['streaming_batches'] = True
+    main(config, input_stream=iter(lines))
+    main(config, input_stream=iter(nested_lines))
+
+    streamed = all_persisted_rows()
+    assert 200 == len(streamed[3])
+    assert eager == streamed
+
+
+def test_loading__field_names_are_resolved_once_per_table_batch(db_cleanup, monkeypatch):
+    resolved = []
+    field_name = postgres.PostgresTarget._serialize_table_record_field_name
+
+    def recording_field_name(self, remote_schema, path, value_json_schema):
+        resolved.append((remote_schema['name'], path, value_json_schema.get('format', value_json_schema['type'])))
+        return field_name(self, remote_schema, path, value_json_schema)
+
+    monkeypatch.setattr(postgres.PostgresTarget, '_serialize_table_record_field_name', recording_field_name)
+
+    stream = CatStream(100, nested_count=2)
+    main(CONFIG, input_stream=stream)
+
+    assert len(resolved) == len(set(resolved))
+
+    with psycopg2.connect(**TEST_DB) as conn:
+        assert_records(conn, stream.records, 'cats', 'id')
+
+
+@pytest.mark.parametrize('value', ['2001-01-01T01:01:01',
+                                   '2001-01-01T01:01:01Z',
+                                   '2001-01-01 01:01:01.0001+01:01',
+                                   '2001-01-01T01:01:01.123456789+01:01',
+                                   '2001-01-01T01:01:01.99999+0530',
+                                   '2001-01-01T01:01:01.5-08:00',
+                                   '2001-01-01T01:01:01-00:00',
+                                   '2019-07-24T13:04:05.000000Z',
+                                   '2001-01-01',
+                                   '2001-01-01T01:01',
+                                   'Mon, 01 Jan 2001 01:01:01 +0000'])
+def test_serialize_table_record_datetime_value__matches_arrow(value):
+    try:
+        expected = arrow.get(value)
+    except Exception:
+        with pytest.raises(Exception):
+            postgres._serialize_datetime_text(value)
+        return None
+
+    assert expected.format('YYYY-MM-DD HH:mm:ss.SSSSZZ') == postgres._serialize_datetime_text(value)
+
+    expected = expected.datetime
+    expected -= timedelta(microseconds=expected.microsecond % 100)
+    actual = postgres._serialize_datetime_binary(value)
+    assert expected == actual
+    assert expected.utcoffset() == actual.utcoffset()
+
+
+@pytest.mark.parametrize('value', ['2001-01-01T25:01:01', '2001-01-01T01:01:01+24:00', '2001-01-01T01:01:01-99:00'])
+def test_serialize_table_record_datetime_value__out_of_range_is_left_to_arrow(value):
+    assert postgres._parse_iso_8601(value) is None
+
+    try:
+        expected = arrow.get(value)
+    except Exception:
+        with pytest.raises(Exception):
+            postgres._serialize_datetime_text(value)
+        with pytest.raises(Exception):
+            postgres._serialize_datetime_binary(value)
+        return None
+
+    assert expected.format('YYYY-MM-DD HH:mm:ss.SSSSZZ') == postgres._serialize_datetime_text(value)
+
+    expected = expected.datetime
+    expected = expected.replace(tzinfo=None) - expected.tzinfo.utcoffset(expected)
+    actual = postgres._serialize_datetime_binary(value)
+    assert expected == actual.astimezone(timezone.utc).replace(tzinfo=None)
+    assert postgres._binary_timestamptz(actual)
+
+
+
+def test_loading__invalid__copy_format(db_cleanup):
+    config = CONFIG.copy()
+    config['copy_format'] = 'parquet'
+
+    with pytest.raises(postgres.PostgresError, match=r'.*copy_format.*'):
+        main(config, input_stream=CatStream(1))
+
+
+class QueryRecordingCursor(psycopg2.extensions.cursor):
+    queries = []
+
+    def execute(self, query, vars=None):
+        if isinstance(query, sql.Composable):
+            query = query.as_string(self)
+        QueryRecordingCursor.queries.append(query)
+        return super(QueryRecordingCursor, self).execute(query, vars)
+
+    def copy_expert(self, query, file, size=8192):
+        if isinstance(query, sql.Composable):
+            query = query.as_string(self)
+        QueryRecordingCursor.queries.append(query)
+        return super(QueryRecordingCursor, self).copy_expert(query, file, size)
+
+
+def test_loading__table_changes_are_batched(db_cleanup):
+    def schema_change_queries():
+        return [q for q in QueryRecordingCursor.queries if 'ALTER TABLE' in q or 'COMMENT ON TABLE' in q]
+
+    with psycopg2.connect(cursor_factory=QueryRecordingCursor, **TEST_DB) as conn:
+        QueryRecordingCursor.queries = []
+        target_tools.stream_to_target(CatStream(20), postgres.PostgresTarget(conn), config=CONFIG)
+
+    ## Every column of a new table is added in a single round trip, along with its metadata
+    cats_queries = [q for q in schema_change_queries() if '"public"."cats" ' in q]
+    assert 1 == len([q for q in cats_queries if 'ADD COLUMN' in q])
+    assert 1 == len([q for q in cats_queries if 'ADD COLUMN' in q and 'COMMENT ON TABLE' in q])
+    assert 1 == len([q for q in cats_queries if q.count('ADD COLUMN') == 14])
+
+    class NameDateTimeCatStream(CatStream):
+        def generate_record(self):
+            record = CatStream.generate_record(self)
+            record['id'] = record['id'] + 20
+            record['name'] = '2001-01-01 01:01:01.0001+01:01'
+            record['bio'] = None
+            return record
+
+    stream = NameDateTimeCatStream(20)
+    stream.schema = deepcopy(stream.schema)
+    stream.schema['schema']['properties']['name'] = {'type': 'string',
+                                                     'format': 'date-time'}
+    stream.schema['schema']['properties']['bio'] = {'type': ['string', 'null']}
+
+    with psycopg2.connect(cursor_factory=QueryRecordingCursor, **TEST_DB) as conn:
+        QueryRecordingCursor.queries = []
+        target_tools.stream_to_target(stream, postgres.PostgresTarget(conn), config=CONFIG)
+
+    ## Splitting `name` and making `bio` nullable are sent together, with their data migration kept in order
+    cats_queries = [q for q in schema_change_queries() if '"public"."cats" ' in q]
+    assert 1 == len(cats_queries)
+    assert cats_queries[0].index('ADD COLUMN "name__s"') \
+           < cats_queries[0].index('UPDATE') \
+           < cats_queries[0].index('DROP COLUMN "name"')
+    assert 'ALTER COLUMN "bio" DROP NOT NULL' in cats_queries[0]
+
+    with psycopg2.connect(**TEST_DB) as conn:
+        with conn.cursor() as cur:
+            assert_columns_equal(cur,
+                                 'cats',
+                                 {
+                                     ('_sdc_batched_at', 'timestamp with time zone', 'YES'),
+                                     ('_sdc_received_at', 'timestamp with time zone', 'YES'),
+                                     ('_sdc_sequence', 'bigint', 'YES'),
+                                     ('_sdc_table_version', 'bigint', 'YES'),
+                                     ('adoption__adopted_on', 'timestamp with time zone', 'YES'),
+                                     ('adoption__was_foster', 'boolean', 'YES'),
+                                     ('age', 'bigint', 'YES'),
+                                     ('id', 'bigint', 'NO'),
+                                     ('name__s', 'text', 'YES'),
+                                     ('name__t', 'timestamp with time zone', 'YES'),
+                                     ('bio', 'text', 'YES'),
+                                     ('paw_size', 'bigint', 'NO'),
+                                     ('paw_colour', 'text', 'NO'),
+                                     ('flea_check_complete', 'boolean', 'NO'),
+                                     ('pattern', 'text', 'YES')
+                                 })
+
+            cur.execute('SELECT count(name__s), count(name__t), count(bio) FROM cats')
+            assert cur.fetchone() == (20, 20, 20)
+
+
+def test_loading__catalog_is_cached_across_batches(db_cleanup):
+    config = CONFIG.copy()
+    config['max_batch_rows'] = 20
+    config['batch_detection_threshold'] = 5
+
+    stream = CatStream(100, nested_count=2)
+
+    with psycopg2.connect(cursor_factory=QueryRecordingCursor, **TEST_DB) as conn:
+        target = postgres.PostgresTarget(conn)
+        QueryRecordingCursor.queries = []
+        target_tools.stream_to_target(stream, target, config=config)
+
+    write_batches = len([q for q in QueryRecordingCursor.queries if 'COPY' in q])
+    mapping_queries = len([q for q in QueryRecordingCursor.queries if 'pg_class' in q])
+    column_queries = len([q for q in QueryRecordingCursor.queries if 'information_schema.columns' in q])
+    empty_table_queries = len([q for q in QueryRecordingCursor.queries if 'SELECT EXISTS (SELECT * FROM' in q])
+
+    ## 5 batches of 2 tables each
+    assert write_batches == 10
+    ## Initial setup, plus one refresh per newly mapped table
+    assert mapping_queries == 3
+    assert column_queries < write_batches
+    ## Unchanged streamed schemas skip `upsert_table_helper` after their first batch
+    assert empty_table_queries == 2
+
+    with psycopg2.connect(**TEST_DB) as conn:
+        with conn.cursor() as cur:
+            cur.execute(get_count_sql('cats'))
+            assert cur.fetchone()[0] == 100
+            cur.execute(get_count_sql('cats__adoption__immunizations'))
+            assert cur.fetchone()[0] == 200
+        assert_records(conn, stream.records, 'cats', 'id')
+
+
+def test_loading__catalog_cache__invalidated_on_rollback(db_cleanup):
+    main(CONFIG, input_stream=CatStream(10))
+
+    with psycopg2.connect(**TEST_DB) as conn:
+        with conn.cursor() as cur:
+            target = postgres.PostgresTarget(conn)
+            target.setup_table_mapping_cache(cur)
+            assert target.get_table_schema(cur, 'cats')
+            assert target._table_metadata_cache.get('cats')
+
+            cur.execute('BEGIN;')
+            target.add_column(cur, 'cats', 'rolled_back', json_schema.make_nullable({'type': 'string'}))
+            assert 'rolled_back' in target.get_table_schema(cur, 'cats')['schema']['properties']
+            target._rollback(cur)
+
+            assert target.table_mapping_cache is None
+            assert not target._table_metadata_cache
+            assert not target._table_columns_cache
+            assert 'rolled_back' not in target.get_table_schema(cur, 'cats')['schema']['properties']
+
+
+def test_loading__schema_change_after_unchanged_batches(db_cleanup):
+    config = CONFIG.copy()
+    config['max_batch_rows'] = 2
+    config['batch_detection_threshold'] = 1
+
+    class WidgetStream(ListStream):
+        stream = [schema_message('widgets', {'id': {'type': 'integer'}}, ['id'])] \
+                 + [record_message('widgets', {'id': i}) for i in range(4)] \
+                 + [schema_message('widgets',
+                                   {'id': {'type': 'integer'},
+                                    'colour': {'type': ['null', 'string']}},
+                                   ['id'])] \
+                 + [record_message('widgets', {'id': i, 'colour': 'red'}) for i in range(4, 8)]
+
+    with psycopg2.connect(**TEST_DB) as conn:
+        target = postgres.PostgresTarget(conn)
+        target_tools.stream_to_target(WidgetStream(), target, config=config)
+
+    with psycopg2.connect(**TEST_DB) as conn:
+        with conn.cursor() as cur:
+            cur.execute('SELECT id, colour FROM widgets ORDER BY id')
+            assert cur.fetchall() == [(0, None), (1, None), (2, None), (3, None),
+                                      (4, 'red'), (5, 'red'), (6, 'red'), (7, 'red')]
+
+
+def test_loading__pipelined_flush(db_cleanup):
+    config = CONFIG.copy()
+    config['max_batch_rows'] = 20
+    config['batch_detection_threshold'] = 5
+    config['pipelined_flush'] = True
+    config['max_pending_batches'] = 2
+
+    stream = CatStream(100, nested_count=2)
+    main(config, input_stream=stream)
+
+    with psycopg2.connect(**TEST_DB) as conn:
+        with conn.cursor() as cur:
+            cur.execute(get_count_sql('cats'))
+            assert cur.fetchone()[0] == 100
+            cur.execute(get_count_sql('cats__adoption__immunizations'))
+            assert cur.fetchone()[0] == 200
+        assert_records(conn, stream.records, 'cats', 'id')
+
+
+def test_loading__parallel_writers(db_cleanup):
+    config = CONFIG.copy()
+    config['max_batch_rows'] = 20
+    config['batch_detection_threshold'] = 5
+    config['parallel_writers'] = 2
+
+    cat_stream = CatStream(100, version=1, nested_count=2)
+    dog_stream = DogStream(50, version=1, nested_count=3)
+    lines = [line
+             for lines in itertools.zip_longest(cat_stream, dog_stream)
+             for line in lines
+             if line is not None]
+
+    main(config, input_stream=iter(lines))
+
+    with psycopg2.connect(**TEST_DB) as conn:
+        with conn.cursor() as cur:
+            cur.execute(get_count_sql('cats'))
+            assert cur.fetchone()[0] == 100
+            cur.execute(get_count_sql('cats__adoption__immunizations'))
+            assert cur.fetchone()[0] == 200
+            cur.execute(get_count_sql('dogs'))
+            assert cur.fetchone()[0] == 50
+            cur.execute(get_count_sql('dogs__adoption__immunizations'))
+            assert cur.fetchone()[0] == 150
+        assert_records(conn, cat_stream.records, 'cats', 'id', match_pks=True)
+        assert_records(conn, dog_stream.records, 'dogs', 'id', match_pks=True)
+
+
+@pytest.mark.parametrize('staging_table_mode', postgres.STAGING_TABLE_MODES)
+def test_loading__staging_table_mode(db_cleanup, staging_table_mode):
+    config = CONFIG.copy()
+    config['max_batch_rows'] = 20
+    config['batch_detection_threshold'] = 5
+
+    stream = CatStream(100, nested_count=2)
+
+    with psycopg2.connect(cursor_factory=QueryRecordingCursor, **TEST_DB) as conn:
+        target = postgres.PostgresTarget(conn, staging_table_mode=staging_table_mode)
+        QueryRecordingCursor.queries = []
+        target_tools.stream_to_target(stream, target, config=config)
+
+    staging_tables = set(re.findall(r'"(tmp_[^"]+)"', ' '.join(q for q in QueryRecordingCursor.queries if 'COPY' in q)))
+    creates = [q for q in QueryRecordingCursor.queries if 'tmp_' in q and 'CREATE' in q]
+
+    if staging_table_mode == postgres.STAGING_TABLE_MODE_TEMPORARY:
+        ## One staging table per table, reused by all 5 batches
+        assert len(staging_tables) == 2
+        assert all('CREATE TEMPORARY TABLE' in q for q in creates)
+    else:
+        assert len(staging_tables) == 10
+        assert all(('CREATE UNLOGGED TABLE' in q) == (staging_table_mode == postgres.STAGING_TABLE_MODE_UNLOGGED)
+                   for q in creates)
+
+    with psycopg2.connect(**TEST_DB) as conn:
+        with conn.cursor() as cur:
+            cur.execute(get_count_sql('cats'))
+            assert cur.fetchone()[0] == 100
+            cur.execute(get_count_sql('cats__adoption__immunizations'))
+            assert cur.fetchone()[0] == 200
+
+            ## `temporary` staging tables only last as long as the session which made them
+            cur.execute("SELECT COUNT(*) FROM pg_class WHERE relname LIKE 'tmp\\_%' AND relpersistence != 't'")
+            assert cur.fetchone()[0] == 0
+        assert_records(conn, stream.records, 'cats', 'id')
+
+
+def test_loading__staging_table_mode__temporary__schema_changes(db_cleanup):
+    config = CONFIG.copy()
+    config['max_batch_rows'] = 2
+    config['batch_detection_threshold'] = 1
+
+    ## The reused staging table must pick up both the new column, and `size` becoming nullable
+    class WidgetStream(ListStream):
+        stream = [schema_message('widgets',
+                                 {'id': {'type': 'integer'},
+                                  'size': {'type': 'integer'}},
+                                 ['id'])] \
+                 + [record_message('widgets', {'id': i, 'size': i}) for i in range(4)] \
+                 + [schema_message('widgets',
+                                   {'id': {'type': 'integer'},
+                                    'size': {'type': ['null', 'integer']},
+                                    'colour': {'type': ['null', 'string']}},
+                                   ['id'])] \
+                 + [record_message('widgets', {'id': i, 'size': None, 'colour': 'red'}) for i in range(4, 8)]
+
+    with psycopg2.connect(**TEST_DB) as conn:
+        target = postgres.PostgresTarget(conn, staging_table_mode=postgres.STAGING_TABLE_MODE_TEMPORARY)
+        target_tools.stream_to_target(WidgetStream(), target, config=config)
+
+    with psycopg2.connect(**TEST_DB) as conn:
+        with conn.cursor() as cur:
+            cur.execute('SELECT id, size, colour FROM widgets ORDER BY id')
+            assert cur.fetchall() == [(0, 0, None), (1, 1, None), (2, 2, None), (3, 3, None),
+                                      (4, None, 'red'), (5, None, 'red'), (6, None, 'red'), (7, None, 'red')]
+
+
+@pytest.mark.parametrize('staging_table_mode', [postgres.STAGING_TABLE_MODE_UNLOGGED,
+                                                postgres.STAGING_TABLE_MODE_TEMPORARY])
+def test_loading__staging_table_mode__old_server(db_cleanup, staging_table_mode):
+    class OldServerConnection(psycopg2.extensions.connection):
+        server_version = 90024
+
+    with psycopg2.connect(connection_factory=OldServerConnection, **TEST_DB) as conn:
+        postgres.PostgresTarget(conn, staging_table_mode=postgres.STAGING_TABLE_MODE_TABLE)
+
+        with pytest.raises(postgres.PostgresError, match=r'.*staging_table_mode.*9\.1.*'):
+            postgres.PostgresTarget(conn, staging_table_mode=staging_table_mode)
+
+
+def test_loading__invalid__staging_table_mode(db_cleanup):
+    config = CONFIG.copy()
+    config['staging_table_mode'] = 'in-memory'
+
+    with pytest.raises(postgres.PostgresError, match=r'.*staging_table_mode.*'):
+        main(config, input_stream=CatStream(1))
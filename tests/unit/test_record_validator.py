@@ -0,0 +1,164 @@
+from copy import deepcopy
+from decimal import Decimal
+import json
+
+from jsonschema import Draft4Validator, FormatChecker
+from jsonschema.exceptions import ValidationError
+import pytest
+
+from target_postgres import record_validator
+from target_postgres.record_validator import RecordValidator, get_validator
+
+from utils.fixtures import CatStream, InvalidCatStream, MultiTypeStream, NestedStream, TypeChangeStream
+
+
+def assert_same_results(schema, instances):
+    validator = RecordValidator(schema)
+    draft4_validator = Draft4Validator(deepcopy(schema), format_checker=FormatChecker())
+
+    for instance in instances:
+        expected = draft4_validator.is_valid(instance)
+        assert validator.is_valid(instance) == expected, instance
+
+        if expected:
+            validator.validate(instance)
+        else:
+            with pytest.raises(ValidationError) as error:
+                validator.validate(instance)
+            assert error.value.message == next(draft4_validator.iter_errors(instance)).message
+
+
+def records(stream):
+    return [json.loads(line)['record']
+            for line in stream
+            if json.loads(line)['type'] == 'RECORD']
+
+
+@pytest.mark.parametrize('stream', [CatStream(100, nested_count=2),
+                                    InvalidCatStream(100),
+                                    MultiTypeStream(100),
+                                    NestedStream(100),
+                                    TypeChangeStream(100, 0)])
+def test_fixtures(stream):
+    schema = json.loads(next(stream))['schema']
+
+    assert_same_results(schema, records(stream))
+
+
+def test_type():
+    assert_same_results({'type': 'integer'},
+                        [1, 1.0, Decimal('1'), True, None, '1'])
+    assert_same_results({'type': ['number', 'null']},
+                        [1, 1.5, Decimal('1.5'), True, False, None, '1.5'])
+    assert_same_results({'type': ['boolean', 'string']},
+                        [True, False, 0, 'true', None])
+    assert_same_results({'type': ['object', 'array']},
+                        [{}, [], '', None])
+
+
+def test_type__unknown():
+    validator = RecordValidator({'type': 'not-a-type'})
+
+    with pytest.raises(Exception):
+        validator.validate(1)
+
+
+def test_object_keywords():
+    schema = {'type': 'object',
+              'properties': {'a': {'type': 'integer'},
+                             'b': {'type': 'object',
+                                   'properties': {'c': {'type': 'string'}},
+                                   'additionalProperties': False}},
+              'required': ['a'],
+              'minProperties': 1,
+              'maxProperties': 2,
+              'additionalProperties': {'type': 'string'}}
+
+    assert_same_results(schema,
+                        [{'a': 1},
+                         {'b': {}},
+                         {'a': 'one'},
+                         {'a': 1, 'b': {'c': 'c'}},
+                         {'a': 1, 'b': {'c': 'c', 'd': 'd'}},
+                         {'a': 1, 'e': 'e'},
+                         {'a': 1, 'e': 5},
+                         {'a': 1, 'b': {}, 'e': 'e'},
+                         {}])
+
+
+def test_array_keywords():
+    assert_same_results({'items': {'type': 'integer'}, 'minItems': 1, 'maxItems': 2},
+                        [[], [1], [1, 2], [1, 2, 3], [1, 'two'], 'not an array'])
+    assert_same_results({'items': [{'type': 'integer'}, {'type': 'string'}]},
+                        [[], [1], [1, 'two'], ['one', 'two'], [1, 'two', 3]])
+
+
+def test_string_keywords():
+    assert_same_results({'type': 'string', 'minLength': 2, 'maxLength': 4, 'pattern': '^a'},
+                        ['a', 'ab', 'abcd', 'abcde', 'ba', 5])
+    assert_same_results({'format': 'date-time'},
+                        ['2020-01-01T00:00:00Z', 'not a date-time', 5])
+    assert_same_results({'format': 'ipv4'},
+                        ['127.0.0.1', 'not an ip', 5])
+
+
+def test_number_keywords():
+    numbers = [0, 1, 5, 10, 11, 1.5, Decimal('1.5'), Decimal('10'), True, 'ten']
+
+    assert_same_results({'minimum': 1, 'maximum': 10}, numbers)
+    assert_same_results({'minimum': 1, 'exclusiveMinimum': True,
+                         'maximum': 10, 'exclusiveMaximum': True}, numbers)
+    assert_same_results({'multipleOf': 5}, numbers)
+    assert_same_results({'multipleOf': Decimal('0.5')}, [1, Decimal('1.5'), Decimal('1.25'), 'one'])
+    assert_same_results({'multipleOf': 0.5}, [1, 1.5, 1.25, 'one'])
+
+
+def test_combinations():
+    assert_same_results({'anyOf': [{'type': 'integer'}, {'type': 'string', 'maxLength': 2}]},
+                        [1, 'ab', 'abc', None])
+    assert_same_results({'allOf': [{'type': 'string'}, {'maxLength': 2}]},
+                        ['ab', 'abc', 1])
+    assert_same_results({'enum': [1, 'one', None]},
+                        [1, 'one', None, True, 2])
+
+
+def test_uncompiled_keywords():
+    assert_same_results({'oneOf': [{'type': 'integer'}, {'minimum': 1}]},
+                        [0, 1, 1.5, 'one'])
+    assert_same_results({'not': {'type': 'integer'}},
+                        [1, 'one'])
+    assert_same_results({'type': 'object',
+                         'patternProperties': {'^a': {'type': 'integer'}},
+                         'additionalProperties': False},
+                        [{'a': 1}, {'a': 'one'}, {'b': 1}])
+    assert_same_results({'definitions': {'positive': {'type': 'integer', 'minimum': 1}},
+                         'properties': {'a': {'$ref': '#/definitions/positive'}}},
+                        [{'a': 1}, {'a': 0}, {'a': 'one'}])
+    assert_same_results({'uniqueItems': True},
+                        [[1, 2], [1, 1]])
+
+
+def test_get_validator__cached_by_schema():
+    schema = {'type': 'object', 'properties': {'a': {'type': 'integer'}}}
+
+    validator = get_validator(schema)
+
+    assert get_validator(deepcopy(schema)) is validator
+    assert get_validator({'type': 'object', 'properties': {'a': {'type': 'string'}}}) is not validator
+
+
+def test_get_validator__unaffected_by_later_schema_changes():
+    schema = {'type': 'object', 'properties': {'a': {'type': 'integer'}}}
+
+    validator = get_validator(schema)
+    schema['properties']['a']['type'] = 'string'
+
+    validator.validate({'a': 1})
+    assert get_validator(schema) is not validator
+
+
+def test_get_validator__cache_is_bounded():
+    for i in range(record_validator.VALIDATOR_CACHE_SIZE + 10):
+        get_validator({'type': 'object', 'properties': {'a': {'maximum': i}}})
+
+    assert len(record_validator._validator_cache) == record_validator.VALIDATOR_CACHE_SIZE
@@ -1,5 +1,7 @@
 from copy import deepcopy
 import json
+import threading
+import time
 
 from unittest.mock import patch
 import pytest
@@ -8,7 +10,7 @@ from target_postgres import singer_stream
 from target_postgres import target_tools
 from target_postgres.sql_base import SQLInterface
 
-from utils.fixtures import CONFIG, CatStream, ListStream, InvalidCatStream, DogStream
+from utils.fixtures import CONFIG, CATS_SCHEMA, CatStream, ListStream, InvalidCatStream, DogStream
 
 
 class Target(SQLInterface):
@@ -18,7 +20,8 @@ class Target(SQLInterface):
         self.calls = {'write_batch': [], 'activate_version': []}
 
     def write_batch(self, stream_buffer):
-        self.calls['write_batch'].append({'records_count': len(stream_buffer.peek_buffer())})
+        self.calls['write_batch'].append({'stream': stream_buffer.stream,
+                                          'records_count': len(stream_buffer.peek_buffer())})
         return None
 
     def activate_version(self, stream_buffer, version):
@@ -351,3 +354,288 @@ def test_state__doesnt_emit_when_it_isnt_different_than_the_previous_emission(ca
 
     output = filtered_output(capsys)
     assert len(output) == 0
+
+
+def test_pipelined_flush__persists_all_records_and_emits_final_state(capsys):
+    config = CONFIG.copy()
+    config['max_batch_rows'] = 20
+    config['batch_detection_threshold'] = 1
+    config['pipelined_flush'] = True
+    config['max_pending_batches'] = 2
+
+    rows = list(CatStream(100))
+    rows.append(json.dumps({'type': 'STATE', 'value': {'test': 'state-1'}}))
+    target = Target()
+
+    target_tools.stream_to_target(rows, target, config=config)
+
+    rows_persisted = 0
+    for call in target.calls['write_batch']:
+        rows_persisted += call['records_count']
+
+    assert rows_persisted == 100
+
+    output = filtered_output(capsys)
+    assert len(output) == 1
+    assert json.loads(output[0])['test'] == 'state-1'
+
+
+def test_pipelined_flush__state_waits_for_pending_batches(capsys):
+    config = CONFIG.copy()
+    config['max_batch_rows'] = 20
+    config['batch_detection_threshold'] = 1
+    config['pipelined_flush'] = True
+    rows = list(CatStream(100))
+
+    class SlowTarget(Target):
+        def __init__(self):
+            super(SlowTarget, self).__init__()
+            self.writing = threading.Event()
+            self.release = threading.Event()
+
+        def write_batch(self, stream_buffer):
+            self.writing.set()
+            self.release.wait()
+            return super(SlowTarget, self).write_batch(stream_buffer)
+
+    target = SlowTarget()
+
+    def test_stream():
+        for row in rows[slice(0, 10)]:
+            yield row
+        yield json.dumps({'type': 'STATE', 'value': {'test': 'state-1'}})
+        for row in rows[slice(10, 21)]:
+            yield row
+
+        # The first batch has been handed off but is not yet written, so its STATE must not be emitted
+        assert target.writing.wait(10)
+        yield json.dumps({'type': 'STATE', 'value': {'test': 'state-2'}})
+        assert filtered_output(capsys) == []
+
+        target.release.set()
+
+    target_tools.stream_to_target(test_stream(), target, config=config)
+
+    output = filtered_output(capsys)
+    assert len(output) == 1
+    assert json.loads(output[0])['test'] == 'state-2'
+
+
+def test_pipelined_flush__write_batch_errors_are_raised():
+    config = CONFIG.copy()
+    config['max_batch_rows'] = 20
+    config['batch_detection_threshold'] = 1
+    config['pipelined_flush'] = True
+
+    class FailingTarget(Target):
+        def write_batch(self, stream_buffer):
+            raise Exception('write_batch failed')
+
+    with pytest.raises(Exception, match=r'write_batch failed'):
+        target_tools.stream_to_target(CatStream(100), FailingTarget(), config=config)
+
+
+def test_writer_targets__streams_are_spread_over_writers(capsys):
+    config = CONFIG.copy()
+    config['max_batch_rows'] = 20
+    config['batch_detection_threshold'] = 1
+    cat_rows = list(CatStream(100))
+    dog_rows = list(DogStream(50))
+    writer_targets = [Target(), Target()]
+
+    rows = [row
+            for rows in zip(cat_rows, dog_rows)
+            for row in rows]
+    rows.append(json.dumps({'type': 'STATE', 'value': {'test': 'state-1'}}))
+
+    target_tools.stream_to_target(rows, writer_targets[0], config=config, writer_targets=writer_targets)
+
+    ## `cats` is registered first, and so is written through the first writer
+    cat_rows_persisted = sum([call['records_count'] for call in writer_targets[0].calls['write_batch']])
+    dog_rows_persisted = sum([call['records_count'] for call in writer_targets[1].calls['write_batch']])
+
+    assert cat_rows_persisted == 50
+    assert dog_rows_persisted == 50
+
+    output = filtered_output(capsys)
+    assert len(output) == 1
+    assert json.loads(output[0])['test'] == 'state-1'
+
+
+def test_max_buffer_memory__flushes_largest_buffers_first(capsys):
+    ## Cats are all alike, so that the memory estimated from the first one holds for all of them
+    cat_stream = CatStream(60)
+    cat_row = json.dumps(cat_stream.generate_record_message())
+    cat_rows = [json.dumps(CATS_SCHEMA)] + [cat_row] * 60
+    dog_rows = list(DogStream(2))
+
+    config = CONFIG.copy()
+    config['max_buffer_memory'] = 20 * singer_stream.get_memory_size(json.loads(cat_row))
+    target = Target()
+
+    ## A single dog is buffered while the cats' buffer grows past the limit, repeatedly
+    rows = [cat_rows[0], dog_rows[0], dog_rows[1]] + cat_rows[1:]
+
+    target_tools.stream_to_target(rows, target, config=config)
+
+    calls = target.calls['write_batch']
+    assert 3 < len(calls)
+    assert all(call['stream'] == 'cats' and 0 < call['records_count'] <= 20 for call in calls[:-2])
+    assert 60 == sum(call['records_count'] for call in calls if call['stream'] == 'cats')
+    assert [1] == [call['records_count'] for call in calls if call['stream'] == 'dogs']
+
+
+def test_loading__invalid__records__validation_mode():
+    config = CONFIG.copy()
+    config['validation_mode'] = 'none'
+    config['stream_validation_modes'] = {'dogs': 'full'}
+
+    target = Target()
+
+    target_tools.stream_to_target(InvalidCatStream(100), target, config=config)
+
+    ## Nothing was validated, so every record is persisted
+    assert sum([call['records_count'] for call in target.calls['write_batch']]) == 100
+
+    class InvalidDogStream(InvalidCatStream):
+        stream = 'dogs'
+        schema = DogStream.schema
+
+    with pytest.raises(singer_stream.SingerStreamError, match=r'.*'):
+        target_tools.stream_to_target(InvalidDogStream(100), Target(), config=config)
+
+
+def test_loading__resent_schema_is_not_validated_again():
+    cat_stream = CatStream(30)
+    changed_schema = deepcopy(CATS_SCHEMA)
+    changed_schema['schema']['properties']['name']['maxLength'] = 100
+
+    lines = []
+    for schema in [CATS_SCHEMA, CATS_SCHEMA, changed_schema]:
+        lines.append(json.dumps(schema))
+        lines.extend(json.dumps(cat_stream.generate_record_message()) for _ in range(10))
+
+    target = Target()
+
+    with patch.object(target_tools.json_schema,
+                      'validation_errors',
+                      wraps=target_tools.json_schema.validation_errors) as mock:
+        target_tools.stream_to_target(lines, target, config=CONFIG)
+
+        ## Only the first, and the changed, SCHEMA messages were validated
+        assert mock.call_count == 2
+
+    assert sum([call['records_count'] for call in target.calls['write_batch']]) == 30
+
+
+def test_state__many_streams_flush_only_full_buffers(capsys):
+    config = CONFIG.copy()
+    config['max_batch_rows'] = 5
+    config['batch_detection_threshold'] = 1
+    cat_stream = CatStream(250)
+    streams = ['cats_{}'.format(i) for i in range(50)]
+    target = Target()
+
+    def record(stream):
+        return json.dumps(dict(cat_stream.generate_record_message(), stream=stream))
+
+    def test_stream():
+        for stream in streams:
+            yield json.dumps(dict(CATS_SCHEMA, stream=stream))
+        for stream in streams:
+            yield record(stream)
+        yield json.dumps({'type': 'STATE', 'value': {'test': 'state-1'}})
+
+        for stream in streams[:-1]:
+            for _ in range(4):
+                yield record(stream)
+        yield json.dumps({'type': 'STATE', 'value': {'test': 'state-2'}})
+
+        ## Every stream but the last has been flushed, which holds back all states
+        assert [5] * 49 == [call['records_count'] for call in target.calls['write_batch']]
+        assert [] == filtered_output(capsys)
+
+        for _ in range(4):
+            yield record(streams[-1])
+
+        assert 50 == len(target.calls['write_batch'])
+        assert ['state-1'] == [json.loads(line)['test'] for line in filtered_output(capsys)]
+
+    target_tools.stream_to_target(test_stream(), target, config=config)
+
+    assert 250 == sum(call['records_count'] for call in target.calls['write_batch'])
+    assert ['state-2'] == [json.loads(line)['test'] for line in filtered_output(capsys)]
+
+
+def test_max_batch_age__flushes_while_no_lines_arrive(capsys):
+    config = CONFIG.copy()
+    config['max_batch_age'] = 0.1
+    cat_rows = list(CatStream(100))
+    target = Target()
+
+    def test_stream():
+        for row in cat_rows[:6]:
+            yield row
+        yield json.dumps({'type': 'STATE', 'value': {'test': 'state-1'}})
+
+        ## The tap goes quiet well past `max_batch_age`, with the buffer far from full
+        time.sleep(0.5)
+
+        assert [5] == [call['records_count'] for call in target.calls['write_batch']]
+        assert ['state-1'] == [json.loads(line)['test'] for line in filtered_output(capsys)]
+
+        for row in cat_rows[6:]:
+            yield row
+
+    target_tools.stream_to_target(test_stream(), target, config=config)
+
+    assert 100 == sum(call['records_count'] for call in target.calls['write_batch'])
+
+
+def test_max_batch_age__restarts_when_a_new_version_empties_the_buffer():
+    config = CONFIG.copy()
+    config['max_batch_age'] = 0.4
+    cat_stream = CatStream(10, version=1)
+    target = Target()
+
+    def test_stream():
+        yield json.dumps(CATS_SCHEMA)
+        yield json.dumps(cat_stream.generate_record_message())
+        time.sleep(0.35)
+
+        ## A new table version drops the buffered records of the old one, and the age of the buffer with them
+        cat_stream.version = 2
+        yield json.dumps(cat_stream.generate_record_message())
+        time.sleep(0.25)
+
+        assert [] == target.calls['write_batch']
+
+        time.sleep(0.3)
+
+        assert [1] == [call['records_count'] for call in target.calls['write_batch']]
+
+    target_tools.stream_to_target(test_stream(), target, config=config)
+
+
+@pytest.mark.parametrize('pipelined_flush', [False, True])
+def test_adaptive_batch_duration__sizes_batches_to_write_duration(pipelined_flush):
+    config = CONFIG.copy()
+    config['max_batch_rows'] = 400
+    config['batch_detection_threshold'] = 1
+    config['pipelined_flush'] = pipelined_flush
+    config['adaptive_batch_duration'] = 0.05
+
+    class SlowTarget(Target):
+        ## Writes 2000 rows a second, so 100 rows take `adaptive_batch_duration`
+        def write_batch(self, stream_buffer):
+            time.sleep(len(stream_buffer.peek_buffer()) / 2000)
+            return super(SlowTarget, self).write_batch(stream_buffer)
+
+    target = SlowTarget()
+
+    target_tools.stream_to_target(CatStream(700), target, config=config)
+
+    calls = [call['records_count'] for call in target.calls['write_batch']]
+    assert 400 == calls[0]
+    assert all(50 <= records_count <= 110 for records_count in calls[1:-1])
+    assert 700 == sum(calls)